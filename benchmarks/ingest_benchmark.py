@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Ingest Pipeline Benchmark
+
+Generates a synthetic Beckhoff-style corpus (benchmarks/synthetic_corpus.py) at
+a configurable size relative to docs/ (up to 10x and beyond) and runs every
+ingest stage on it, offline:
+
+    convert      convert_pdfs.py on the synthetic PDFs (read from disk, no download)
+    frontmatter  add_frontmatter.py on the synthetic Markdown
+    chunking     scripts/chunking.py (chunk_documents)
+    embeddings   scripts/generate_embeddings.py (model from the local cache)
+
+For each stage it reports wall time, throughput (documents, pages, MB and chunks
+per second) and peak RSS. Each stage runs in a fresh process, so peak memory is
+not shared between stages; the peak of the stage's own worker processes
+(--processes, --workers, generate_embeddings.py) is reported separately.
+
+PDF text extraction is by far the slowest stage, so the PDF corpus has its own
+size (--pdf-scale, default 0.05); its pages/s extrapolate to the full corpus.
+The generated corpus is kept in --work-dir and reused by later runs with the
+same sizes and seed.
+
+Usage:
+    python benchmarks/ingest_benchmark.py --scale 1
+    python benchmarks/ingest_benchmark.py --scale 10 --stages frontmatter chunking
+    python benchmarks/ingest_benchmark.py --scale 1 --embeddings-args --stream --ivf
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import traceback
+import subprocess
+import multiprocessing
+from pathlib import Path
+from datetime import datetime
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+from typing import Dict, List, Optional
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+SCRIPTS_DIR = ROOT_DIR / 'scripts'
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+from synthetic_corpus import REFERENCE_PAGES, write_corpus  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORK_DIR = Path(__file__).resolve().parent / 'work'
+DEFAULT_RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+STAGES = ['convert', 'frontmatter', 'chunking', 'embeddings']
+
+# generate_embeddings.MODEL_NAME (not imported: it would load torch into the measured process)
+EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+# The embeddings stage must not touch the Hugging Face Hub (downloads or update checks)
+OFFLINE_ENV = {'HF_HUB_OFFLINE': '1', 'TRANSFORMERS_OFFLINE': '1'}
+
+
+def peak_rss_mb(children: bool = False) -> Optional[float]:
+    """Peak resident set size of the current process, or of its largest finished child (None where unavailable)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def directory_mb(directory: Path, pattern: str) -> float:
+    return sum(path.stat().st_size for path in directory.glob(pattern)) / 1e6
+
+
+def run_convert(corpus: Dict, work_dir: str, options: Dict) -> Dict:
+    """convert_pdfs.py on the local PDFs: the real conversion path, with the download replaced by a path lookup"""
+    from convert_pdfs import PDFToMarkdownConverter
+
+    class LocalPDFConverter(PDFToMarkdownConverter):
+        def download_pdf(self, url: str, timeout: int = 30) -> Optional[str]:
+            return url2pathname(urlparse(url).path)
+
+        def remove_temp_file(self, temp_file_path: Optional[str]):
+            pass  # the synthetic PDFs are kept for the next runs
+
+    pdf_dir = Path(work_dir) / 'pdf'
+    output_dir = Path(work_dir) / 'converted'
+    shutil.rmtree(output_dir, ignore_errors=True)
+    logging.getLogger('convert_pdfs').setLevel(logging.WARNING)
+
+    converter = LocalPDFConverter(index_file=str(pdf_dir / 'index.txt'), output_dir=str(output_dir),
+                                  max_workers=options['threads'], force_reconvert=True,
+                                  processes=options['processes'], pages_per_task=options['pages_per_task'])
+    converter.run()
+    return {
+        'documents': len(converter.successful_conversions),
+        'failed': len(converter.failed_conversions),
+        'pages': corpus['pdf']['pages'],
+        'input_mb': corpus['pdf']['bytes'] / 1e6,
+        'output_mb': directory_mb(output_dir, '*_EN.md'),
+    }
+
+
+def run_frontmatter(corpus: Dict, work_dir: str, options: Dict) -> Dict:
+    """add_frontmatter.py on a fresh copy of the Markdown corpus (it rewrites files in place)"""
+    import add_frontmatter
+    add_frontmatter.logger.setLevel(logging.WARNING)
+
+    docs_dir = Path(work_dir) / 'docs'
+    files = sorted(docs_dir.glob('*.md'))
+    input_mb = directory_mb(docs_dir, '*.md')
+    done = sum(1 for filepath in files if add_frontmatter.add_frontmatter_to_file(filepath))
+    return {
+        'documents': done,
+        'failed': len(files) - done,
+        'pages': corpus['markdown']['pages'],
+        'input_mb': input_mb,
+        'output_mb': directory_mb(docs_dir, '*.md'),
+    }
+
+
+def run_chunking(corpus: Dict, work_dir: str, options: Dict) -> Dict:
+    """chunk_documents on the Markdown corpus (with frontmatter)"""
+    from chunking import chunk_documents
+
+    files = sorted((Path(work_dir) / 'docs').glob('*.md'))
+    documents = chunks = chunk_chars = 0
+    for _, document_chunks in chunk_documents(files, workers=options['workers'], structure=options['structure']):
+        documents += 1
+        chunks += len(document_chunks)
+        chunk_chars += sum(len(chunk['text']) for chunk in document_chunks)
+    return {
+        'documents': documents,
+        'pages': corpus['markdown']['pages'],
+        'input_mb': sum(path.stat().st_size for path in files) / 1e6,
+        'chunks': chunks,
+        'chunk_mb': chunk_chars / 1e6,
+    }
+
+
+def check_model_cached(model_name: str):
+    """Fail before the stage starts if the model is not in the local Hugging Face cache"""
+    try:
+        from huggingface_hub import try_to_load_from_cache
+    except ImportError:
+        return  # no hub client to ask: generate_embeddings.py reports a missing model itself
+    if not isinstance(try_to_load_from_cache(model_name, 'config.json'), str):
+        raise RuntimeError(f"{model_name} is not in the local Hugging Face cache; the embeddings stage runs "
+                           f"offline. Run generate_embeddings.py once with network access to download it.")
+
+
+def run_embeddings(corpus: Dict, work_dir: str, options: Dict) -> Dict:
+    """
+    generate_embeddings.py as a subprocess, offline and without the embedding
+    cache so every chunk is encoded
+    """
+    if '--onnx-model' not in options['embeddings_args']:
+        check_model_cached(EMBEDDING_MODEL)
+    docs_dir = Path(work_dir) / 'docs'
+    output_dir = Path(work_dir) / 'embeddings'
+    shutil.rmtree(output_dir, ignore_errors=True)
+    command = [sys.executable, str(SCRIPTS_DIR / 'generate_embeddings.py'), '--docs', str(docs_dir),
+               '--output', str(output_dir), '--no-embedding-cache', '--workers', str(options['workers']),
+               *options['embeddings_args']]
+    completed = subprocess.run(command, cwd=work_dir, env={**os.environ, **OFFLINE_ENV},
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    # generate_embeddings.py exits with 0 when the model cannot be loaded: check its output too
+    errors = [line for line in completed.stdout.splitlines() if line.startswith('[ERROR]')]
+    if completed.returncode != 0 or errors or not (output_dir / 'metadata.json').exists():
+        details = '\n'.join(errors + [completed.stderr[-2000:]])
+        raise RuntimeError(f"generate_embeddings.py failed ({completed.returncode}):\n{details}")
+    with open(output_dir / 'metadata.json', 'r', encoding='utf-8') as f:
+        metadata = json.load(f)
+    return {
+        'documents': corpus['markdown']['documents'],
+        'pages': corpus['markdown']['pages'],
+        'input_mb': directory_mb(docs_dir, '*.md'),
+        'chunks': metadata.get('num_chunks'),
+        'output_mb': sum(path.stat().st_size for path in output_dir.rglob('*') if path.is_file()) / 1e6,
+        'model': metadata.get('model'),
+    }
+
+
+STAGE_RUNNERS = {
+    'convert': run_convert,
+    'frontmatter': run_frontmatter,
+    'chunking': run_chunking,
+    'embeddings': run_embeddings,
+}
+
+
+def run_stage(name: str, corpus: Dict, work_dir: str, options: Dict) -> Dict:
+    """Run and measure one stage (in its own process)"""
+    start = time.perf_counter()
+    result = STAGE_RUNNERS[name](corpus, work_dir, options)
+    seconds = time.perf_counter() - start
+
+    result['seconds'] = seconds
+    for key in ('documents', 'pages', 'chunks'):
+        if result.get(key):
+            result[f'{key}_per_s'] = result[key] / seconds
+    result['mb_per_s'] = result['input_mb'] / seconds
+    result['peak_rss_mb'] = peak_rss_mb()
+    result['children_peak_rss_mb'] = peak_rss_mb(children=True)
+    return result
+
+
+def stage_process(name: str, corpus: Dict, work_dir: str, options: Dict, connection) -> None:
+    """Process entry point: send ('ok', result) or ('error', traceback) to the parent"""
+    try:
+        connection.send(('ok', run_stage(name, corpus, work_dir, options)))
+    except Exception:
+        connection.send(('error', traceback.format_exc()))
+    finally:
+        connection.close()
+
+
+def run_stage_process(context, name: str, corpus: Dict, work_dir: str, options: Dict) -> Dict:
+    """
+    Run one stage in a fresh process. Not a Pool worker: pool workers are
+    daemonic and cannot start the stage's own worker processes.
+    """
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=stage_process, args=(name, corpus, work_dir, options, sender))
+    process.start()
+    sender.close()
+    try:
+        status, payload = receiver.recv()
+    except EOFError:
+        status, payload = 'error', 'no result'
+    finally:
+        receiver.close()
+        process.join()
+    if status != 'ok':
+        raise RuntimeError(f"Stage {name} failed (exit code {process.exitcode}):\n{payload}")
+    return payload
+
+
+def prepare_corpus(work_dir: Path, scale: float, pdf_scale: float, seed: int, stages: List[str]) -> Dict:
+    """Generate the synthetic corpus, or reuse the one in work_dir if it has the same sizes and seed"""
+    manifest_path = work_dir / 'corpus.json'
+    corpus = {}
+    if manifest_path.exists():
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            corpus = json.load(f)
+
+    wanted = {'markdown': scale}
+    if 'convert' in stages:
+        wanted['pdf'] = pdf_scale
+    for fmt, fmt_scale in wanted.items():
+        stats = corpus.get(fmt)
+        if stats and stats['scale'] == fmt_scale and stats['seed'] == seed:
+            logger.info(f"Reusing {fmt} corpus: {stats['documents']} documents, {stats['pages']} pages")
+            continue
+        shutil.rmtree(work_dir / fmt, ignore_errors=True)
+        logger.info(f"Generating {fmt} corpus at scale {fmt_scale}")
+        corpus[fmt] = write_corpus(work_dir / fmt, fmt, fmt_scale, seed)
+        logger.info(f"{corpus[fmt]['documents']} documents, {corpus[fmt]['pages']} pages, "
+                    f"{corpus[fmt]['bytes'] / 1e6:.1f} MB in {corpus[fmt]['seconds']:.1f}s")
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(corpus, f, indent=2)
+    return corpus
+
+
+def reset_docs(work_dir: Path, frontmatter: bool = False):
+    """
+    Fresh copy of the generated Markdown in work_dir/docs, before add_frontmatter.py
+    rewrites it. With frontmatter=True, the frontmatter is added here (not timed).
+    """
+    shutil.rmtree(work_dir / 'docs', ignore_errors=True)
+    shutil.copytree(work_dir / 'markdown', work_dir / 'docs')
+    if frontmatter:
+        import add_frontmatter
+        add_frontmatter.logger.setLevel(logging.WARNING)
+        for filepath in sorted((work_dir / 'docs').glob('*.md')):
+            add_frontmatter.add_frontmatter_to_file(filepath)
+
+
+def print_summary(results: Dict):
+    print(f"\n{'stage':<12} {'seconds':>9} {'docs/s':>8} {'pages/s':>9} {'MB/s':>8} {'chunks/s':>9} "
+          f"{'RSS MB':>7} {'workers MB':>11}")
+    for name, r in results['stages'].items():
+        def value(key: str, digits: int = 0) -> str:
+            return f"{r[key]:.{digits}f}" if r.get(key) is not None else '-'
+        print(f"{name:<12} {r['seconds']:>9.1f} {value('documents_per_s', 1):>8} {value('pages_per_s'):>9} "
+              f"{value('mb_per_s', 2):>8} {value('chunks_per_s'):>9} {value('peak_rss_mb'):>7} "
+              f"{value('children_peak_rss_mb'):>11}")
+    convert = results['stages'].get('convert')
+    if convert and convert.get('pages_per_s'):
+        pages = results['corpus']['markdown']['pages']
+        print(f"\nconvert extrapolated to the {pages}-page corpus: {pages / convert['pages_per_s'] / 60:.0f} min")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the ingest pipeline on a synthetic corpus')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help=f'Markdown corpus size relative to docs/ (1 = {REFERENCE_PAGES} pages, default: 1)')
+    parser.add_argument('--pdf-scale', type=float, default=0.05,
+                        help='PDF corpus size for the convert stage, relative to docs/ (default: 0.05)')
+    parser.add_argument('--seed', type=int, default=0, help='Corpus random seed (default: 0)')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES,
+                        help='Stages to run, in pipeline order (default: all)')
+    parser.add_argument('--work-dir', type=str, default=str(DEFAULT_WORK_DIR),
+                        help='Directory for the generated corpus and stage outputs (default: benchmarks/work)')
+    parser.add_argument('--threads', type=int, default=1, help='convert_pdfs.py --workers (default: 1)')
+    parser.add_argument('--processes', type=int, default=0, help='convert_pdfs.py --processes (default: 0)')
+    parser.add_argument('--pages-per-task', type=int, default=50,
+                        help='convert_pdfs.py --pages-per-task (default: 50)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Chunking processes for chunking and generate_embeddings.py (default: 0 = one per core)')
+    parser.add_argument('--structure', action='store_true', help='Structure-aware chunking (--structure)')
+    parser.add_argument('--embeddings-args', nargs=argparse.REMAINDER, default=[],
+                        help='Extra generate_embeddings.py arguments (must come last)')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Result file (default: benchmarks/results/ingest-<timestamp>.json)')
+    args = parser.parse_args()
+    if args.scale <= 0 or args.pdf_scale <= 0:
+        parser.error('--scale and --pdf-scale must be positive')
+
+    stages = [name for name in STAGES if name in args.stages]
+    if args.structure:
+        args.embeddings_args = ['--structure', *args.embeddings_args]
+    options = {
+        'threads': args.threads,
+        'processes': args.processes,
+        'pages_per_task': args.pages_per_task,
+        'workers': args.workers,
+        'structure': args.structure,
+        'embeddings_args': args.embeddings_args,
+    }
+
+    work_dir = Path(args.work_dir).resolve()
+    work_dir.mkdir(parents=True, exist_ok=True)
+    corpus = prepare_corpus(work_dir, args.scale, args.pdf_scale, args.seed, stages)
+
+    results = {
+        'generated_at': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'corpus': corpus,
+        'options': options,
+        'stages': {},
+    }
+
+    if 'frontmatter' not in stages and {'chunking', 'embeddings'} & set(stages):
+        logger.info("Preparing the Markdown corpus with frontmatter (not timed)")
+        reset_docs(work_dir, frontmatter=True)
+
+    # One fresh process per stage: peak RSS is measured in isolation
+    context = multiprocessing.get_context('spawn')
+    for name in stages:
+        if name == 'frontmatter':
+            reset_docs(work_dir)
+        logger.info(f"Running stage {name}")
+        results['stages'][name] = run_stage_process(context, name, corpus, str(work_dir), options)
+        logger.info(f"{name}: {results['stages'][name]['seconds']:.1f}s")
+
+    output = Path(args.output) if args.output else \
+        DEFAULT_RESULTS_DIR / f"ingest-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    print_summary(results)
+    logger.info(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Search Benchmark
+
+Runs a fixed query workload (benchmarks/queries.txt) against the embeddings/
+artifacts for every index variant the search engine supports (exact float32,
+int8, IVF, BM25, hybrid, exact with the result cache) and reports, per variant:
+cold load time, single-query p50/p95/p99 latency, queries/s at several
+concurrency levels, batched queries/s, peak RSS and recall@k against exact
+float32 brute force.
+
+Each variant runs in a fresh process so load time and peak memory are not
+shared between variants. Queries are encoded once up front (encoding cost is
+reported separately), so the variants are compared on the index alone.
+
+Results are written as JSON. With --baseline, the run is compared to a
+previous result file and the script exits with status 1 on a regression.
+
+Usage:
+    python benchmarks/search_benchmark.py --embeddings embeddings
+    python benchmarks/search_benchmark.py --baseline benchmarks/results/search-20250101-120000.json
+"""
+
+import sys
+import json
+import time
+import gzip
+import logging
+import argparse
+import platform
+import multiprocessing
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / 'scripts'
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+from result_cache import ResultCache  # noqa: E402
+from search_engine import SearchEngine  # noqa: E402
+from vector_store import open_vectors, top_k, vector_paths  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERIES = Path(__file__).resolve().parent / 'queries.txt'
+DEFAULT_RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+# Variant name -> SearchEngine options ('cache': wrap the engine in a ResultCache)
+VARIANTS = {
+    'exact': {'mode': 'exact'},
+    'int8': {'mode': 'int8'},
+    'ivf-nprobe8': {'mode': 'ivf', 'nprobe': 8},
+    'ivf-nprobe32': {'mode': 'ivf', 'nprobe': 32},
+    'bm25': {'retrieval': 'bm25'},
+    'hybrid': {'retrieval': 'hybrid'},
+    'exact-cached': {'mode': 'exact', 'cache': True},
+}
+
+# Artifact each variant needs besides chunks and float32 vectors
+REQUIRED_FILES = {
+    'int8': 'vectors.i8.bin',
+    'ivf-nprobe8': 'ivf.npz',
+    'ivf-nprobe32': 'ivf.npz',
+    'bm25': 'bm25.npz',
+    'hybrid': 'bm25.npz',
+}
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of the current process (None where unavailable)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def percentiles_ms(seconds: List[float]) -> Dict[str, float]:
+    values = np.asarray(seconds) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99), 'mean': float(values.mean())}
+
+
+def load_float_vectors(embeddings_dir: Path) -> np.ndarray:
+    """Float32 vectors, as SearchEngine loads them"""
+    if vector_paths(embeddings_dir)[1].exists():
+        vectors, _ = open_vectors(embeddings_dir)
+        return vectors
+    with gzip.open(embeddings_dir / 'embeddings.npy.gz', 'rb') as f:
+        return np.load(f).astype(np.float32, copy=False)
+
+
+def encode_queries(model_name: str, queries: List[str]) -> Dict:
+    """Encode the workload once with the index model"""
+    from sentence_transformers import SentenceTransformer
+    start = time.perf_counter()
+    model = SentenceTransformer(model_name, device='cpu')
+    load_seconds = time.perf_counter() - start
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        model.encode([query], normalize_embeddings=True)
+        latencies.append(time.perf_counter() - start)
+    vectors = model.encode(queries, batch_size=64, normalize_embeddings=True).astype(np.float32)
+    return {
+        'vectors': vectors,
+        'stats': {'model_load_s': load_seconds, 'latency_ms': percentiles_ms(latencies)},
+    }
+
+
+def run_variant(embeddings_dir: str, name: str, queries: List[str], vectors: np.ndarray,
+                truth: np.ndarray, k: int, repeat: int, concurrency: List[int]) -> Dict:
+    """Benchmark one variant (runs in its own process)"""
+    options = dict(VARIANTS[name])
+    if options.pop('cache', False):
+        options['cache'] = ResultCache()
+    encoded = {query: vector for query, vector in zip(queries, vectors)}
+
+    def encoder(batch: List[str]) -> np.ndarray:
+        return np.stack([encoded[query] for query in batch])
+
+    # Cold load: open the index and answer a first query (lazy facets/IVF/BM25 loading)
+    start = time.perf_counter()
+    engine = SearchEngine(embeddings_dir, encoder=encoder, **options)
+    engine.search(queries[0], k)
+    cold_load = time.perf_counter() - start
+
+    latencies = []
+    recalls = []
+    for round_number in range(repeat):
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            results = engine.search(query, k)
+            latencies.append(time.perf_counter() - start)
+            if round_number == 0:
+                expected_ids = {engine.chunks[int(row)]['id'] for row in expected}
+                recalls.append(len(expected_ids & {r['id'] for r in results}) / len(expected_ids))
+
+    workload = queries * repeat
+    throughput = {}
+    for workers in concurrency:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda query: engine.search(query, k), workload))
+        throughput[str(workers)] = len(workload) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        engine.search_batch(queries, k)
+    batch_qps = len(workload) / (time.perf_counter() - start)
+
+    result = {
+        'options': {key: value for key, value in VARIANTS[name].items()},
+        'cold_load_s': cold_load,
+        'latency_ms': percentiles_ms(latencies),
+        'qps': throughput,
+        'batch_qps': batch_qps,
+        f'recall_at_{k}': float(np.mean(recalls)),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    if engine.cache is not None:
+        result['cache'] = engine.cache.metrics()
+    return result
+
+
+def compare(baseline: Dict, current: Dict, tolerance: float) -> List[str]:
+    """Regressions of the current run against a baseline result file"""
+    regressions = []
+    k = current['workload']['top_k']
+    for name, now in current['variants'].items():
+        before = baseline.get('variants', {}).get(name)
+        if before is None:
+            continue
+        checks = [
+            ('p95 latency', before['latency_ms']['p95'], now['latency_ms']['p95'], True),
+            ('cold load', before['cold_load_s'], now['cold_load_s'], True),
+            ('qps (1 thread)', before['qps'].get('1'), now['qps'].get('1'), False),
+        ]
+        for label, old, new, lower_is_better in checks:
+            if old is None or new is None or old <= 0:
+                continue
+            change = (new - old) / old
+            if (change > tolerance) if lower_is_better else (change < -tolerance):
+                regressions.append(f"{name}: {label} {old:.3f} -> {new:.3f} ({change:+.0%})")
+        recall_key = f'recall_at_{k}'
+        if recall_key in before and now[recall_key] < before[recall_key] - 0.01:
+            regressions.append(f"{name}: {recall_key} {before[recall_key]:.3f} -> {now[recall_key]:.3f}")
+    return regressions
+
+
+def print_summary(results: Dict):
+    k = results['workload']['top_k']
+    print(f"\n{'variant':<14} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'qps@1':>8} {'qps@max':>8} {'batch qps':>10} {'recall':>7} {'RSS MB':>7}")
+    for name, r in results['variants'].items():
+        qps = list(r['qps'].values())
+        rss = f"{r['peak_rss_mb']:.0f}" if r['peak_rss_mb'] is not None else '-'
+        print(f"{name:<14} {r['cold_load_s']:>7.2f} {r['latency_ms']['p50']:>8.2f} {r['latency_ms']['p95']:>8.2f} "
+              f"{r['latency_ms']['p99']:>8.2f} {qps[0]:>8.0f} {max(qps):>8.0f} {r['batch_qps']:>10.0f} "
+              f"{r[f'recall_at_{k}']:>7.3f} {rss:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark search latency, throughput, memory and recall')
+    parser.add_argument('--embeddings', type=str, default='embeddings', help='Embeddings directory')
+    parser.add_argument('--queries', type=str, default=str(DEFAULT_QUERIES), help='Query workload, one per line')
+    parser.add_argument('--variants', nargs='+', choices=sorted(VARIANTS), default=None,
+                        help='Variants to run (default: all whose artifacts exist)')
+    parser.add_argument('--top-k', type=int, default=10, help='Results per query (default: 10)')
+    parser.add_argument('--repeat', type=int, default=3, help='Passes over the workload (default: 3)')
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 2, 4, 8],
+                        help='Thread counts for the throughput runs (default: 1 2 4 8)')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Result file (default: benchmarks/results/search-<timestamp>.json)')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='Previous result file; exit with status 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed relative slowdown against the baseline (default: 0.25)')
+    args = parser.parse_args()
+
+    embeddings_dir = Path(args.embeddings)
+    with open(embeddings_dir / 'metadata.json', 'r', encoding='utf-8') as f:
+        metadata = json.load(f)
+    with open(args.queries, 'r', encoding='utf-8') as f:
+        queries = [line.strip() for line in f if line.strip()]
+
+    variants = args.variants or [
+        name for name in VARIANTS
+        if name not in REQUIRED_FILES or (embeddings_dir / REQUIRED_FILES[name]).exists()
+    ]
+    missing = [name for name in variants if name in REQUIRED_FILES
+               and not (embeddings_dir / REQUIRED_FILES[name]).exists()]
+    if missing:
+        parser.error(f"missing artifacts for: {', '.join(missing)} "
+                     f"(generate_embeddings.py --vector-dtypes float32 int8 --ivf)")
+
+    logger.info(f"Encoding {len(queries)} queries with {metadata['model']}")
+    encoding = encode_queries(metadata['model'], queries)
+
+    logger.info("Computing exact float32 ground truth")
+    vectors = load_float_vectors(embeddings_dir)
+    truth, _ = top_k(encoding['vectors'] @ np.asarray(vectors, dtype=np.float32).T, args.top_k)
+    del vectors
+
+    results = {
+        'generated_at': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': multiprocessing.cpu_count(),
+        },
+        'index': {
+            'path': str(embeddings_dir),
+            'model': metadata['model'],
+            'num_chunks': metadata.get('num_chunks'),
+            'generated_at': metadata.get('generated_at'),
+        },
+        'workload': {
+            'queries_file': str(args.queries),
+            'queries': len(queries),
+            'top_k': args.top_k,
+            'repeat': args.repeat,
+            'concurrency': args.concurrency,
+        },
+        'encoding': encoding['stats'],
+        'variants': {},
+    }
+
+    # One fresh process per variant: cold load and peak RSS are measured in isolation
+    context = multiprocessing.get_context('spawn')
+    for name in variants:
+        logger.info(f"Running variant {name}")
+        with context.Pool(1) as pool:
+            results['variants'][name] = pool.apply(run_variant, (
+                str(embeddings_dir), name, queries, encoding['vectors'], truth,
+                args.top_k, args.repeat, args.concurrency))
+
+    output = Path(args.output) if args.output else \
+        DEFAULT_RESULTS_DIR / f"search-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    print_summary(results)
+    logger.info(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.tolerance)
+        if regressions:
+            for regression in regressions:
+                logger.error(f"Regression: {regression}")
+            sys.exit(1)
+        logger.info("No regression against baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Synthetic Beckhoff-style Corpus Generator
+
+Generates TwinCAT-manual-like documents for the ingest benchmark, as PDFs (input
+of convert_pdfs.py) and/or as the Markdown convert_pdfs.py would produce from
+them (input of add_frontmatter.py, chunking and generate_embeddings.py).
+
+Documents mimic the real downloads: a "Manual | EN ... | Version: x.y.z" title
+page, a table of contents with dot leaders, the same foreword in every document
+(notes on the documentation, safety instructions, information security),
+numbered sections and identifier-heavy text (function blocks, ADS return codes,
+P-AXIS parameters, IEC 61131-3 declarations).
+
+Sizes are relative to the current docs/ corpus (288 documents, 45,308 pages):
+--scale 1 generates as many pages as docs/, --scale 10 ten times as many.
+Generation is deterministic for a given --seed, and a smaller corpus holds the
+first documents of a larger one with the same seed (its last one shortened).
+
+Usage:
+    python benchmarks/synthetic_corpus.py --output /tmp/corpus --scale 0.1
+    python benchmarks/synthetic_corpus.py --output /tmp/corpus --scale 10 --formats markdown
+"""
+
+import sys
+import math
+import time
+import random
+import logging
+import argparse
+import textwrap
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from convert_pdfs import clean_text  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Current docs/ corpus, the unit of --scale
+REFERENCE_DOCUMENTS = 288
+REFERENCE_PAGES = 45308
+
+# Page counts per document follow a log-normal distribution fitted on docs/
+# (median about 48 pages, a few manuals over 2,000 pages)
+MEDIAN_PAGES = 48
+PAGES_SIGMA = 1.5
+MIN_PAGES = 8
+MAX_PAGES = 2700
+
+# Body text per page, in characters (docs/ averages about 1,500)
+PAGE_CHARS = (950, 1700)
+# Characters per line in the generated PDFs (Helvetica 11 pt on A4)
+LINE_WIDTH = 88
+
+SOURCE_URL = 'https://download.beckhoff.com/download/Document/automation/twincat3/{}.pdf'
+
+PRODUCTS = [
+    ('TF6420', 'Database Server'),
+    ('TF6100', 'OPC UA'),
+    ('TF6701', 'IoT Communication (MQTT)'),
+    ('TF6250', 'Modbus TCP'),
+    ('TF6340', 'Serial Communication'),
+    ('TF6421', 'XML Server'),
+    ('TF6020', 'JSON Data Interface'),
+    ('TF5000', 'NC PTP'),
+    ('TF5100', 'NC I'),
+    ('TF5200', 'CNC'),
+    ('TF3500', 'Analytics Logger'),
+    ('TF7100', 'Vision'),
+    ('TF8040', 'Building Automation'),
+    ('TE1000', 'XAE'),
+    ('TC1200', 'PLC'),
+]
+
+CHAPTERS = [
+    'Introduction', 'System requirements', 'Installation', 'Licensing', 'Configuration',
+    'Technical introduction', 'PLC API', 'Function blocks', 'Data types', 'Global constants',
+    'Samples', 'Diagnostics', 'Error codes', 'Parameters', 'Commissioning', 'Appendix',
+]
+TOPICS = [
+    'Overview', 'Settings', 'Connection setup', 'Task configuration', 'Mapping', 'Timeouts',
+    'Security', 'Certificates', 'Logging', 'Status information', 'Limitations', 'Example project',
+    'Return values', 'Variables', 'Axis parameters', 'Trigger conditions', 'Redundancy',
+]
+
+FOREWORD = [
+    ('1 Foreword', ''),
+    ('1.1 Notes on the documentation',
+     'This description is only intended for the use of trained specialists in control and automation '
+     'engineering who are familiar with applicable national standards. It is essential that the '
+     'documentation and the following notes and explanations are followed when installing and '
+     'commissioning the components. It is the duty of the technical personnel to use the documentation '
+     'published at the respective time of each installation and commissioning. The responsible staff '
+     'must ensure that the application or use of the products described satisfy all the requirements '
+     'for safety, including all the relevant laws, regulations, guidelines and standards. Disclaimer '
+     'The documentation has been prepared with care. The products described are, however, constantly '
+     'under development. We reserve the right to revise and change the documentation at any time and '
+     'without prior announcement. No claims for the modification of products that have already been '
+     'supplied may be made on the basis of the data, diagrams and descriptions in this documentation. '
+     'Trademarks Beckhoff, TwinCAT, TwinCAT/BSD, TC/BSD, EtherCAT, EtherCAT G, EtherCAT G10, EtherCAT P, '
+     'Safety over EtherCAT, TwinSAFE, XFC, XTS and XPlanar are registered trademarks of and licensed by '
+     'Beckhoff Automation GmbH.'),
+    ('1.2 Safety instructions',
+     'Safety regulations Please note the following safety instructions and explanations! Product-specific '
+     'safety instructions can be found on following pages or in the areas mounting, wiring, commissioning '
+     'etc. Exclusion of liability All the components are supplied in particular hardware and software '
+     'configurations appropriate for the application. Modifications to hardware or software configurations '
+     'other than those described in the documentation are not permitted, and nullify the liability of '
+     'Beckhoff Automation GmbH & Co. KG. Personnel qualification This description is only intended for '
+     'trained specialists in control, automation and drive engineering who are familiar with the '
+     'applicable national standards. DANGER Hazard with high risk of death or serious injury. WARNING '
+     'Hazard with medium risk of death or serious injury. CAUTION There is a low-risk hazard that could '
+     'result in medium or minor injury. NOTE The environment, equipment, or data may be damaged.'),
+    ('1.3 Notes on information security',
+     'The products of Beckhoff Automation GmbH & Co. KG (Beckhoff), insofar as they can be accessed '
+     'online, are equipped with security functions that support the secure operation of plants, systems, '
+     'machines and networks. Despite the security functions, the creation, implementation and constant '
+     'updating of a holistic security concept for the operation are necessary to protect the respective '
+     'plant, system, machine and networks against cyber threats. The products sold by Beckhoff are only '
+     'part of the overall security concept. The customer is responsible for preventing unauthorized '
+     'access by third parties to its equipment, systems, machines and networks.'),
+]
+
+ADS_ERRORS = [
+    (0x6, 'ADSERR_DEVICE_TARGETPORTNOTFOUND', 'the target port was not found'),
+    (0x7, 'ADSERR_DEVICE_TARGETMACHINENOTFOUND', 'the target computer was not found'),
+    (0x701, 'ADSERR_DEVICE_SRVNOTSUPP', 'the service is not supported by the server'),
+    (0x705, 'ADSERR_DEVICE_INVALIDSIZE', 'the parameter size is invalid'),
+    (0x706, 'ADSERR_DEVICE_INVALIDDATA', 'the data is invalid'),
+    (0x70A, 'ADSERR_DEVICE_NOMEMORY', 'no memory is available'),
+    (0x710, 'ADSERR_DEVICE_SYMBOLNOTFOUND', 'the symbol was not found'),
+    (0x745, 'ADSERR_CLIENT_SYNCTIMEOUT', 'a timeout occurred'),
+    (0x748, 'ADSERR_CLIENT_PORTNOTOPEN', 'the ADS port is not opened'),
+]
+VERBS = ['reads', 'writes', 'configures', 'monitors', 'resets', 'initializes', 'transfers', 'evaluates']
+OBJECTS = ['the data record', 'the connection', 'the axis', 'the variable', 'the symbol', 'the certificate',
+           'the message', 'the buffer', 'the process image', 'the database table', 'the trigger', 'the route']
+STATES = ['enabled', 'reset', 'transferred', 'acknowledged', 'locked', 'released', 'started', 'stopped']
+QUANTITIES = ['maximum velocity', 'following error limit', 'acceleration', 'jerk', 'reference position',
+              'position lag', 'cycle time', 'dead time']
+UNITS = ['mm', 'mm/s', 'mm/s^2', 'ms', 'µs', 'increments', 'percent']
+TYPES = ['BOOL', 'UDINT', 'DINT', 'LREAL', 'TIME', 'STRING(255)', 'T_AmsNetId', 'ST_DBParameter', 'E_ErrorType']
+NAME_PARTS = ['Read', 'Write', 'Connect', 'Disconnect', 'Open', 'Close', 'Status', 'Config', 'Execute',
+              'Publish', 'Subscribe', 'Move', 'Power', 'Reset', 'Trigger', 'Record', 'Table', 'Value']
+TEMPLATES = [
+    'The function block {fb} {verb} {obj} on a rising edge at the input bExecute.',
+    'If {flag} is TRUE, {obj} is {state} in the next cycle of the PLC task.',
+    'The ADS return code {hexcode} ({code}, {errname}) indicates that {problem}.',
+    'Parameter {paxis} defines the {quantity} of the axis in {unit}.',
+    'In the TwinCAT 3 engineering environment, open the {chapter} tab and select {topic}.',
+    '{Obj} must be configured before the {product} runtime is started.',
+    'This function is available from TwinCAT version 3.1.{build} and {product} version {version}.',
+    'The output bBusy remains TRUE until {obj} has been {state} or a timeout of {timeout} has elapsed.',
+    'The value is transferred as {type} and limited to {limit} {unit}.',
+    'See also the sample {fb} in the chapter {chapter}.',
+]
+
+
+def make_identifier(rng: random.Random) -> str:
+    return ''.join(rng.sample(NAME_PARTS, rng.randint(1, 2)))
+
+
+def make_sentences(rng: random.Random, count: int) -> List[str]:
+    """Pool of identifier-rich sentences the pages are drawn from"""
+    sentences = []
+    for _ in range(count):
+        code, errname, problem = rng.choice(ADS_ERRORS)
+        obj = rng.choice(OBJECTS)
+        sentences.append(rng.choice(TEMPLATES).format(
+            fb=f"FB_{make_identifier(rng)}", verb=rng.choice(VERBS), obj=obj, Obj=obj.capitalize(),
+            flag=f"b{make_identifier(rng)}", state=rng.choice(STATES), hexcode=f"0x{code:X}", code=code,
+            errname=errname, problem=problem, paxis=f"P-AXIS-{rng.randint(1, 400):05d}",
+            quantity=rng.choice(QUANTITIES), unit=rng.choice(UNITS), chapter=rng.choice(CHAPTERS),
+            topic=rng.choice(TOPICS), product=rng.choice(PRODUCTS)[1], build=rng.randint(4022, 4026),
+            version=f"{rng.randint(1, 4)}.{rng.randint(0, 12)}.{rng.randint(0, 30)}",
+            timeout=f"T#{rng.randint(1, 30)}S", type=rng.choice(TYPES), limit=rng.randint(1, 65535),
+        ))
+    return sentences
+
+
+def declaration_block(rng: random.Random) -> List[str]:
+    """IEC 61131-3 declaration of a function block"""
+    lines = [f"FUNCTION_BLOCK FB_{make_identifier(rng)}", 'VAR_INPUT', 'bExecute : BOOL;']
+    lines += [f"{name} : {rng.choice(TYPES)};" for name in
+              rng.sample(['sNetId', 'nPort', 'nIndex', 'sTopic', 'fVelocity', 'tTimeout', 'hConnection'], 3)]
+    lines += ['END_VAR', 'VAR_OUTPUT', 'bBusy : BOOL;', 'bError : BOOL;', 'nErrorId : UDINT;', 'END_VAR']
+    return lines
+
+
+def error_table(rng: random.Random) -> List[str]:
+    lines = ['Hex Dec Name Description']
+    for code, errname, problem in sorted(rng.sample(ADS_ERRORS, 4)):
+        lines.append(f"0x{code:X} {code} {errname} {problem.capitalize()}")
+    return lines
+
+
+def document_sizes(scale: float, seed: int) -> Iterator[int]:
+    """Page count of each document, until scale x REFERENCE_PAGES pages"""
+    rng = random.Random(seed)
+    remaining = round(scale * REFERENCE_PAGES)
+    while remaining > 0:
+        pages = int(rng.lognormvariate(math.log(MEDIAN_PAGES), PAGES_SIGMA))
+        pages = min(max(pages, MIN_PAGES), MAX_PAGES, max(remaining, MIN_PAGES))
+        remaining -= pages
+        yield pages
+
+
+def generate_document(number: int, num_pages: int, sentences: List[str],
+                      rng: random.Random) -> Tuple[str, List[List[str]]]:
+    """(file name without extension, pages as lists of lines)"""
+    code, product = PRODUCTS[number % len(PRODUCTS)]
+    topic = rng.choice(TOPICS)
+    name = f"{code}_TC3_{product.split(' (')[0].replace(' ', '_')}_{topic.replace(' ', '_')}_{number:05d}_EN"
+    version = f"{rng.randint(1, 4)}.{rng.randint(0, 12)}.{rng.randint(0, 30)}"
+    date = f"20{rng.randint(18, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    footer = f"TwinCAT 3 | {product} Version: {version}"
+
+    # Outline: one section every three body pages, grouped in chapters (about 45 TOC lines per page)
+    toc_pages = 1 + num_pages // 100
+    foreword_pages = 2
+    first_body_page = 2 + toc_pages + foreword_pages
+    body_pages = max(num_pages - first_body_page + 1, 1)
+    num_sections = max(body_pages // 3, 1)
+    sections = {}
+    chapter = 1
+    for index in range(num_sections):
+        if index % 4 == 0:
+            chapter += 1
+            sections[first_body_page + index * 3] = [f"{chapter} {CHAPTERS[(chapter + number) % len(CHAPTERS)]}"]
+        page = first_body_page + index * 3
+        sections.setdefault(page, []).append(f"{chapter}.{index % 4 + 1} {rng.choice(TOPICS)}")
+
+    toc = [f"{heading} {'.' * max(LINE_WIDTH - len(heading) - 6, 3)} {page}"
+           for heading, page in [('1 Foreword', 2 + toc_pages), ('1.1 Notes on the documentation', 2 + toc_pages),
+                                 ('1.2 Safety instructions', 3 + toc_pages),
+                                 ('1.3 Notes on information security', 3 + toc_pages)]
+           + [(heading, page) for page, headings in sections.items() for heading in headings]]
+    per_toc_page = math.ceil(len(toc) / toc_pages)
+
+    pages = [[f"Manual | EN TwinCAT 3 | {product} {date} | Version: {version}"]]
+    for index in range(toc_pages):
+        pages.append(['Table of contents'] + toc[index * per_toc_page:(index + 1) * per_toc_page]
+                     + [f"{footer} {len(pages) + 1}"])
+    for part in (FOREWORD[:2], FOREWORD[2:]):
+        lines = ['Foreword']
+        for heading, text in part:
+            lines.append(heading)
+            lines += textwrap.wrap(text, LINE_WIDTH)
+        pages.append(lines + [f"{footer} {len(pages) + 1}"])
+
+    while len(pages) < num_pages:
+        page_number = len(pages) + 1
+        lines = list(sections.get(page_number, []))
+        target = rng.randint(*PAGE_CHARS)
+        if rng.random() < 0.15:
+            lines += declaration_block(rng)
+        elif rng.random() < 0.1:
+            lines += error_table(rng)
+        size = sum(len(line) for line in lines)
+        while size < target:
+            paragraph = ' '.join(rng.choices(sentences, k=rng.randint(2, 6)))
+            lines += textwrap.wrap(paragraph, LINE_WIDTH)
+            size += len(paragraph)
+        pages.append(lines + [f"{footer} {page_number}"])
+    return name, pages
+
+
+def generate_documents(scale: float, seed: int = 0) -> Iterator[Tuple[str, List[List[str]]]]:
+    """Documents of a corpus of scale x docs/, one at a time"""
+    rng = random.Random(seed + 1)
+    sentences = make_sentences(rng, 5000)
+    for number, num_pages in enumerate(document_sizes(scale, seed)):
+        yield generate_document(number, num_pages, sentences, rng)
+
+
+def escape_pdf_text(line: str) -> str:
+    return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_pdf(path: Path, pages: List[List[str]]) -> int:
+    """Minimal PDF (one Helvetica text object per page). Returns the file size."""
+    offsets = []
+    kids = ' '.join(f"{4 + 2 * index} 0 R" for index in range(len(pages)))
+    with open(path, 'wb') as f:
+        def write_object(body: str):
+            offsets.append(f.tell())
+            f.write(f"{len(offsets)} 0 obj\n{body}\nendobj\n".encode('latin-1', errors='replace'))
+
+        f.write(b"%PDF-1.4\n")
+        write_object("<< /Type /Catalog /Pages 2 0 R >>")
+        write_object(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>")
+        write_object("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        for index, lines in enumerate(pages):
+            stream = ('BT /F1 11 Tf 14 TL 50 800 Td '
+                      + ' '.join(f"({escape_pdf_text(line)}) Tj T*" for line in lines) + ' ET')
+            write_object(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                         f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * index} 0 R >>")
+            write_object(f"<< /Length {len(stream.encode('latin-1', errors='replace'))} >>\n"
+                         f"stream\n{stream}\nendstream")
+        xref = f.tell()
+        f.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode())
+        f.write(''.join(f"{offset:010d} 00000 n \n" for offset in offsets).encode())
+        f.write(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+        return f.tell()
+
+
+def write_markdown(path: Path, name: str, pages: List[List[str]]) -> int:
+    """The Markdown convert_pdfs.py writes for the same document. Returns the file size."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"# {name}\n\n*Source: {SOURCE_URL.format(name)}*\n\n---\n\n")
+        for page_number, lines in enumerate(pages, 1):
+            f.write(f"## Page {page_number}\n\n{clean_text(chr(10).join(lines))}\n")
+    return path.stat().st_size
+
+
+def write_corpus(output_dir: Path, fmt: str, scale: float, seed: int = 0) -> Dict:
+    """
+    Write a corpus of scale x docs/ in output_dir, as 'pdf' (plus an index.txt
+    of file:// URLs for convert_pdfs.py) or 'markdown'. Returns its statistics.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    stats = {'format': fmt, 'scale': scale, 'seed': seed, 'documents': 0, 'pages': 0, 'bytes': 0}
+    urls = []
+    for name, pages in generate_documents(scale, seed):
+        if fmt == 'pdf':
+            path = output_dir / f"{name}.pdf"
+            stats['bytes'] += write_pdf(path, pages)
+            urls.append(path.resolve().as_uri())
+        else:
+            stats['bytes'] += write_markdown(output_dir / f"{name}.md", name, pages)
+        stats['documents'] += 1
+        stats['pages'] += len(pages)
+    if fmt == 'pdf':
+        with open(output_dir / 'index.txt', 'w', encoding='utf-8') as f:
+            f.write('\n'.join(urls) + '\n')
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic Beckhoff-style documentation corpus')
+    parser.add_argument('--output', type=str, required=True, help='Output directory')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Corpus size relative to docs/ (1 = 45,308 pages, 10 = ten times as many)')
+    parser.add_argument('--formats', nargs='+', choices=['pdf', 'markdown'], default=['pdf', 'markdown'],
+                        help='Formats to write, each in its own subdirectory (default: both)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    args = parser.parse_args()
+    if args.scale <= 0:
+        parser.error('--scale must be positive')
+
+    for fmt in args.formats:
+        stats = write_corpus(Path(args.output) / fmt, fmt, args.scale, args.seed)
+        logger.info(f"{fmt}: {stats['documents']} documents, {stats['pages']} pages, "
+                    f"{stats['bytes'] / 1e6:.1f} MB in {stats['seconds']:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,31 +4,122 @@ PDF to Markdown Batch Converter for TwinCAT Documentation
 
 This script downloads PDFs from URLs in index.txt and converts them to Markdown format.
 Uses multithreading (1 worker by default) for efficient processing with progress tracking.
+With --processes N, downloads stay on the I/O threads while page extraction runs on
+N worker processes, large PDFs being split into page ranges across the workers.
+With --cache-dir, downloaded PDFs are kept in a local cache whose manifest records
+ETag, Last-Modified, size and sha256 per URL; --refresh then re-checks every URL with
+a conditional request and only re-converts the PDFs that actually changed.
 """
 
 import os
 import re
 import sys
+import json
 import time
+import hashlib
 import logging
+import threading
 import tempfile
 import argparse
+import multiprocessing
 from pathlib import Path
 from urllib.parse import urlparse
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait
 from typing import List, Tuple, Optional
 
 import requests
 import pdfplumber
 from tqdm import tqdm
 
+# Downloads are streamed to disk in blocks of this size, so memory per worker
+# stays flat whatever the size of the PDF
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+CACHE_MANIFEST = 'manifest.json'
+
+
+def clean_text(text: str) -> str:
+    """Clean and format extracted text."""
+    if not text:
+        return ""
+    
+    # Remove excessive whitespace
+    text = re.sub(r'\s+', ' ', text)
+    
+    # Fix common PDF extraction issues
+    text = re.sub(r'([a-z])([A-Z])', r'\1 \2', text)  # Add space between camelCase
+    text = re.sub(r'([.!?])([A-Z])', r'\1 \2', text)  # Add space after sentence endings
+    
+    # Remove page numbers and headers/footers (basic heuristics)
+    lines = text.split('\n')
+    cleaned_lines = []
+    
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+            
+        # Skip likely page numbers
+        if re.match(r'^\d+$', line) and len(line) <= 3:
+            continue
+            
+        # Skip likely headers/footers (very short lines)
+        if len(line) < 3:
+            continue
+            
+        cleaned_lines.append(line)
+    
+    return '\n'.join(cleaned_lines)
+
+
+def count_pdf_pages(pdf_path: str) -> int:
+    """Read the page count from the PDF catalog without building page objects."""
+    from pdfminer.pdfparser import PDFParser
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdftypes import resolve1
+    
+    try:
+        with open(pdf_path, 'rb') as fp:
+            document = PDFDocument(PDFParser(fp))
+            return int(resolve1(document.catalog['Pages'])['Count'])
+    except Exception:
+        # Fallback for damaged page trees: let pdfplumber walk the pages
+        with pdfplumber.open(pdf_path) as pdf:
+            return len(pdf.pages)
+
+
+def extract_page_range(pdf_path: str, first_page: int, last_page: int) -> List[Tuple[int, str]]:
+    """
+    Extract and clean the text of pages first_page..last_page (1-based, inclusive).
+    Runs in a worker process; returns (page_num, text) for non-empty pages, in order.
+    """
+    pages = []
+    with pdfplumber.open(pdf_path, pages=list(range(first_page, last_page + 1))) as pdf:
+        for page in pdf.pages:
+            text = clean_text(page.extract_text())
+            if text.strip():
+                pages.append((page.page_number, text))
+    return pages
+
 
 class PDFToMarkdownConverter:
-    def __init__(self, index_file: str = "index.txt", output_dir: str = "docs", max_workers: int = 1, force_reconvert: bool = False):
+    def __init__(self, index_file: str = "index.txt", output_dir: str = "docs", max_workers: int = 1, force_reconvert: bool = False,
+                 processes: int = 0, pages_per_task: int = 50, temp_dir: Optional[str] = None,
+                 cache_dir: Optional[str] = None, refresh: bool = False):
         self.index_file = index_file
         self.output_dir = Path(output_dir)
         self.max_workers = max_workers
         self.force_reconvert = force_reconvert
+        # Process pool for page extraction (0 = extract on the download threads)
+        self.processes = processes
+        self.pages_per_task = pages_per_task
+        self.extract_pool = None
+        # Directory for downloaded PDFs (None = system temp directory)
+        self.temp_dir = temp_dir
+        # Persistent PDF cache (None = no cache, PDFs are deleted after conversion)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.refresh = refresh
+        self.cache_manifest = {}
+        self.cache_lock = threading.Lock()
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
@@ -48,9 +139,15 @@ class PDFToMarkdownConverter:
         # Create output directory
         self.output_dir.mkdir(exist_ok=True)
         
+        # Load the PDF cache manifest
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self.cache_manifest = self.load_cache_manifest()
+        
         # Statistics
         self.successful_conversions = []
         self.failed_conversions = []
+        self.not_modified = 0
 
     def read_urls(self) -> List[str]:
         """Read URLs from index.txt file."""
@@ -76,48 +173,151 @@ class PDFToMarkdownConverter:
             # Fallback: use URL path or generate name
             return f"document_{hash(url) % 10000}.md"
 
-    def download_pdf(self, url: str, timeout: int = 30) -> Optional[bytes]:
-        """Download PDF from URL."""
+    def download_pdf(self, url: str, timeout: int = 30) -> Optional[str]:
+        """
+        Download PDF from URL, streaming it in DOWNLOAD_CHUNK_SIZE blocks to a
+        temporary file. Returns the file path; the caller is responsible for removing it.
+        """
+        temp_file_path = None
         try:
-            response = self.session.get(url, timeout=timeout, stream=True)
-            response.raise_for_status()
-            
-            # Check if it's actually a PDF
-            content_type = response.headers.get('content-type', '').lower()
-            if 'pdf' not in content_type and not url.lower().endswith('.pdf'):
-                self.logger.warning(f"URL {url} may not be a PDF (content-type: {content_type})")
+            with self.session.get(url, timeout=timeout, stream=True) as response:
+                response.raise_for_status()
+                
+                # Check if it's actually a PDF
+                content_type = response.headers.get('content-type', '').lower()
+                if 'pdf' not in content_type and not url.lower().endswith('.pdf'):
+                    self.logger.warning(f"URL {url} may not be a PDF (content-type: {content_type})")
+                
+                with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False, dir=self.temp_dir) as temp_file:
+                    temp_file_path = temp_file.name
+                    self.write_response(response, temp_file)
             
-            return response.content
+            return temp_file_path
             
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, OSError) as e:
             self.logger.error(f"Failed to download {url}: {e}")
+            self.remove_temp_file(temp_file_path)
             return None
 
-    def pdf_to_markdown_streaming(self, pdf_content: bytes, output_file) -> bool:
-        """Convert PDF content to Markdown format and write directly to file."""
-        temp_file_path = None
-        pdf = None
+    def write_response(self, response, output_file) -> Tuple[int, str]:
+        """Stream a response body to output_file in blocks. Returns (size, sha256)."""
+        size = 0
+        digest = hashlib.sha256()
+        for block in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            output_file.write(block)
+            digest.update(block)
+            size += len(block)
+        return size, digest.hexdigest()
+
+    def load_cache_manifest(self) -> dict:
+        """Load the PDF cache manifest (URL -> etag, last_modified, size, sha256, file)."""
+        manifest_path = self.cache_dir / CACHE_MANIFEST
+        if not manifest_path.exists():
+            return {}
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable cache manifest {manifest_path}: {e}")
+            return {}
+
+    def save_cache_manifest(self):
+        """Write the PDF cache manifest atomically."""
+        manifest_path = self.cache_dir / CACHE_MANIFEST
+        temp_path = manifest_path.with_suffix('.json.tmp')
+        with self.cache_lock:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.cache_manifest, f, indent=2, sort_keys=True)
+            os.replace(temp_path, manifest_path)
+
+    def fetch_cached_pdf(self, url: str, timeout: int = 30) -> Tuple[Optional[str], bool, Optional[dict]]:
+        """
+        Bring the cached copy of a PDF up to date with a conditional request.
+        Returns (cached file path, changed, new manifest entry); the path is None if
+        the fetch failed, the entry None on 304. The caller records the entry with
+        record_cache_entry once the PDF has been converted, so a failed conversion
+        is retried by the next --refresh instead of being skipped as not modified.
+        """
+        cache_path = self.cache_dir / self.extract_filename_from_url(url).replace('.md', '.pdf')
+        with self.cache_lock:
+            entry = dict(self.cache_manifest.get(url, {}))
+        
+        headers = {}
+        if entry and cache_path.exists():
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
         
+        temp_file_path = None
         try:
-            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
-                temp_file.write(pdf_content)
-                temp_file.flush()
-                temp_file_path = temp_file.name
+            with self.session.get(url, timeout=timeout, stream=True, headers=headers) as response:
+                if response.status_code == 304:
+                    return str(cache_path), False, None
+                response.raise_for_status()
                 
-                pdf = pdfplumber.open(temp_file_path)
-                for page_num, page in enumerate(pdf.pages, 1):
-                    # Extract text from page
-                    text = page.extract_text()
-                    if text:
-                        # Clean up the text
-                        text = self.clean_text(text)
-                        if text.strip():
-                            # Write directly to file instead of accumulating in memory
-                            output_file.write(f"## Page {page_num}\n\n{text}\n")
-                    # Explicitly delete page object to free memory
-                    del page
+                content_type = response.headers.get('content-type', '').lower()
+                if 'pdf' not in content_type and not url.lower().endswith('.pdf'):
+                    self.logger.warning(f"URL {url} may not be a PDF (content-type: {content_type})")
                 
-                return True
+                # Download next to the cached copy, then swap it in atomically
+                with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False, dir=self.cache_dir) as temp_file:
+                    temp_file_path = temp_file.name
+                    size, sha256 = self.write_response(response, temp_file)
+                os.replace(temp_file_path, cache_path)
+                temp_file_path = None
+                
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+        
+        except (requests.exceptions.RequestException, OSError) as e:
+            self.logger.error(f"Failed to download {url}: {e}")
+            self.remove_temp_file(temp_file_path)
+            return None, False, None
+        
+        new_entry = {
+            'etag': etag,
+            'last_modified': last_modified,
+            'size': size,
+            'sha256': sha256,
+            'file': cache_path.name,
+        }
+        # A 200 with identical bytes (e.g. server without validators) is not a change
+        return str(cache_path), sha256 != entry.get('sha256'), new_entry
+
+    def record_cache_entry(self, url: str, entry: Optional[dict]):
+        """Record the validators of a successfully converted PDF in the cache manifest."""
+        if entry is not None:
+            with self.cache_lock:
+                self.cache_manifest[url] = entry
+
+    def remove_temp_file(self, temp_file_path: Optional[str]):
+        """Delete a downloaded temporary PDF, logging instead of raising."""
+        if temp_file_path and os.path.exists(temp_file_path):
+            try:
+                os.unlink(temp_file_path)
+            except OSError as e:
+                self.logger.warning(f"Could not delete temporary file {temp_file_path}: {e}")
+
+    def pdf_to_markdown_streaming(self, pdf_path: str, output_file) -> bool:
+        """Convert a PDF file to Markdown format and write directly to file."""
+        pdf = None
+        
+        try:
+            pdf = pdfplumber.open(pdf_path)
+            for page_num, page in enumerate(pdf.pages, 1):
+                # Extract text from page
+                text = page.extract_text()
+                if text:
+                    # Clean up the text
+                    text = self.clean_text(text)
+                    if text.strip():
+                        # Write directly to file instead of accumulating in memory
+                        output_file.write(f"## Page {page_num}\n\n{text}\n")
+                # Explicitly delete page object to free memory
+                del page
+            
+            return True
                 
         except Exception as e:
             self.logger.error(f"Error processing PDF: {e}")
@@ -130,49 +330,42 @@ class PDFToMarkdownConverter:
                     pdf.close()
                 except Exception as e:
                     self.logger.warning(f"Error closing PDF: {e}")
+
+    def pdf_to_markdown_process_pool(self, pdf_path: str, output_file) -> bool:
+        """
+        Convert a PDF file to Markdown using the extraction process pool.
+        Page ranges are extracted in parallel and written back in page order.
+        """
+        futures = []
+        
+        try:
+            num_pages = count_pdf_pages(pdf_path)
+            futures = [
+                self.extract_pool.submit(extract_page_range, pdf_path, first,
+                                         min(first + self.pages_per_task - 1, num_pages))
+                for first in range(1, num_pages + 1, self.pages_per_task)
+            ]
             
-            # Clean up temp file after pdfplumber has released all handles
-            if temp_file_path and os.path.exists(temp_file_path):
-                try:
-                    os.unlink(temp_file_path)
-                except OSError as e:
-                    self.logger.warning(f"Could not delete temporary file {temp_file_path}: {e}")
+            # Collect in submission order to keep the streamed page order
+            for future in futures:
+                for page_num, text in future.result():
+                    output_file.write(f"## Page {page_num}\n\n{text}\n")
             
-            # Explicitly delete PDF content to free memory
-            del pdf_content
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"Error processing PDF: {e}")
+            output_file.write(f"# Error\n\nFailed to process PDF: {e}")
+            return False
+        finally:
+            # Drop or wait for outstanding ranges before the caller removes the file
+            for future in futures:
+                future.cancel()
+            wait(futures)
 
     def clean_text(self, text: str) -> str:
         """Clean and format extracted text."""
-        if not text:
-            return ""
-        
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text)
-        
-        # Fix common PDF extraction issues
-        text = re.sub(r'([a-z])([A-Z])', r'\1 \2', text)  # Add space between camelCase
-        text = re.sub(r'([.!?])([A-Z])', r'\1 \2', text)  # Add space after sentence endings
-        
-        # Remove page numbers and headers/footers (basic heuristics)
-        lines = text.split('\n')
-        cleaned_lines = []
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            # Skip likely page numbers
-            if re.match(r'^\d+$', line) and len(line) <= 3:
-                continue
-                
-            # Skip likely headers/footers (very short lines)
-            if len(line) < 3:
-                continue
-                
-            cleaned_lines.append(line)
-        
-        return '\n'.join(cleaned_lines)
+        return clean_text(text)
 
     def process_single_pdf(self, url: str) -> Tuple[str, bool, str]:
         """Process a single PDF URL. Returns (filename, success, error_message)."""
@@ -180,15 +373,28 @@ class PDFToMarkdownConverter:
         output_path = self.output_dir / filename
         
         # Skip if file already exists (resume functionality)
-        if output_path.exists() and not self.force_reconvert:
+        if output_path.exists() and not self.force_reconvert and not self.refresh:
             self.logger.info(f"[SKIP] Already exists: {filename}")
             return filename, True, "Already converted"
         
+        pdf_path = None
         try:
-            # Download PDF
-            pdf_content = self.download_pdf(url)
-            if pdf_content is None:
-                return filename, False, "Failed to download PDF"
+            if self.cache_dir:
+                # Conditional fetch into the persistent cache
+                cached_path, changed, cache_entry = self.fetch_cached_pdf(url)
+                if cached_path is None:
+                    return filename, False, "Failed to download PDF"
+                if not changed and output_path.exists() and not self.force_reconvert:
+                    self.record_cache_entry(url, cache_entry)
+                    with self.cache_lock:
+                        self.not_modified += 1
+                    self.logger.info(f"[SKIP] Not modified: {filename}")
+                    return filename, True, "Not modified"
+            else:
+                # Download PDF to a temporary file
+                pdf_path = self.download_pdf(url)
+                if pdf_path is None:
+                    return filename, False, "Failed to download PDF"
             
             # Convert to Markdown using streaming approach
             with open(output_path, 'w', encoding='utf-8') as f:
@@ -197,17 +403,26 @@ class PDFToMarkdownConverter:
                 f.write("---\n\n")
                 
                 # Use streaming conversion to avoid memory accumulation
-                success = self.pdf_to_markdown_streaming(pdf_content, f)
+                source_path = cached_path if self.cache_dir else pdf_path
+                if self.extract_pool is not None:
+                    success = self.pdf_to_markdown_process_pool(source_path, f)
+                else:
+                    success = self.pdf_to_markdown_streaming(source_path, f)
                 
                 if not success:
                     return filename, False, "Failed to convert PDF content"
             
+            if self.cache_dir:
+                self.record_cache_entry(url, cache_entry)
             return filename, True, ""
             
         except Exception as e:
             error_msg = f"Error processing {url}: {e}"
             self.logger.error(error_msg)
             return filename, False, error_msg
+        finally:
+            # Clean up temp file after pdfplumber has released all handles
+            self.remove_temp_file(pdf_path)
 
     def create_index(self):
         """Create an index file listing all converted documents."""
@@ -243,6 +458,37 @@ class PDFToMarkdownConverter:
         # Process URLs with multithreading
         self.logger.info(f"Processing {len(urls)} URLs with {self.max_workers} workers")
         
+        if self.processes > 0:
+            self.logger.info(f"Extracting pages with {self.processes} processes "
+                             f"({self.pages_per_task} pages per task)")
+            # Spawned workers: forking this multi-threaded process (download threads,
+            # logging and urllib3 locks) could leave a worker deadlocked on a held lock
+            self.extract_pool = ProcessPoolExecutor(max_workers=self.processes,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+        
+        try:
+            self._convert_urls(urls)
+        finally:
+            if self.extract_pool is not None:
+                self.extract_pool.shutdown()
+                self.extract_pool = None
+            if self.cache_dir:
+                self.save_cache_manifest()
+        
+        # Create index file
+        self.create_index()
+        
+        # Final summary
+        self.logger.info(f"\nConversion completed!")
+        self.logger.info(f"Successfully converted: {len(self.successful_conversions)} files")
+        self.logger.info(f"Failed conversions: {len(self.failed_conversions)} files")
+        if self.cache_dir:
+            self.logger.info(f"Not modified since last fetch: {self.not_modified} files")
+        self.logger.info(f"Output directory: {self.output_dir.absolute()}")
+        self.logger.info(f"Index file: {self.output_dir / 'INDEX.md'}")
+
+    def _convert_urls(self, urls: List[str]):
+        """Download and convert all URLs on the thread pool, updating statistics."""
         with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
             # Submit all tasks
             future_to_url = {
@@ -268,16 +514,6 @@ class PDFToMarkdownConverter:
                         'Success': len(self.successful_conversions),
                         'Failed': len(self.failed_conversions)
                     })
-        
-        # Create index file
-        self.create_index()
-        
-        # Final summary
-        self.logger.info(f"\nConversion completed!")
-        self.logger.info(f"Successfully converted: {len(self.successful_conversions)} files")
-        self.logger.info(f"Failed conversions: {len(self.failed_conversions)} files")
-        self.logger.info(f"Output directory: {self.output_dir.absolute()}")
-        self.logger.info(f"Index file: {self.output_dir / 'INDEX.md'}")
 
 
 def main():
@@ -291,14 +527,33 @@ def main():
                        help='Output directory for converted Markdown files (default: docs)')
     parser.add_argument('--force', '-f', action='store_true',
                        help='Force reconversion of existing files (default: skip existing files)')
+    parser.add_argument('--processes', '-p', type=int, default=0,
+                       help='Number of worker processes for page extraction; --workers then sets '
+                            'the download threads (default: 0, extract on the download threads)')
+    parser.add_argument('--pages-per-task', type=int, default=50,
+                       help='Pages per extraction task when splitting large PDFs (default: 50)')
+    parser.add_argument('--temp-dir', type=str, default=None,
+                       help='Directory for downloaded PDFs (default: system temp directory)')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                       help='Keep downloaded PDFs and their ETag/Last-Modified/sha256 manifest in this directory')
+    parser.add_argument('--refresh', '-r', action='store_true',
+                       help='Re-check every URL with a conditional request and re-convert only changed PDFs '
+                            '(requires --cache-dir)')
     
     args = parser.parse_args()
+    if args.refresh and not args.cache_dir:
+        parser.error('--refresh requires --cache-dir')
     
     converter = PDFToMarkdownConverter(
         index_file=args.index,
         output_dir=args.output,
         max_workers=args.workers,
-        force_reconvert=args.force
+        force_reconvert=args.force,
+        processes=args.processes,
+        pages_per_task=args.pages_per_task,
+        temp_dir=args.temp_dir,
+        cache_dir=args.cache_dir,
+        refresh=args.refresh
     )
     converter.run()
 
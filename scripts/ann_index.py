@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Index approximatif des plus proches voisins (IVF) en NumPy pur.
+
+Les vecteurs sont répartis en `n_lists` listes par un k-means sphérique.
+Une requête est comparée aux centroïdes, puis seulement aux vecteurs des
+`nprobe` listes les plus proches: le coût d'une requête croît en
+O(n_lists + nprobe * n / n_lists) au lieu de O(n).
+
+Fichier produit: `embeddings/ivf.npz` (centroïdes, offsets des listes, ids,
+et `generated_at` des vecteurs indexés).
+"""
+import sys
+import math
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from quantization import exact_search, recall_at_k, sample_queries
+from vector_store import open_vectors, top_k
+
+IVF_FILE = 'ivf.npz'
+
+
+def normalize_rows(x: np.ndarray) -> np.ndarray:
+    """Normalise chaque ligne (norme L2 = 1)"""
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray, block_rows: int = 16384) -> np.ndarray:
+    """Liste (centroïde le plus proche en cosinus) de chaque vecteur, par blocs"""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_rows):
+        block = np.asarray(vectors[start:start + block_rows], dtype=np.float32)
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def train_kmeans(vectors: np.ndarray, n_lists: int, iterations: int = 20,
+                 max_samples_per_list: int = 256, seed: int = 0) -> np.ndarray:
+    """
+    k-means sphérique sur un échantillon (au plus max_samples_per_list points
+    par liste). Retourne les centroïdes normalisés, forme (n_lists, dims).
+    """
+    rng = np.random.default_rng(seed)
+    num_samples = min(len(vectors), n_lists * max_samples_per_list)
+    sample_rows = np.sort(rng.choice(len(vectors), num_samples, replace=False))
+    sample = normalize_rows(np.asarray(vectors[sample_rows], dtype=np.float32))
+
+    centroids = sample[rng.choice(num_samples, n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign_lists(sample, centroids)
+        counts = np.bincount(assignments, minlength=n_lists)
+
+        # Somme par liste: tri par liste puis reduceat sur les listes non vides
+        order = np.argsort(assignments, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        filled = counts > 0
+        sums = np.zeros_like(centroids)
+        sums[filled] = np.add.reduceat(sample[order], starts[filled], axis=0)
+
+        # Listes vides: re-semées sur des points aléatoires
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = sample[rng.choice(num_samples, len(empty), replace=False)]
+        centroids = normalize_rows(sums)
+
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """Index IVF: centroïdes + listes inversées d'ids de lignes"""
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, ids: np.ndarray,
+                 generated_at: Optional[str] = None):
+        self.centroids = centroids
+        self.offsets = offsets  # liste l = ids[offsets[l]:offsets[l + 1]]
+        self.ids = ids
+        self.generated_at = generated_at  # génération des vecteurs indexés
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, n_lists: Optional[int] = None,
+              iterations: int = 20, seed: int = 0, generated_at: Optional[str] = None) -> 'IVFIndex':
+        """Entraîne les centroïdes et répartit tous les vecteurs"""
+        if n_lists is None or n_lists <= 0:
+            n_lists = default_n_lists(len(vectors))
+        n_lists = min(n_lists, len(vectors))
+
+        centroids = train_kmeans(vectors, n_lists, iterations=iterations, seed=seed)
+        assignments = assign_lists(vectors, centroids)
+        ids = np.argsort(assignments, kind='stable').astype(np.int32)
+        counts = np.bincount(assignments, minlength=n_lists)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls(centroids, offsets, ids, generated_at)
+
+    def save(self, output_dir: Path) -> Path:
+        path = Path(output_dir) / IVF_FILE
+        np.savez(path, centroids=self.centroids, offsets=self.offsets, ids=self.ids,
+                 generated_at=np.array(self.generated_at or ''))
+        return path
+
+    @classmethod
+    def load(cls, output_dir: Path) -> 'IVFIndex':
+        with np.load(Path(output_dir) / IVF_FILE) as data:
+            generated_at = str(data['generated_at']) if 'generated_at' in data.files else ''
+            return cls(data['centroids'], data['offsets'], data['ids'], generated_at or None)
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Ids des vecteurs des nprobe listes les plus proches de la requête"""
+        lists, _ = top_k(self.centroids @ query, min(nprobe, self.n_lists))
+        return np.concatenate([self.ids[self.offsets[l]:self.offsets[l + 1]] for l in lists[0]])
+
+    def search(self, queries: np.ndarray, vectors: np.ndarray, k: int = 10,
+               nprobe: int = 8) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k approximatif. `vectors` est la matrice float32 (memmap accepté:
+        seules les lignes des listes sondées sont lues).
+        Retourne (indices, scores) de forme (n_requêtes, k), complétés par -1 / -inf
+        si les listes sondées contiennent moins de k vecteurs.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+
+        for i, query in enumerate(queries):
+            rows = np.sort(self.candidates(query, nprobe))
+            if len(rows) == 0:
+                continue
+            best, best_scores = top_k(np.asarray(vectors[rows], dtype=np.float32) @ query, k)
+            found = best.shape[1]
+            indices[i, :found] = rows[best[0]]
+            scores[i, :found] = best_scores[0]
+        return indices, scores
+
+
+def default_n_lists(num_vectors: int) -> int:
+    """Heuristique usuelle: ~4 * sqrt(n) listes"""
+    return max(1, int(4 * math.sqrt(num_vectors)))
+
+
+def evaluate_ivf(index: IVFIndex, vectors: np.ndarray, nprobes: List[int],
+                 num_queries: int = 200, k: int = 10, seed: int = 0) -> Dict:
+    """Recall@k et latence par requête pour chaque nprobe, contre la force brute"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    queries = sample_queries(vectors, num_queries, seed)
+
+    start = time.perf_counter()
+    expected = np.vstack([exact_search(q, vectors, k)[0] for q in queries])
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    results = []
+    for nprobe in nprobes:
+        start = time.perf_counter()
+        found = np.vstack([index.search(q, vectors, k=k, nprobe=nprobe)[0] for q in queries])
+        elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        scanned = np.mean([len(index.candidates(q, nprobe)) for q in queries])
+        results.append({
+            'nprobe': nprobe,
+            'recall': recall_at_k(found, expected),
+            'latency_ms': elapsed_ms,
+            'scanned_fraction': float(scanned / len(vectors)),
+        })
+
+    return {'queries': len(queries), 'k': k, 'n_lists': index.n_lists,
+            'latency_ms_exact': exact_ms, 'nprobe': results}
+
+
+def print_report(report: Dict):
+    """Affiche le rapport recall/latence par nprobe"""
+    k = report['k']
+    print(f"[STATS] Index IVF ({report['n_lists']} listes, {report['queries']} requêtes, k={k}):")
+    print(f"  Force brute: {report['latency_ms_exact']:.2f} ms/requête")
+    for row in report['nprobe']:
+        print(f"  nprobe={row['nprobe']:<4} recall@{k}={row['recall']:.4f}  "
+              f"{row['latency_ms']:.2f} ms/requête  {row['scanned_fraction'] * 100:.1f}% des vecteurs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construit ou évalue l'index IVF des embeddings")
+    parser.add_argument('--embeddings', type=str, default='embeddings',
+                        help='Répertoire contenant vectors.f32.* (défaut: embeddings)')
+    parser.add_argument('--build', action='store_true', help="(Re)construit ivf.npz avant l'évaluation")
+    parser.add_argument('--lists', type=int, default=0, help='Nombre de listes (défaut: 4*sqrt(n))')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32],
+                        help='Valeurs de nprobe à évaluer (défaut: 1 4 8 16 32)')
+    parser.add_argument('--queries', type=int, default=200, help='Nombre de requêtes (défaut: 200)')
+    parser.add_argument('--top-k', type=int, default=10, help='k du recall@k (défaut: 10)')
+    args = parser.parse_args()
+
+    embeddings_dir = Path(args.embeddings)
+    try:
+        vectors, header = open_vectors(embeddings_dir)
+    except FileNotFoundError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+    if args.build or not (embeddings_dir / IVF_FILE).exists():
+        print("[INFO] Construction de l'index IVF...")
+        index = IVFIndex.build(vectors, n_lists=args.lists, generated_at=header.get('generated_at'))
+        print(f"[OK] {index.save(embeddings_dir)} ({index.n_lists} listes)")
+    else:
+        index = IVFIndex.load(embeddings_dir)
+
+    print_report(evaluate_ivf(index, vectors, args.nprobe, num_queries=args.queries, k=args.top_k))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""
+Format compact des chunks (`chunks.compact.json`).
+
+chunks.json répète le frontmatter complet dans chaque chunk. Le format compact
+stocke une table des documents indexée par entier et, pour chaque chunk, une
+ligne [doc, chunk_index, début, fin, texte], sans indentation:
+
+    {"format": "twincat-chunks", "version": 1,
+     "documents": [{"doc_id": "docs/X.md", "stem": "X", "metadata": {...}}, ...],
+     "chunks": [[0, 0, 0, 2031, "..."], ...]}
+
+ChunkStore recrée à la demande le dict de l'ancien format pour un chunk donné.
+Si le fichier porte `"texts": "texts.json"`, les textes sont absents des lignes
+(null) et lus à la demande dans le magasin de textes (text_store.py).
+Les chunks découpés par sections (--structure) ajoutent à leur ligne
+[page, page_end, section].
+"""
+import os
+import json
+import textwrap
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+from text_store import HEADER_FILE, TextStore, temp_path
+
+COMPACT_FILE = 'chunks.compact.json'
+LEGACY_FILE = 'chunks.json'
+FORMAT_NAME = 'twincat-chunks'
+FORMAT_VERSION = 1
+# Colonnes optionnelles après le texte (découpage par sections)
+PROVENANCE_FIELDS = ('page', 'page_end', 'section')
+
+
+def chunk_id(stem: str, chunk_index: int) -> str:
+    """Identifiant d'un chunk, identique à chunking.process_document"""
+    return f"{stem}_chunk_{chunk_index:04d}"
+
+
+def compact_record(chunk: Dict, doc_number: int, external_texts: bool = False) -> List:
+    """Ligne compacte d'un chunk: [doc, index, début, fin, texte (, page, page_end, section)]"""
+    record = [doc_number, chunk['chunk_index'], chunk.get('start'), chunk.get('end'),
+              None if external_texts else chunk['text']]
+    if 'section' in chunk:
+        record.extend(chunk.get(key) for key in PROVENANCE_FIELDS)
+    return record
+
+
+def record_chunk(document: Dict, record: List, text: Optional[str]) -> Dict:
+    """Dict de chunks.json d'une ligne compacte (document de la table, texte lu à part si externe)"""
+    _, chunk_index, start, end = record[:4]
+    chunk = {
+        'id': chunk_id(document['stem'], chunk_index),
+        'doc_id': document['doc_id'],
+        'chunk_index': chunk_index,
+        'start': start,
+        'end': end,
+        'text': text,
+        'metadata': document['metadata'],
+    }
+    if len(record) > 5:
+        chunk.update(zip(PROVENANCE_FIELDS, record[5:]))
+    return chunk
+
+
+def dump_record(record: List) -> str:
+    """Ligne compacte sérialisée (sans espaces, comme dans chunks.compact.json)"""
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+
+
+def write_compact(output_dir: Path, chunks: List[Dict], external_texts: bool = False) -> Path:
+    """
+    Écrit les chunks au format compact (table des documents + lignes).
+    Avec external_texts=True, les textes sont omis et renvoient au magasin de
+    textes écrit à côté (text_store.write_texts).
+    """
+    documents = []
+    doc_numbers: Dict[str, int] = {}
+    records = []
+
+    for chunk in chunks:
+        doc_id = chunk['doc_id']
+        if doc_id not in doc_numbers:
+            doc_numbers[doc_id] = len(documents)
+            documents.append({
+                'doc_id': doc_id,
+                'stem': chunk['id'].rsplit('_chunk_', 1)[0],
+                'metadata': chunk['metadata'],
+            })
+        records.append(dump_record(compact_record(chunk, doc_numbers[doc_id], external_texts)))
+
+    return write_compact_records(output_dir, documents, records, external_texts)
+
+
+def write_compact_records(output_dir: Path, documents: List[Dict], records: Iterable[str],
+                          external_texts: bool = False) -> Path:
+    """
+    Écrit chunks.compact.json à partir de la table des documents et des lignes
+    déjà sérialisées (dump_record), sans les garder toutes en mémoire.
+    Écrit à côté puis substitué: un lecteur ne voit jamais un fichier tronqué.
+    """
+    path = Path(output_dir) / COMPACT_FILE
+    with open(temp_path(path), 'w', encoding='utf-8') as f:
+        f.write(f'{{"format":{json.dumps(FORMAT_NAME)},"version":{FORMAT_VERSION},"documents":')
+        f.write(json.dumps(documents, ensure_ascii=False, separators=(',', ':')))
+        f.write(',"chunks":[')
+        for i, record in enumerate(records):
+            if i:
+                f.write(',')
+            f.write(record)
+        f.write(']')
+        if external_texts:
+            f.write(f',"texts":{json.dumps(HEADER_FILE)}')
+        f.write('}')
+    os.replace(temp_path(path), path)
+    return path
+
+
+def write_legacy(output_dir: Path, chunks: Iterable[Dict]) -> Path:
+    """
+    Écrit chunks.json (liste indentée de l'ancien format) chunk par chunk:
+    même contenu que json.dump(chunks, indent=2), sans matérialiser la liste.
+    Écrit à côté puis substitué, comme chunks.compact.json.
+    """
+    path = Path(output_dir) / LEGACY_FILE
+    with open(temp_path(path), 'w', encoding='utf-8') as f:
+        separator = '[\n'
+        for chunk in chunks:
+            f.write(separator)
+            f.write(textwrap.indent(json.dumps(chunk, ensure_ascii=False, indent=2), '  '))
+            separator = ',\n'
+        f.write('[]' if separator == '[\n' else '\n]')
+    os.replace(temp_path(path), path)
+    return path
+
+
+class ChunkStore(Sequence):
+    """
+    Séquence de chunks au format de chunks.json, reconstruits à l'accès.
+    Le dict `metadata` est partagé entre les chunks d'un même document.
+    """
+
+    def __init__(self, documents: List[Dict], records: List[List], legacy: Optional[List[Dict]] = None,
+                 texts: Optional[TextStore] = None):
+        self.documents = documents
+        self.records = records
+        self.legacy = legacy  # liste chunks.json déjà au bon format
+        self.texts = texts  # textes lus à la demande (sinon dans records)
+
+    @classmethod
+    def from_chunks(cls, chunks: List[Dict]) -> 'ChunkStore':
+        """Enveloppe une liste au format chunks.json"""
+        return cls([], [], legacy=chunks)
+
+    def __len__(self) -> int:
+        return len(self.legacy) if self.legacy is not None else len(self.records)
+
+    def __getitem__(self, index: Union[int, slice]):
+        if self.legacy is not None:
+            return self.legacy[index]
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        record = self.records[index]
+        text = self.texts[index] if self.texts is not None else record[4]
+        return record_chunk(self.documents[record[0]], record, text)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def text(self, index: int) -> str:
+        """Texte d'un chunk sans reconstruire le dict"""
+        if self.legacy is not None:
+            return self.legacy[index]['text']
+        if self.texts is not None:
+            return self.texts[index]
+        return self.records[index][4]
+
+    def close(self):
+        if self.texts is not None:
+            self.texts.close()
+
+
+def load_chunks(embeddings_dir: Path) -> ChunkStore:
+    """Charge chunks.compact.json si présent, sinon chunks.json"""
+    embeddings_dir = Path(embeddings_dir)
+    compact_path = embeddings_dir / COMPACT_FILE
+    if compact_path.exists():
+        with open(compact_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('format') != FORMAT_NAME or data.get('version') != FORMAT_VERSION:
+            raise ValueError(f"{compact_path}: format de chunks inconnu")
+        texts = None
+        if data.get('texts'):
+            texts = TextStore(embeddings_dir)
+            if len(texts) != len(data['chunks']):
+                raise ValueError(f"{len(texts)} textes pour {len(data['chunks'])} chunks")
+        return ChunkStore(data['documents'], data['chunks'], texts=texts)
+
+    with open(embeddings_dir / LEGACY_FILE, 'r', encoding='utf-8') as f:
+        return ChunkStore.from_chunks(json.load(f))
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Élimination des chunks dupliqués avant l'encodage.
+
+Les manuels Beckhoff répètent les mêmes pages (avant-propos, consignes de
+sécurité, marques, "Support and Service"). Deux niveaux:
+- doublons exacts: hash du texte aux espaces près;
+- quasi-doublons: MinHash sur des shingles de mots, candidats trouvés par LSH
+  (bandes de la signature), similarité de Jaccard estimée >= seuil.
+
+Le premier chunk d'un groupe (ordre des documents) est canonique; les autres
+deviennent des alias vers lui (`embeddings/aliases.json`).
+"""
+import re
+import sys
+import zlib
+import json
+import hashlib
+import argparse
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ALIASES_FILE = 'aliases.json'
+SHINGLE_BASE = np.uint64(1000003)
+
+
+def normalize_for_hash(text: str) -> str:
+    """Texte comparé: minuscules, espaces réduits"""
+    return ' '.join(text.lower().split())
+
+
+def shingle_hashes(text: str, k: int = 5, word_hashes: Dict[str, int] = None) -> np.ndarray:
+    """
+    Hashes des k-grammes de mots du texte: crc32 de chaque mot (mis en cache
+    dans word_hashes), combinés par un hash polynomial glissant.
+    """
+    cache = word_hashes if word_hashes is not None else {}
+    words = re.findall(r'\w+', text.lower())
+    for word in set(words).difference(cache):
+        cache[word] = zlib.crc32(word.encode('utf-8'))
+    hashes = np.fromiter(map(cache.__getitem__, words), dtype=np.uint64, count=len(words))
+
+    k = max(1, min(k, len(hashes)))
+    grams = np.zeros(len(hashes) - k + 1, dtype=np.uint64)
+    for j in range(k):  # débordement uint64 voulu (arithmétique modulo 2^64)
+        grams = grams * SHINGLE_BASE + hashes[j:len(hashes) - k + 1 + j]
+    return np.unique(grams)
+
+
+class MinHasher:
+    """Signatures MinHash, hachage multiply-shift: h_i(x) = (a_i * x + b_i) mod 2^64 >> 32"""
+
+    def __init__(self, num_perm: int = 128, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 1 << 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        if not len(hashes):
+            return np.zeros(len(self.a), dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            values = (hashes[:, None] * self.a + self.b) >> np.uint64(32)
+        return values.min(axis=0)
+
+
+def deduplicate(chunks: List[Dict], threshold: float = 0.85, num_perm: int = 128,
+                bands: int = 16, shingle_size: int = 5) -> Tuple[List[Dict], Dict[str, str], Dict]:
+    """
+    Retourne (chunks conservés, alias {id: id canonique}, statistiques).
+    L'ordre des chunks conservés est celui de l'entrée.
+    """
+    if num_perm % bands:
+        raise ValueError(f"num_perm ({num_perm}) doit être un multiple de bands ({bands})")
+    rows = num_perm // bands
+    hasher = MinHasher(num_perm)
+    word_hashes: Dict[str, int] = {}
+
+    exact: Dict[str, str] = {}
+    buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+    signatures: List[np.ndarray] = []
+    canonical_ids: List[str] = []
+
+    kept, aliases = [], {}
+    stats = {'chunks': len(chunks), 'exact': 0, 'near': 0, 'chars': 0, 'chars_removed': 0}
+
+    for chunk in chunks:
+        text = chunk['text']
+        stats['chars'] += len(text)
+        digest = hashlib.sha256(normalize_for_hash(text).encode('utf-8')).hexdigest()
+        if digest in exact:
+            aliases[chunk['id']] = exact[digest]
+            stats['exact'] += 1
+            stats['chars_removed'] += len(text)
+            continue
+
+        signature = hasher.signature(shingle_hashes(text, shingle_size, word_hashes))
+        keys = [signature[band * rows:(band + 1) * rows].tobytes() for band in range(bands)]
+
+        # Candidats: canoniques partageant au moins une bande
+        candidates = set()
+        for band, key in enumerate(keys):
+            candidates.update(buckets[band].get(key, ()))
+        best, best_similarity = None, threshold
+        for candidate in sorted(candidates):
+            similarity = float(np.mean(signatures[candidate] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        if best is not None:
+            aliases[chunk['id']] = canonical_ids[best]
+            exact[digest] = canonical_ids[best]
+            stats['near'] += 1
+            stats['chars_removed'] += len(text)
+            continue
+
+        number = len(signatures)
+        signatures.append(signature)
+        canonical_ids.append(chunk['id'])
+        for band, key in enumerate(keys):
+            buckets[band].setdefault(key, []).append(number)
+        exact[digest] = chunk['id']
+        kept.append(chunk)
+
+    stats['kept'] = len(kept)
+    return kept, aliases, stats
+
+
+def write_aliases(output_dir: Path, aliases: Dict[str, str], settings: Dict) -> Path:
+    """Écrit aliases.json: {paramètres..., "aliases": {id: id canonique}}"""
+    path = Path(output_dir) / ALIASES_FILE
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(dict(settings, aliases=aliases), f, ensure_ascii=False, indent=1)
+    return path
+
+
+def print_report(stats: Dict):
+    """Affiche la part de l'index retirée"""
+    removed = stats['exact'] + stats['near']
+    share = removed / stats['chunks'] * 100 if stats['chunks'] else 0.0
+    chars_share = stats['chars_removed'] / stats['chars'] * 100 if stats['chars'] else 0.0
+    print("[STATS] Déduplication:")
+    print(f"  Doublons exacts: {stats['exact']}")
+    print(f"  Quasi-doublons: {stats['near']}")
+    print(f"  Chunks retirés: {removed}/{stats['chunks']} ({share:.1f}%), texte retiré: {chars_share:.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mesure les doublons d'un index existant")
+    parser.add_argument('--embeddings', type=str, default='embeddings',
+                        help='Répertoire contenant les chunks (défaut: embeddings)')
+    parser.add_argument('--threshold', type=float, default=0.85,
+                        help='Similarité de Jaccard minimale des quasi-doublons (défaut: 0.85)')
+    args = parser.parse_args()
+
+    from chunk_store import load_chunks
+    try:
+        chunks = list(load_chunks(Path(args.embeddings)))
+    except FileNotFoundError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+    _, _, stats = deduplicate(chunks, threshold=args.threshold)
+    print_report(stats)
+
+
+if __name__ == '__main__':
+    main()
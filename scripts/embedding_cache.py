@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Cache persistant des embeddings, partagé entre les générations.
+
+Un même texte de chunk est ré-encodé à chaque reconstruction complète, à
+chaque essai de paramètres de découpage et pour chaque paragraphe répété d'un
+manuel à l'autre. Le cache (fichier SQLite, `.cache/embeddings.sqlite` par
+défaut) associe à chaque texte son vecteur float32, sous la clé
+(modèle et moteur d'encodage, normalisation, sha256 du texte): seuls les
+textes absents sont encodés.
+
+La taille est bornée: au-delà de `max_bytes`, les vecteurs utilisés le moins
+récemment sont supprimés. Les compteurs hits/misses de la session et cumulés
+sont affichés dans les statistiques de generate_embeddings.py.
+"""
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+DEFAULT_PATH = '.cache/embeddings.sqlite'
+DEFAULT_MAX_MB = 2048
+# Octets comptés par entrée en plus du vecteur (clé, colonnes, index)
+ROW_OVERHEAD = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS namespaces (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS vectors (
+    namespace INTEGER NOT NULL,
+    sha256 BLOB NOT NULL,
+    vector BLOB NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (namespace, sha256)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS vectors_last_used ON vectors (last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def namespace_key(model: str, encoder: Optional[Dict] = None, normalized: bool = True) -> str:
+    """Identité des vecteurs: modèle, moteur d'encodage (torch, onnx int8...) et normalisation"""
+    return json.dumps({'model': model, 'encoder': encoder or {'backend': 'torch'}, 'normalized': normalized},
+                      sort_keys=True)
+
+
+class EmbeddingCache:
+    """Vecteurs float32 par (espace de noms, sha256 du texte) dans une base SQLite"""
+
+    def __init__(self, path: str = DEFAULT_PATH, namespace: Optional[str] = None,
+                 max_bytes: int = DEFAULT_MAX_MB << 20, batch: int = 500):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.batch = batch  # clés par requête (limite de variables SQLite)
+        self.stats = {'lookups': 0, 'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0}
+
+        self.db = sqlite3.connect(str(self.path))
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        self.namespace = None  # sans espace de noms: inspection et éviction seulement
+        if namespace is not None:
+            self.db.execute('INSERT OR IGNORE INTO namespaces (key) VALUES (?)', (namespace,))
+            self.namespace = self.db.execute('SELECT id FROM namespaces WHERE key = ?', (namespace,)).fetchone()[0]
+        self.db.commit()
+        # Horloge des accès: une valeur par session suffit à ordonner l'éviction
+        self.clock = time.time_ns()
+
+    @staticmethod
+    def digest(text: str) -> bytes:
+        return hashlib.sha256(text.encode('utf-8')).digest()
+
+    def get_many(self, texts: Sequence[str]) -> Dict[int, np.ndarray]:
+        """Vecteurs en cache: {position dans texts: vecteur}; les hits sont marqués utilisés"""
+        digests = [self.digest(text) for text in texts]
+        positions: Dict[bytes, List[int]] = {}
+        for i, digest in enumerate(digests):
+            positions.setdefault(digest, []).append(i)
+
+        found: Dict[int, np.ndarray] = {}
+        keys = list(positions)
+        for start in range(0, len(keys), self.batch):
+            chunk = keys[start:start + self.batch]
+            rows = self.db.execute(
+                f"SELECT sha256, vector FROM vectors WHERE namespace = ? AND sha256 IN ({','.join('?' * len(chunk))})",
+                [self.namespace, *chunk]).fetchall()
+            for digest, vector in rows:
+                vector = np.frombuffer(vector, dtype='<f4')
+                for i in positions[digest]:
+                    found[i] = vector
+            self.db.executemany('UPDATE vectors SET last_used = ? WHERE namespace = ? AND sha256 = ?',
+                                [(self.clock, self.namespace, digest) for digest, _ in rows])
+        self.db.commit()
+
+        self.stats['lookups'] += len(texts)
+        self.stats['hits'] += len(found)
+        self.stats['misses'] += len(texts) - len(found)
+        self._add_counters(hits=len(found), misses=len(texts) - len(found))
+        return found
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray):
+        """Enregistre les vecteurs des textes puis applique la limite de taille"""
+        vectors = np.ascontiguousarray(vectors, dtype='<f4')
+        self.db.executemany(
+            'INSERT OR REPLACE INTO vectors (namespace, sha256, vector, last_used) VALUES (?, ?, ?, ?)',
+            [(self.namespace, self.digest(text), vector.tobytes(), self.clock) for text, vector in zip(texts, vectors)])
+        self.db.commit()
+        self.stats['stored'] += len(texts)
+        self.evict()
+
+    def size_bytes(self) -> int:
+        """Taille comptée du cache (vecteurs + surcoût fixe par entrée), tous espaces de noms"""
+        total, count = self.db.execute('SELECT COALESCE(SUM(LENGTH(vector)), 0), COUNT(*) FROM vectors').fetchone()
+        return total + count * ROW_OVERHEAD
+
+    def evict(self, target: float = 0.9):
+        """Au-delà de max_bytes, supprime les vecteurs les moins récemment utilisés jusqu'à target x max_bytes"""
+        excess = self.size_bytes() - self.max_bytes
+        if excess <= 0:
+            return
+        excess += int(self.max_bytes * (1 - target))
+        evicted = 0
+        while excess > 0:
+            rows = self.db.execute(
+                'SELECT namespace, sha256, LENGTH(vector) FROM vectors ORDER BY last_used LIMIT ?',
+                (self.batch,)).fetchall()
+            if not rows:
+                break
+            removed = []
+            for namespace, digest, size in rows:
+                removed.append((namespace, digest))
+                excess -= size + ROW_OVERHEAD
+                if excess <= 0:
+                    break
+            self.db.executemany('DELETE FROM vectors WHERE namespace = ? AND sha256 = ?', removed)
+            evicted += len(removed)
+        self.db.commit()
+        self.stats['evicted'] += evicted
+        self._add_counters(evicted=evicted)
+
+    def _add_counters(self, **values):
+        self.db.executemany(
+            'INSERT INTO counters (name, value) VALUES (?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+            list(values.items()))
+        self.db.commit()
+
+    def counters(self) -> Dict[str, int]:
+        """Compteurs cumulés depuis la création du cache"""
+        return dict(self.db.execute('SELECT name, value FROM counters').fetchall())
+
+    def entries(self) -> Dict[str, int]:
+        """Nombre de vecteurs par espace de noms"""
+        return dict(self.db.execute(
+            'SELECT n.key, COUNT(v.sha256) FROM namespaces n LEFT JOIN vectors v ON v.namespace = n.id '
+            'GROUP BY n.id').fetchall())
+
+    def close(self):
+        self.db.close()
+
+
+class CachedEncoder:
+    """
+    Encodeur (encoders.py) précédé du cache: seuls les textes absents sont
+    encodés, puis enregistrés. Les statistiques de débit de l'encodeur ne
+    comptent que les textes réellement encodés.
+    """
+
+    def __init__(self, encoder, cache: EmbeddingCache):
+        self.encoder = encoder
+        self.cache = cache
+
+    @property
+    def model(self):
+        return self.encoder.model
+
+    @property
+    def stats(self) -> Dict:
+        return self.encoder.stats
+
+    @property
+    def description(self) -> str:
+        return f"{self.encoder.description}, cache {self.cache.path}"
+
+    def encode(self, texts: Sequence[str], show_progress_bar: bool = False) -> np.ndarray:
+        texts = list(texts)
+        found = self.cache.get_many(texts)
+        missing = [i for i in range(len(texts)) if i not in found]
+        encoded = None
+        if missing:
+            # Un texte répété n'est encodé qu'une fois
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            encoded = self.encoder.encode(unique, show_progress_bar=show_progress_bar)
+            self.cache.put_many(unique, encoded)
+            rows = {text: row for row, text in enumerate(unique)}
+        dimensions = encoded.shape[1] if encoded is not None else len(next(iter(found.values()), ()))
+
+        vectors = np.empty((len(texts), dimensions), dtype=np.float32)
+        for i, vector in found.items():
+            vectors[i] = vector
+        for i in missing:
+            vectors[i] = encoded[rows[texts[i]]]
+        return vectors
+
+    def close(self):
+        self.encoder.close()
+
+
+def print_report(cache: EmbeddingCache):
+    """Affiche hits/misses de la session et l'état du cache"""
+    stats = cache.stats
+    share = stats['hits'] / stats['lookups'] * 100 if stats['lookups'] else 0.0
+    print(f"[STATS] Cache d'embeddings ({cache.path}):")
+    print(f"  Hits: {stats['hits']}/{stats['lookups']} ({share:.1f}%), misses: {stats['misses']}")
+    print(f"  Vecteurs ajoutés: {stats['stored']}, évincés: {stats['evicted']}")
+    print(f"  Taille: {cache.size_bytes() / 1024 / 1024:.1f} MB (limite {cache.max_bytes / 1024 / 1024:.0f} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspecte ou réduit le cache d'embeddings")
+    parser.add_argument('--path', type=str, default=DEFAULT_PATH,
+                        help=f'Fichier du cache (défaut: {DEFAULT_PATH})')
+    parser.add_argument('--max-mb', type=int, default=None,
+                        help='Réduit le cache à cette taille (éviction des moins récemment utilisés)')
+    parser.add_argument('--clear', action='store_true', help='Vide le cache')
+    args = parser.parse_args()
+
+    if not Path(args.path).exists():
+        print(f"[ERROR] {args.path} introuvable")
+        sys.exit(1)
+    cache = EmbeddingCache(args.path)
+    if args.clear:
+        cache.db.execute('DELETE FROM vectors')
+        cache.db.commit()
+        cache.db.execute('VACUUM')
+        print("[OK] Cache vidé")
+    elif args.max_mb is not None:
+        cache.max_bytes = args.max_mb << 20
+        cache.evict(target=1.0)
+        print(f"[OK] {cache.stats['evicted']} vecteurs évincés")
+
+    counters = cache.counters()
+    lookups = counters.get('hits', 0) + counters.get('misses', 0)
+    print(f"[STATS] Cache d'embeddings ({args.path}):")
+    print(f"  Taille: {cache.size_bytes() / 1024 / 1024:.1f} MB, fichier {Path(args.path).stat().st_size / 1024 / 1024:.1f} MB")
+    for namespace, count in cache.entries().items():
+        print(f"  {count} vecteurs: {namespace}")
+    if lookups:
+        print(f"  Hits cumulés: {counters.get('hits', 0)}/{lookups} ({counters.get('hits', 0) / lookups * 100:.1f}%), "
+              f"évincés: {counters.get('evicted', 0)}")
+    cache.close()
+
+
+if __name__ == '__main__':
+    main()
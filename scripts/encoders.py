@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Encodeurs de chunks pour generate_embeddings.py.
+
+SentenceTransformer.encode trie les textes par longueur en caractères et
+forme des lots de taille fixe: un lot de 128 mêle des textes de longueurs en
+tokens très différentes (titres courts, tables, identifiants), tous complétés
+(padding) jusqu'au plus long, et le calcul du padding est perdu.
+
+BucketedEncoder trie les textes par longueur en tokens (tronquée à la
+fenêtre du modèle) et forme des lots bornés par un budget de tokens
+(textes x longueur du plus long): beaucoup de textes courts par lot, peu de
+longs. Les vecteurs sont rendus dans l'ordre d'entrée.
+
+PoolEncoder répartit les mêmes lots sur un pool de processus CPU, chacun
+avec son propre modèle et un nombre de threads fixé: un seul processus
+PyTorch n'occupe pas tous les cœurs sur de petits lots. Les processus
+écrivent leurs lignes dans une matrice de sortie partagée (fichier mappé).
+
+Les encodeurs cumulent chunks, tokens, tokens calculés (padding inclus) et
+durée d'encodage pour le rapport de débit (tokens/s, chunks/s).
+`python encoders.py` compare les deux premiers sur un échantillon d'un index
+existant.
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from chunking import available_cores, token_lengths
+
+
+class FixedBatchEncoder:
+    """Chemin d'origine: model.encode par lots de batch_size textes"""
+
+    def __init__(self, model, batch_size: int = 128):
+        self.model = model
+        self.batch_size = batch_size
+        self.stats = {'chunks': 0, 'tokens': 0, 'padded_tokens': 0, 'batches': 0, 'seconds': 0.0}
+
+    @property
+    def description(self) -> str:
+        return f"lots fixes de {self.batch_size} textes"
+
+    def token_lengths(self, texts: Sequence[str]) -> np.ndarray:
+        """Tokens réellement encodés par texte (tronqués à la fenêtre du modèle)"""
+        return np.minimum(token_lengths(texts, self.model.tokenizer), self.model.max_seq_length)
+
+    def batches(self, texts: Sequence[str]) -> List[np.ndarray]:
+        """Lots formés par sentence-transformers: longueur en caractères décroissante"""
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        return [order[start:start + self.batch_size] for start in range(0, len(order), self.batch_size)]
+
+    def encode(self, texts: Sequence[str], show_progress_bar: bool = False) -> np.ndarray:
+        """Vecteurs normalisés (n_textes, dims), dans l'ordre de texts"""
+        texts = list(texts)
+        start = time.perf_counter()
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            show_progress_bar=show_progress_bar,
+            normalize_embeddings=True
+        ).astype(np.float32)
+        seconds = time.perf_counter() - start
+        self._count(self.token_lengths(texts), self.batches(texts), seconds)
+        return vectors
+
+    def close(self):
+        """Libère les ressources de l'encodeur (processus du pool)"""
+
+    def _count(self, lengths: np.ndarray, batches: List[np.ndarray], seconds: float):
+        self.stats['chunks'] += len(lengths)
+        self.stats['tokens'] += int(lengths.sum())
+        self.stats['padded_tokens'] += sum(len(batch) * int(lengths[batch].max()) for batch in batches)
+        self.stats['batches'] += len(batches)
+        self.stats['seconds'] += seconds
+
+
+class BucketedEncoder(FixedBatchEncoder):
+    """Lots de longueurs homogènes, taille bornée par un budget de tokens"""
+
+    def __init__(self, model, max_tokens: int = 16384, max_batch: int = 512):
+        super().__init__(model, batch_size=max_batch)
+        self.max_tokens = max_tokens
+
+    @property
+    def description(self) -> str:
+        return f"lots de {self.max_tokens} tokens triés par longueur"
+
+    def bucket(self, lengths: np.ndarray) -> List[np.ndarray]:
+        """
+        Indices des textes par lot: longueur décroissante (le lot le plus lourd
+        passe en premier), lot fermé quand textes x plus long dépasserait le budget.
+        """
+        order = np.argsort(-lengths, kind='stable')
+        batches, first = [], 0
+        for position in range(1, len(order) + 1):
+            size = position - first
+            # Trié par longueur décroissante: le plus long du lot est son premier texte
+            if position == len(order) or size >= self.batch_size or \
+                    (size + 1) * max(int(lengths[order[first]]), 1) > self.max_tokens:
+                batches.append(order[first:position])
+                first = position
+        return batches
+
+    def encode(self, texts: Sequence[str], show_progress_bar: bool = False) -> np.ndarray:
+        texts = list(texts)
+        lengths = self.token_lengths(texts)
+        batches = self.bucket(lengths)
+        progress = batches
+        if show_progress_bar:
+            from tqdm import tqdm
+            progress = tqdm(batches)
+
+        start = time.perf_counter()
+        vectors = None
+        for batch in progress:
+            encoded = self.model.encode(
+                [texts[i] for i in batch],
+                batch_size=len(batch),
+                show_progress_bar=False,
+                normalize_embeddings=True
+            )
+            if vectors is None:
+                vectors = np.empty((len(texts), encoded.shape[1]), dtype=np.float32)
+            vectors[batch] = encoded
+        self._count(lengths, batches, time.perf_counter() - start)
+        return vectors if vectors is not None else np.empty((0, 0), dtype=np.float32)
+
+
+def default_pool(cores: Optional[int] = None) -> Tuple[int, int]:
+    """
+    (processus, threads par processus) par défaut: deux threads par processus,
+    soit un cœur physique par modèle sur une machine avec hyperthreading.
+    """
+    cores = cores or available_cores()
+    workers = max(1, cores // 2)
+    return workers, max(1, cores // workers)
+
+
+# Modèle de chaque processus du pool, chargé une fois par l'initializer
+_worker_model = None
+
+
+def load_model_spec(spec: Dict, threads: int = 0):
+    """
+    Modèle décrit par spec: {'backend': 'torch', 'model': nom} ou
+    {'backend': 'onnx', 'model_dir': répertoire, 'variant': 'fp32'|'int8'}
+    """
+    if spec.get('backend') == 'onnx':
+        from onnx_backend import OnnxModel
+        return OnnxModel(spec['model_dir'], spec['variant'], threads=threads)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(spec['model'], device='cpu')
+
+
+def _init_worker(spec: Dict, threads: int):
+    global _worker_model
+    # Avant le premier calcul: OpenMP/MKL lisent ces variables à l'initialisation
+    for variable in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[variable] = str(threads)
+    if spec.get('backend') != 'onnx':
+        import torch
+        torch.set_num_threads(threads)
+    _worker_model = load_model_spec(spec, threads)
+
+
+def _encode_worker(output_path: str, shape: Tuple[int, int], rows: np.ndarray, texts: List[str]) -> int:
+    vectors = _worker_model.encode(texts, batch_size=len(texts), show_progress_bar=False,
+                                   normalize_embeddings=True)
+    output = np.memmap(output_path, dtype=np.float32, mode='r+', shape=shape)
+    output[rows] = vectors
+    output.flush()
+    del output
+    return len(rows)
+
+
+class PoolEncoder(BucketedEncoder):
+    """
+    Lots (fixes, ou par budget de tokens si max_tokens > 0) encodés par un pool
+    de `workers` processus CPU de `threads` threads, chacun avec le modèle
+    décrit par `spec` (load_model_spec), qui écrivent leurs lignes
+    dans une matrice de sortie partagée. Le pool est créé au premier encodage
+    et conservé jusqu'à close().
+    """
+
+    def __init__(self, model, spec: Dict, workers: int, threads: int, max_tokens: int = 0):
+        super().__init__(model, max_tokens=max_tokens)
+        if not max_tokens:
+            self.batch_size = 128
+        self.spec = spec  # modèle chargé par chaque processus (load_model_spec)
+        self.workers = workers
+        self.threads = threads
+        self._executor = None
+
+    @property
+    def description(self) -> str:
+        batches = super().description if self.max_tokens else f"lots fixes de {self.batch_size} textes"
+        return f"{batches}, {self.workers} processus x {self.threads} threads"
+
+    def encode(self, texts: Sequence[str], show_progress_bar: bool = False) -> np.ndarray:
+        texts = list(texts)
+        lengths = self.token_lengths(texts)
+        batches = self.bucket(lengths) if self.max_tokens else self.batches(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        if self._executor is None:
+            # spawn: chaque processus importe son propre PyTorch, sans état hérité du parent
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context('spawn'),
+                                                 initializer=_init_worker, initargs=(self.spec, self.threads))
+
+        shape = (len(texts), self.model.get_sentence_embedding_dimension())
+        handle, output_path = tempfile.mkstemp(suffix='.f32')
+        os.close(handle)
+        try:
+            output = np.memmap(output_path, dtype=np.float32, mode='w+', shape=shape)
+            del output
+            start = time.perf_counter()
+            futures = [self._executor.submit(_encode_worker, output_path, shape, batch, [texts[i] for i in batch])
+                       for batch in batches]
+            done = as_completed(futures)
+            if show_progress_bar:
+                from tqdm import tqdm
+                done = tqdm(done, total=len(futures))
+            for future in done:
+                future.result()
+            vectors = np.fromfile(output_path, dtype=np.float32).reshape(shape)
+            self._count(lengths, batches, time.perf_counter() - start)
+        finally:
+            os.unlink(output_path)
+        return vectors
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+def make_encoder(model, batch_tokens: int = 0, spec: Optional[Dict] = None,
+                 workers: int = 1, threads: int = 0) -> FixedBatchEncoder:
+    """
+    batch_tokens > 0: lots par budget de tokens; 0: lots fixes de 128 (chemin d'origine).
+    workers > 1: pool de processus CPU chargeant le modèle décrit par spec
+    (threads par processus: cœurs / processus par défaut).
+    """
+    if workers > 1:
+        threads = threads or max(1, available_cores() // workers)
+        return PoolEncoder(model, spec, workers, threads, max_tokens=batch_tokens)
+    return BucketedEncoder(model, max_tokens=batch_tokens) if batch_tokens > 0 else FixedBatchEncoder(model)
+
+
+def print_throughput(stats: Dict, description: str):
+    """Affiche le débit d'encodage et la part de padding"""
+    seconds = max(stats['seconds'], 1e-9)
+    padding = 1 - stats['tokens'] / stats['padded_tokens'] if stats['padded_tokens'] else 0.0
+    print(f"[STATS] Encodage ({description}):")
+    print(f"  Chunks: {stats['chunks']} en {stats['batches']} lots, {stats['seconds']:.1f} s")
+    print(f"  Débit: {stats['chunks'] / seconds:.1f} chunks/s, {stats['tokens'] / seconds:.0f} tokens/s")
+    print(f"  Padding: {padding * 100:.1f}% des {stats['padded_tokens']} tokens calculés")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare l'encodage par lots fixes et par budget de tokens")
+    parser.add_argument('--embeddings', type=str, default='embeddings',
+                        help='Répertoire contenant les chunks (défaut: embeddings)')
+    parser.add_argument('--sample', type=int, default=2000,
+                        help='Nombre de chunks encodés, tirés au hasard (défaut: 2000)')
+    parser.add_argument('--batch-tokens', type=int, default=16384,
+                        help='Budget de tokens par lot (défaut: 16384)')
+    args = parser.parse_args()
+
+    from chunk_store import load_chunks
+    from sentence_transformers import SentenceTransformer
+    try:
+        store = load_chunks(Path(args.embeddings))
+        with open(Path(args.embeddings) / 'metadata.json', 'r', encoding='utf-8') as f:
+            model_name = json.load(f)['model']
+    except FileNotFoundError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+    rows = np.random.default_rng(0).permutation(len(store))[:args.sample]
+    texts = [store.text(int(row)) for row in rows]
+    model = SentenceTransformer(model_name)
+
+    results = []
+    for encoder in (FixedBatchEncoder(model), BucketedEncoder(model, max_tokens=args.batch_tokens)):
+        results.append(encoder.encode(texts))
+        print_throughput(encoder.stats, encoder.description)
+    agreement = np.sum(results[0] * results[1], axis=1)
+    print(f"[STATS] Cosinus entre les deux encodages: min {agreement.min():.6f}, moyen {agreement.mean():.6f}")
+
+
+if __name__ == '__main__':
+    main()
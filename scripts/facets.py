@@ -0,0 +1,121 @@
+"""
+Index inversé des facettes du frontmatter (category, product, language,
+document_type, tags) pour pré-filtrer la recherche.
+
+Chaque valeur de facette a sa liste triée de lignes (postings). Un filtre est
+résolu par intersection des listes avant le scoring: une requête filtrée ne
+touche que les lignes correspondantes et remplit toujours ses top_k.
+
+Fichier produit: `embeddings/facets.npz` (postings concaténés, offsets, clés).
+"""
+import itertools
+import numpy as np
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+FACETS_FILE = 'facets.npz'
+
+# Facettes à valeur unique, filtrées par égalité
+SCALAR_FACETS = ('category', 'product', 'language', 'document_type')
+# Facette multi-valuée, filtrée par "au moins un tag"
+TAG_FACET = 'tags'
+
+
+def facet_key(facet: str, value: str) -> str:
+    return f"{facet}\t{value}"
+
+
+def facet_keys(metadata: Optional[Dict]) -> List[str]:
+    """Clés des facettes présentes dans des métadonnées de document"""
+    metadata = metadata or {}
+    keys = []
+    for facet in SCALAR_FACETS:
+        value = metadata.get(facet)
+        if value is not None:
+            keys.append(facet_key(facet, str(value)))
+    keys.extend(facet_key(TAG_FACET, str(tag)) for tag in set(metadata.get(TAG_FACET) or []))
+    return keys
+
+
+class FacetIndex:
+    """Postings par (facette, valeur)"""
+
+    def __init__(self, postings: Dict[str, np.ndarray], num_rows: int):
+        self.postings = postings
+        self.num_rows = num_rows
+
+    @classmethod
+    def build(cls, chunks: List[Dict], extra: Iterable[Tuple[int, Dict]] = ()) -> 'FacetIndex':
+        """
+        Construit les postings à partir des métadonnées (frontmatter) des chunks.
+        `extra` ajoute des couples (ligne, métadonnées): une ligne canonique
+        reçoit ainsi aussi les facettes des documents de ses alias.
+        """
+        rows: Dict[str, List[int]] = {}
+        entries = itertools.chain(((row, chunk.get('metadata')) for row, chunk in enumerate(chunks)), extra)
+        for row, metadata in entries:
+            for key in facet_keys(metadata):
+                rows.setdefault(key, []).append(row)
+
+        postings = {key: np.unique(np.asarray(values, dtype=np.int32)) for key, values in rows.items()}
+        return cls(postings, len(chunks))
+
+    @classmethod
+    def build_ranges(cls, documents: Iterable[Tuple[int, int, Dict]], num_rows: int) -> 'FacetIndex':
+        """
+        Postings à partir de plages de lignes consécutives (première ligne,
+        nombre de lignes, métadonnées), une par document: génération en flux,
+        sans les chunks en mémoire.
+        """
+        ranges: Dict[str, List[np.ndarray]] = {}
+        for start, count, metadata in documents:
+            for key in facet_keys(metadata):
+                ranges.setdefault(key, []).append(np.arange(start, start + count, dtype=np.int32))
+        return cls({key: np.concatenate(values) for key, values in ranges.items()}, num_rows)
+
+    def save(self, output_dir: Path) -> Path:
+        keys = sorted(self.postings)
+        lengths = [len(self.postings[key]) for key in keys]
+        path = Path(output_dir) / FACETS_FILE
+        np.savez(
+            path,
+            keys=np.asarray(keys, dtype=str),
+            offsets=np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+            postings=np.concatenate([self.postings[key] for key in keys]) if keys else np.empty(0, np.int32),
+            num_rows=np.int64(self.num_rows),
+        )
+        return path
+
+    @classmethod
+    def load(cls, output_dir: Path) -> 'FacetIndex':
+        with np.load(Path(output_dir) / FACETS_FILE) as data:
+            keys, offsets, postings = data['keys'], data['offsets'], data['postings']
+            num_rows = int(data['num_rows'])
+        return cls({str(key): postings[offsets[i]:offsets[i + 1]] for i, key in enumerate(keys)}, num_rows)
+
+    def values(self, facet: str) -> List[str]:
+        """Valeurs connues d'une facette"""
+        prefix = facet_key(facet, '')
+        return sorted(key[len(prefix):] for key in self.postings if key.startswith(prefix))
+
+    def rows(self, filters: Dict) -> Optional[np.ndarray]:
+        """
+        Lignes satisfaisant tous les filtres (ET entre facettes, OU entre tags),
+        triées. Retourne None si aucun filtre n'est actif.
+        """
+        selected = None
+        empty = np.empty(0, dtype=np.int32)
+
+        for facet in SCALAR_FACETS:
+            value = filters.get(facet)
+            if value:
+                postings = self.postings.get(facet_key(facet, str(value)), empty)
+                selected = postings if selected is None else np.intersect1d(selected, postings, assume_unique=True)
+
+        tags = filters.get(TAG_FACET)
+        if tags:
+            tagged = [self.postings.get(facet_key(TAG_FACET, str(tag)), empty) for tag in tags]
+            union = np.unique(np.concatenate(tagged))
+            selected = union if selected is None else np.intersect1d(selected, union, assume_unique=True)
+
+        return selected
@@ -1,12 +1,28 @@
 #!/usr/bin/env python3
 import json
 import gzip
+import hashlib
+import argparse
 import numpy as np
 from pathlib import Path
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
-from chunking import process_document
+from chunking import HEADING_CUT, available_cores, chunk_documents, truncation_stats
+from vector_store import DTYPES, int8_params, open_vectors, vector_paths, write_vectors
+from quantization import evaluate_quantization, print_report
+import ann_index
+from facets import FacetIndex
+from lexical_index import BM25_FILE, BM25Index
+import dedup
+from chunk_store import COMPACT_FILE, load_chunks, write_compact, write_legacy
+from text_store import COMPRESSIONS, TEXTS_FILE, text_store_paths, write_texts
+from streaming import STREAM_DIR, StreamWriter
+from onnx_backend import OnnxModel
+from embedding_cache import DEFAULT_MAX_MB, CachedEncoder, EmbeddingCache, namespace_key
+from embedding_cache import DEFAULT_PATH as EMBEDDING_CACHE, print_report as print_cache_report
+from encoders import FixedBatchEncoder, default_pool, make_encoder, print_throughput
 import sys
 import io
 import os
@@ -23,14 +39,32 @@ import torch
 if not hasattr(torch.distributed, 'is_initialized'):
     torch.distributed.is_initialized = lambda: False
 
-def main():
-    print("Génération des embeddings avec GPU ROCm...")
-    
-    # 1. Charger modèle (compatible Transformers.js)
-    # Use Xenova equivalent for compatibility
-    model_name = 'sentence-transformers/all-MiniLM-L6-v2'  # 384 dims, ~90 MB
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'  # 384 dims, ~90 MB
+CHUNK_SIZE = 512
+OVERLAP = 50
+OVERLAP_TOKENS = 32
+MANIFEST_FILE = 'manifest.json'
+
+
+def load_model(backend: Optional[Dict] = None, onnx_dir: Optional[str] = None,
+               threads: int = 0) -> Tuple[Optional[SentenceTransformer], str]:
+    """
+    Charge le modèle d'embedding (compatible Transformers.js): PyTorch, ou le
+    graphe ONNX de onnx_dir si backend vaut {'backend': 'onnx', 'variant': ...}
+    """
+    model_name = MODEL_NAME
+    if backend and backend['backend'] == 'onnx':
+        print(f"[INFO] Chargement du modèle ONNX {backend['variant']} ({onnx_dir})...")
+        try:
+            model = OnnxModel(onnx_dir, backend['variant'], threads=threads)
+        except (ImportError, OSError, ValueError) as e:
+            print(f"[ERROR] Impossible de charger le modèle ONNX: {e}")
+            return None, model_name
+        print("[OK] Modèle chargé (ONNX Runtime, CPU)")
+        return model, model_name
+
     print(f"[INFO] Chargement du modèle {model_name}...")
-    
+
     try:
         model = SentenceTransformer(model_name)
         print("[OK] Modèle chargé")
@@ -43,11 +77,10 @@ def main():
             print("[OK] Modèle alternatif chargé")
         except Exception as e2:
             print(f"[ERROR] Impossible de charger le modèle: {e2}")
-            return
-    
+            return None, model_name
+
     # Vérifier si GPU disponible
     try:
-        import torch
         if torch.cuda.is_available():
             model = model.to('cuda')
             print("[OK] GPU détecté - utilisation du GPU")
@@ -56,64 +89,597 @@ def main():
     except Exception as e:
         print(f"[WARNING] Impossible de vérifier GPU: {e}")
         print("[INFO] Utilisation CPU")
-    
-    # 2. Traiter tous les documents
-    print("[INFO] Traitement des documents...")
-    docs_dir = Path('docs')
+
+    return model, model_name
+
+
+def list_documents(docs_dir: Path) -> List[Path]:
+    """Liste les documents markdown à indexer, dans un ordre stable"""
+    return sorted(p for p in docs_dir.glob('*.md') if p.name != 'INDEX.md')
+
+
+def hash_text(text: str) -> str:
+    """Hash sha256 du texte d'un chunk"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def hash_file(filepath: Path) -> str:
+    """Hash sha256 du contenu brut d'un document (frontmatter inclus)"""
+    return hashlib.sha256(filepath.read_bytes()).hexdigest()
+
+
+def load_previous_index(output_dir: Path) -> Optional[Dict]:
+    """
+    Charge l'index existant (manifest, chunks, embeddings) pour une
+    reconstruction incrémentale. Retourne None s'il est absent ou incomplet.
+    """
+    manifest_path = output_dir / MANIFEST_FILE
+    chunks_path = output_dir / 'chunks.json'
+    embeddings_path = output_dir / 'embeddings.npy.gz'
+    if not ((chunks_path.exists() or (output_dir / COMPACT_FILE).exists()) and embeddings_path.exists()):
+        return None
+
+    try:
+        if manifest_path.exists():
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        else:
+            # Index antérieur au manifest: on réutilise les vecteurs par hash
+            # de texte, tous les documents sont re-chunkés
+            with open(output_dir / 'metadata.json', 'r', encoding='utf-8') as f:
+                manifest = dict(json.load(f), normalize_embeddings=True, documents={})
+        store = load_chunks(output_dir)
+        chunks = list(store)
+        store.close()
+        if vector_paths(output_dir)[1].exists():
+            # Le fichier binaire mappé évite de décompresser tout le .npy.gz
+            embeddings, _ = open_vectors(output_dir)
+        else:
+            with gzip.open(embeddings_path, 'rb') as f:
+                embeddings = np.load(f)
+    except Exception as e:
+        print(f"[WARNING] Index existant illisible: {e}")
+        return None
+
+    if len(chunks) != len(embeddings):
+        print("[WARNING] Index existant incohérent (chunks/embeddings)")
+        return None
+
+    return {'manifest': manifest, 'chunks': chunks, 'embeddings': embeddings}
+
+
+def chunker_settings(mode: str, chunk_tokens: int = 0, overlap_tokens: int = OVERLAP_TOKENS,
+                     structure: bool = False) -> Dict:
+    """Paramètres de découpage enregistrés dans le manifest"""
+    if mode == 'tokens':
+        settings = {'mode': 'tokens', 'chunk_tokens': chunk_tokens, 'overlap_tokens': overlap_tokens}
+    else:
+        settings = {'mode': 'chars', 'chunk_size': CHUNK_SIZE, 'overlap': OVERLAP}
+    if structure:
+        settings['structure'] = True
+        settings['heading_cut'] = HEADING_CUT
+    return settings
+
+
+def backend_settings(backend: str = 'torch', variant: str = 'int8') -> Dict:
+    """Moteur d'encodage enregistré dans le manifest (les vecteurs diffèrent légèrement)"""
+    return {'backend': 'onnx', 'variant': variant} if backend == 'onnx' else {'backend': 'torch'}
+
+
+def is_compatible(manifest: Dict, chunker: Dict, backend: Optional[Dict] = None) -> bool:
+    """Vérifie que l'index existant a été produit avec les mêmes paramètres"""
+    return (
+        manifest.get('model') in (MODEL_NAME, 'all-MiniLM-L6-v2')
+        and manifest.get('chunk_size') == CHUNK_SIZE
+        and manifest.get('overlap') == OVERLAP
+        and manifest.get('chunker', chunker_settings('chars')) == chunker
+        and manifest.get('encoder', backend_settings()) == (backend or backend_settings())
+        and manifest.get('normalize_embeddings') is True
+    )
+
+
+def model_token_budget(model) -> int:
+    """Tokens de contenu par chunk: fenêtre du modèle moins les tokens spéciaux ([CLS], [SEP])"""
+    return model.max_seq_length - model.tokenizer.num_special_tokens_to_add(pair=False)
+
+
+def print_truncation(stats: Dict):
+    """Affiche la part des chunks tronqués par la fenêtre du modèle"""
+    share = stats['tokens_dropped'] / stats['tokens'] * 100 if stats['tokens'] else 0.0
+    print(f"[STATS] Troncature (fenêtre {stats['max_length']} tokens):")
+    print(f"  Chunks tronqués: {stats['truncated']}/{stats['chunks']} (max {stats['max_tokens']} tokens)")
+    print(f"  Tokens ignorés: {stats['tokens_dropped']}/{stats['tokens']} ({share:.1f}%)")
+
+
+def chunk_options(chunker: Optional[Dict], tokenizer=None) -> Dict:
+    """Arguments de chunking.process_document correspondant aux paramètres du manifest"""
+    options = {'structure': chunker.get('structure', False)} if chunker else {}
+    if tokenizer is not None:
+        options.update(tokenizer=tokenizer, chunk_tokens=chunker['chunk_tokens'],
+                       overlap_tokens=chunker['overlap_tokens'])
+    return options
+
+
+def collect_chunks(md_files: List[Path], previous: Optional[Dict], tokenizer=None,
+                   chunker: Optional[Dict] = None, workers: int = 0) -> Tuple[List[Dict], Dict, Dict]:
+    """
+    Chunke les documents sur un pool de `workers` processus (0: un par cœur).
+    En mode incrémental, les documents dont le hash n'a pas changé réutilisent
+    directement leurs chunks de l'index précédent.
+    Avec un tokenizer, le découpage suit le budget en tokens de `chunker`.
+    Retourne (chunks, manifest des documents, statistiques).
+    """
+    previous_docs = previous['manifest'].get('documents', {}) if previous else {}
+    previous_chunks: Dict[str, List[Dict]] = {}
+    if previous:
+        for chunk in previous['chunks']:
+            previous_chunks.setdefault(chunk['doc_id'], []).append(chunk)
+
     all_chunks = []
-    
-    for md_file in tqdm(list(docs_dir.glob('*.md'))):
-        if md_file.name == 'INDEX.md':
-            continue
-        chunks = process_document(md_file)
+    documents = {}
+    stats = {'unchanged': 0, 'changed': 0, 'added': 0, 'removed': 0}
+
+    # Documents réutilisables tels quels, les autres passent au pool de chunking
+    hashes = {}
+    reusable: Dict[str, List[Dict]] = {}
+    for md_file in md_files:
+        doc_id = str(md_file)
+        hashes[doc_id] = hash_file(md_file)
+        entry = previous_docs.get(doc_id)
+        # Avec --dedup, les alias ne sont pas dans l'index précédent: document re-chunké
+        if (entry and entry.get('sha256') == hashes[doc_id] and doc_id in previous_chunks
+                and len(previous_chunks[doc_id]) == len(entry.get('chunks', []))):
+            reusable[doc_id] = previous_chunks[doc_id]
+
+    options = chunk_options(chunker, tokenizer)
+    to_chunk = [md_file for md_file in md_files if str(md_file) not in reusable]
+    chunked = dict(tqdm(chunk_documents(to_chunk, workers, **options), total=len(to_chunk)))
+
+    for md_file in md_files:
+        doc_id = str(md_file)
+        doc_hash = hashes[doc_id]
+        entry = previous_docs.get(doc_id)
+        if doc_id in reusable:
+            chunks = reusable[doc_id]
+            stats['unchanged'] += 1
+        else:
+            chunks = chunked[md_file]
+            if not entry:
+                stats['added'] += 1
+            else:
+                stats['unchanged' if entry.get('sha256') == doc_hash else 'changed'] += 1
+
+        documents[doc_id] = {
+            'sha256': doc_hash,
+            'chunks': [hash_text(chunk['text']) for chunk in chunks]
+        }
         all_chunks.extend(chunks)
-    
-    print(f"[OK] {len(all_chunks)} chunks générés")
-    
-    # 3. Générer embeddings
-    print("[INFO] Génération des embeddings (batch 128)...")
-    texts = [chunk['text'] for chunk in all_chunks]
-    embeddings = model.encode(
-        texts,
-        batch_size=128,
-        show_progress_bar=True,
-        normalize_embeddings=True  # Important pour cosine similarity
-    )
-    
+
+    stats['removed'] = len(set(previous_docs) - set(documents))
+    return all_chunks, documents, stats
+
+
+def stream_chunks(md_files: List[Path], stream: StreamWriter, encoder: FixedBatchEncoder, tokenizer=None,
+                  chunker: Optional[Dict] = None, workers: int = 0, batch_chunks: int = 2048):
+    """
+    Génération en flux: les documents chunkés sont regroupés en lots d'environ
+    `batch_chunks` chunks (documents entiers), encodés puis ajoutés aux
+    fichiers de `stream` avec un point de reprise après chaque lot. Les
+    documents déjà écrits avant une interruption sont sautés.
+    """
+    hashes = {str(md_file): hash_file(md_file) for md_file in md_files}
+    if stream.open(hashes):
+        print(f"[INFO] Reprise: {len(stream.documents)} documents, {stream.rows} chunks déjà encodés")
+    done = stream.done()
+    to_chunk = [md_file for md_file in md_files if str(md_file) not in done]
+
+    def encode_batch(batch: List[Tuple[Path, Dict, List[Dict]]]):
+        texts = [chunk['text'] for _, _, chunks in batch for chunk in chunks]
+        vectors = np.empty((0, stream.dimensions), dtype=np.float32)
+        truncation = None
+        if texts:
+            truncation = truncation_stats(texts, encoder.model.tokenizer, encoder.model.max_seq_length)
+            vectors = encoder.encode(texts)
+        stream.append(batch, vectors, truncation)
+
+    # Au plus deux documents d'avance par processus: le chunking ne s'accumule
+    # pas en mémoire quand l'encodage est plus lent
+    prefetch = 2 * (workers if workers > 0 else available_cores())
+    batch, pending = [], 0
+    for md_file, chunks in tqdm(chunk_documents(to_chunk, workers, prefetch=prefetch, **chunk_options(chunker, tokenizer)),
+                                total=len(to_chunk)):
+        entry = {'sha256': hashes[str(md_file)], 'chunks': [hash_text(chunk['text']) for chunk in chunks]}
+        batch.append((md_file, entry, chunks))
+        pending += len(chunks)
+        if pending >= batch_chunks:
+            encode_batch(batch)
+            batch, pending = [], 0
+    if batch:
+        encode_batch(batch)
+
+
+def create_encoder(model, model_name: str, backend: Dict, args) -> FixedBatchEncoder:
+    """
+    Encodeur selon --batch-tokens et --encode-workers/--encode-threads,
+    précédé du cache d'embeddings sauf avec --no-embedding-cache.
+    Sans GPU (ou avec ONNX Runtime), le pool de processus CPU est utilisé par défaut.
+    """
+    workers, threads = args.encode_workers, args.encode_threads
+    if workers <= 0:
+        on_gpu = backend['backend'] == 'torch' and torch.cuda.is_available()
+        workers = 1 if on_gpu else default_pool()[0]
+    if workers <= 1 and threads and backend['backend'] == 'torch':
+        torch.set_num_threads(threads)
+    spec = dict(backend, model=model_name, model_dir=args.onnx_model)
+    encoder = make_encoder(model, args.batch_tokens, spec, workers, threads)
+    if args.no_embedding_cache:
+        return encoder
+    cache = EmbeddingCache(args.embedding_cache, namespace_key(model_name, backend, normalized=True),
+                           max_bytes=args.embedding_cache_mb << 20)
+    return CachedEncoder(encoder, cache)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Génère les embeddings de la documentation TwinCAT')
+    parser.add_argument('--docs', type=str, default='docs',
+                        help='Répertoire des documents markdown (défaut: docs)')
+    parser.add_argument('--output', type=str, default='embeddings',
+                        help='Répertoire de sortie (défaut: embeddings)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Réutilise les vecteurs des chunks inchangés et n\'encode que les nouveaux')
+    parser.add_argument('--vector-dtypes', nargs='+', default=['float32'], choices=sorted(DTYPES),
+                        help='Variantes binaires mappables des vecteurs à écrire (défaut: float32); '
+                             'int8 ajoute la quantification scalaire et son rapport recall/latence')
+    parser.add_argument('--chunks-format', choices=['legacy', 'compact', 'both'], default='both',
+                        help='chunks.json (ancien format, lu par les clients TS/JS), chunks.compact.json '
+                             '(table des documents, sans indentation) ou les deux (défaut: both)')
+    parser.add_argument('--text-store', choices=['off', *COMPRESSIONS], default='none',
+                        help='Textes de chunks.compact.json dans texts.bin + table d\'offsets, lus à la demande: '
+                             'none (non compressé, défaut), gzip (par blocs) ou off (textes dans le JSON)')
+    parser.add_argument('--chunker', choices=['chars', 'tokens'], default='chars',
+                        help='Découpage par caractères (4 chars = 1 token, défaut) ou par tokens '
+                             'réels du tokenizer du modèle')
+    parser.add_argument('--chunk-tokens', type=int, default=0,
+                        help='Budget de tokens par chunk avec --chunker tokens '
+                             '(défaut: fenêtre du modèle moins les tokens spéciaux)')
+    parser.add_argument('--chunk-overlap-tokens', type=int, default=OVERLAP_TOKENS,
+                        help=f'Tokens communs entre chunks consécutifs avec --chunker tokens, '
+                             f'sans effet avec --structure (défaut: {OVERLAP_TOKENS})')
+    parser.add_argument('--structure', action='store_true',
+                        help='Découpe selon les sections du manuel (numéros du sommaire), écarte les pages '
+                             'de sommaire et les pieds de page, et ajoute page/section à chaque chunk')
+    parser.add_argument('--dedup', action='store_true',
+                        help='Retire les doublons exacts et quasi-doublons (MinHash/LSH) avant l\'encodage '
+                             'et écrit leurs alias dans aliases.json')
+    parser.add_argument('--dedup-threshold', type=float, default=0.85,
+                        help='Similarité de Jaccard minimale des quasi-doublons (défaut: 0.85)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Processus de chunking (défaut: 0 = un par cœur, 1 = séquentiel)')
+    parser.add_argument('--batch-tokens', type=int, default=0,
+                        help='Lots d\'encodage triés par longueur et bornés à N tokens (padding réduit); '
+                             '0: lots fixes de 128 textes (défaut)')
+    parser.add_argument('--encode-workers', type=int, default=0,
+                        help='Processus d\'encodage CPU (défaut: 0 = un par paire de cœurs sans GPU, '
+                             '1 avec GPU; 1 = dans le processus courant)')
+    parser.add_argument('--encode-threads', type=int, default=0,
+                        help='Threads PyTorch par processus d\'encodage (défaut: cœurs / processus)')
+    parser.add_argument('--backend', choices=['torch', 'onnx'], default='torch',
+                        help='Moteur d\'encodage: PyTorch (défaut) ou ONNX Runtime sur le graphe '
+                             'des clients Transformers.js (--onnx-model)')
+    parser.add_argument('--onnx-model', type=str, default=None,
+                        help='Répertoire du modèle ONNX avec --backend onnx '
+                             '(ex: .cache/model/Xenova/all-MiniLM-L6-v2)')
+    parser.add_argument('--onnx-variant', choices=['fp32', 'int8'], default='int8',
+                        help='Graphe ONNX: int8 (quantifié, celui des clients, défaut) ou fp32')
+    parser.add_argument('--embedding-cache', type=str, default=EMBEDDING_CACHE,
+                        help=f'Cache SQLite des vecteurs par (modèle, sha256 du texte), partagé entre '
+                             f'les générations (défaut: {EMBEDDING_CACHE})')
+    parser.add_argument('--embedding-cache-mb', type=int, default=DEFAULT_MAX_MB,
+                        help=f'Taille maximale du cache, éviction des moins récemment utilisés '
+                             f'(défaut: {DEFAULT_MAX_MB})')
+    parser.add_argument('--no-embedding-cache', action='store_true',
+                        help='Encode tous les textes sans lire ni écrire le cache')
+    parser.add_argument('--stream', action='store_true',
+                        help='Génération en flux: lots chunkés, encodés et ajoutés aux fichiers de sortie '
+                             f'avec point de reprise ({STREAM_DIR}/), mémoire bornée, reprise après interruption')
+    parser.add_argument('--stream-batch', type=int, default=2048,
+                        help='Chunks par lot en mode --stream (défaut: 2048)')
+    parser.add_argument('--ivf', action='store_true',
+                        help='Construit l\'index approximatif IVF (ivf.npz) et affiche son recall/latence')
+    parser.add_argument('--ivf-lists', type=int, default=0,
+                        help='Nombre de listes IVF (défaut: 4*sqrt(nombre de chunks))')
+    args = parser.parse_args()
+    if args.stream:
+        if args.incremental or args.dedup:
+            parser.error('--stream ne se combine pas avec --incremental ni --dedup')
+        if args.chunks_format == 'legacy' or args.text_store != 'none':
+            parser.error('--stream écrit chunks.compact.json et texts.bin non compressé '
+                         '(--chunks-format compact|both, --text-store none)')
+
+    if args.backend == 'onnx' and not args.onnx_model:
+        parser.error('--backend onnx demande --onnx-model')
+    backend = backend_settings(args.backend, args.onnx_variant)
+
+    print("Génération des embeddings avec GPU ROCm...")
+    output_dir = Path(args.output)
+    generated_at = datetime.now().isoformat()
+    if not list_documents(Path(args.docs)):
+        print(f"[ERROR] Aucun document markdown dans {args.docs}")
+        sys.exit(1)
+
+    # Le découpage par tokens a besoin du tokenizer avant le chunking
+    model = None
+    tokenizer = None
+    if args.chunker == 'tokens':
+        model, model_name = load_model(backend, args.onnx_model, args.encode_threads)
+        if model is None:
+            return
+        tokenizer = model.tokenizer
+        chunk_tokens = args.chunk_tokens or model_token_budget(model)
+        chunker = chunker_settings('tokens', chunk_tokens, args.chunk_overlap_tokens, args.structure)
+        print(f"[INFO] Découpage par tokens: {chunk_tokens} tokens, overlap {args.chunk_overlap_tokens}")
+    else:
+        chunker = chunker_settings('chars', structure=args.structure)
+
+    previous = None
+    encoder = None
+    aliases, dedup_stats, alias_facets = {}, None, []
+    if args.stream:
+        # 1-3. Chunking, encodage et écriture par lots (vecteurs, textes, chunks compacts)
+        if model is None:
+            model, model_name = load_model(backend, args.onnx_model, args.encode_threads)
+            if model is None:
+                return
+        output_dir.mkdir(exist_ok=True)
+        stream = StreamWriter(output_dir, {'model': model_name, 'chunker': chunker, 'encoder': backend,
+                                           'normalize_embeddings': True})
+        encoder = create_encoder(model, model_name, backend, args)
+        print(f"[INFO] Génération en flux (lots de {args.stream_batch} chunks, {encoder.description})...")
+        try:
+            stream_chunks(list_documents(Path(args.docs)), stream, encoder, tokenizer, chunker,
+                          args.workers, args.stream_batch)
+        finally:
+            encoder.close()
+        truncation = stream.truncation
+        if not stream.rows:
+            print("[ERROR] Aucun chunk généré (documents vides)")
+            sys.exit(1)
+        # Chunks, textes, facettes et BM25 écrits depuis les fichiers du flux, sans les recharger
+        documents = stream.finish(model_name, extra={'generated_at': generated_at},
+                                  legacy=args.chunks_format == 'both')
+        num_chunks = stream.rows
+        embeddings_f32, _ = open_vectors(output_dir)
+        dimensions = embeddings_f32.shape[1]
+        print(f"[OK] {num_chunks} chunks générés")
+    else:
+        if args.incremental:
+            previous = load_previous_index(output_dir)
+            if previous is None:
+                print("[INFO] Aucun index précédent exploitable - reconstruction complète")
+            elif not is_compatible(previous['manifest'], chunker, backend):
+                print("[INFO] Paramètres modifiés depuis le dernier index - reconstruction complète")
+                previous = None
+            else:
+                print(f"[OK] Index précédent chargé ({len(previous['chunks'])} chunks)")
+
+        # 1. Traiter tous les documents
+        print("[INFO] Traitement des documents...")
+        md_files = list_documents(Path(args.docs))
+        all_chunks, documents, doc_stats = collect_chunks(md_files, previous, tokenizer, chunker, args.workers)
+
+        print(f"[OK] {len(all_chunks)} chunks générés")
+        if not all_chunks:
+            print("[ERROR] Aucun chunk généré (documents vides): index non écrit")
+            sys.exit(1)
+        if previous:
+            print(f"[INFO] Documents: {doc_stats['unchanged']} inchangés, {doc_stats['changed']} modifiés, "
+                  f"{doc_stats['added']} ajoutés, {doc_stats['removed']} supprimés")
+
+        # 1b. Doublons exacts et quasi-doublons (pages répétées d'un manuel à l'autre)
+        if args.dedup:
+            print("[INFO] Déduplication des chunks...")
+            chunked = all_chunks
+            all_chunks, aliases, dedup_stats = dedup.deduplicate(chunked, threshold=args.dedup_threshold)
+            print(f"[OK] {len(all_chunks)} chunks conservés, {len(aliases)} alias")
+            # Les facettes des documents alias pointent vers la ligne canonique
+            rows = {chunk['id']: row for row, chunk in enumerate(all_chunks)}
+            alias_facets = [(rows[aliases[chunk['id']]], chunk.get('metadata'))
+                            for chunk in chunked if chunk['id'] in aliases]
+
+        # 2. Réutiliser les vecteurs connus (clé: hash du texte du chunk)
+        chunk_hashes = [hash_text(chunk['text']) for chunk in all_chunks]
+        known_rows: Dict[str, int] = {}
+        if previous:
+            for row, chunk in enumerate(previous['chunks']):
+                known_rows.setdefault(hash_text(chunk['text']), row)
+
+        to_encode = [i for i, h in enumerate(chunk_hashes) if h not in known_rows]
+        reused = len(all_chunks) - len(to_encode)
+        if previous:
+            print(f"[INFO] Chunks: {reused} vecteurs réutilisés, {len(to_encode)} à encoder")
+
+        # 3. Générer embeddings
+        if model is None:
+            model_name = previous['manifest']['model'] if previous else MODEL_NAME
+        new_embeddings = None
+        truncation = None
+        if to_encode:
+            if model is None:
+                model, model_name = load_model(backend, args.onnx_model, args.encode_threads)
+                if model is None:
+                    return
+
+            texts = [all_chunks[i]['text'] for i in to_encode]
+            truncation = truncation_stats(texts, model.tokenizer, model.max_seq_length)
+            encoder = create_encoder(model, model_name, backend, args)
+            print(f"[INFO] Génération des embeddings ({encoder.description})...")
+            # Vecteurs normalisés: le produit scalaire est la similarité cosinus
+            try:
+                new_embeddings = encoder.encode(texts, show_progress_bar=True)
+            finally:
+                encoder.close()
+
+        if new_embeddings is not None:
+            dimensions = new_embeddings.shape[1]
+        else:
+            dimensions = previous['embeddings'].shape[1]
+
+        embeddings_f32 = np.empty((len(all_chunks), dimensions), dtype=np.float32)
+        if to_encode:
+            embeddings_f32[to_encode] = new_embeddings
+        if reused:
+            reuse_idx = [i for i, h in enumerate(chunk_hashes) if h in known_rows]
+            embeddings_f32[reuse_idx] = previous['embeddings'][[known_rows[chunk_hashes[i]] for i in reuse_idx]]
+        num_chunks = len(all_chunks)
+        if previous:
+            # Libère le memmap avant de réécrire les fichiers de vecteurs
+            previous['embeddings'] = None
+
     # 4. Sauvegarder
-    output_dir = Path('embeddings')
     output_dir.mkdir(exist_ok=True)
-    
+    quantization_report = None
+
     # 4a. Chunks JSON (métadonnées + texte)
-    print("[INFO] Sauvegarde chunks.json...")
-    with open(output_dir / 'chunks.json', 'w', encoding='utf-8') as f:
-        json.dump(all_chunks, f, ensure_ascii=False, indent=2)
-    
+    if args.stream:
+        pass  # chunks.json écrit par le flux avec --chunks-format both
+    elif args.chunks_format in ('legacy', 'both'):
+        print("[INFO] Sauvegarde chunks.json...")
+        write_legacy(output_dir, all_chunks)
+    external_texts = args.chunks_format in ('compact', 'both') and args.text_store != 'off'
+    if args.stream:
+        pass  # chunks.compact.json et texts.bin déjà écrits par le flux
+    elif args.chunks_format in ('compact', 'both'):
+        print(f"[INFO] Sauvegarde {COMPACT_FILE}...")
+        write_compact(output_dir, all_chunks, external_texts=external_texts)
+    if external_texts and not args.stream:
+        print(f"[INFO] Sauvegarde {TEXTS_FILE} ({args.text_store})...")
+        write_texts(output_dir, [chunk['text'] for chunk in all_chunks], compression=args.text_store)
+    elif not external_texts:
+        for path in text_store_paths(output_dir):
+            if path.exists():
+                path.unlink()
+    # Un fichier de chunks d'une génération précédente ne correspondrait plus aux vecteurs
+    stale = {'legacy': COMPACT_FILE, 'compact': 'chunks.json'}.get(args.chunks_format)
+    if stale and (output_dir / stale).exists():
+        (output_dir / stale).unlink()
+
     # 4b. Embeddings en Float32 compressé
     print("[INFO] Sauvegarde embeddings.npy.gz...")
-    embeddings_f32 = embeddings.astype(np.float32)
     with gzip.open(output_dir / 'embeddings.npy.gz', 'wb') as f:
         np.save(f, embeddings_f32)
-    
-    # 4c. Métadonnées
+
+    # 4c. Vecteurs binaires non compressés (memmap / tableau typé sans copie)
+    for dtype in args.vector_dtypes:
+        if args.stream and dtype == 'float32':
+            continue  # vectors.f32.bin déjà écrit par le flux
+        header = write_vectors(output_dir, embeddings_f32, model_name, dtype=dtype,
+                               extra={'generated_at': generated_at})
+        print(f"[INFO] Sauvegarde {header['file']}...")
+        if dtype == 'int8':
+            codes, _ = open_vectors(output_dir, 'int8')
+            scale, offset = int8_params(header)
+            quantization_report = evaluate_quantization(embeddings_f32, codes, scale, offset)
+    # Une variante d'une génération précédente ne correspondrait plus aux chunks
+    for dtype in DTYPES:
+        if dtype in args.vector_dtypes or (args.stream and dtype == 'float32'):
+            continue
+        for path in vector_paths(output_dir, dtype):
+            if path.exists():
+                print(f"[INFO] Suppression de {path.name} (variante non régénérée)")
+                path.unlink()
+
+    # 4d. Index approximatif IVF
+    ivf_report = None
+    if args.ivf:
+        print("[INFO] Construction de l'index IVF...")
+        index = ann_index.IVFIndex.build(embeddings_f32, n_lists=args.ivf_lists, generated_at=generated_at)
+        index.save(output_dir)
+        ivf_report = ann_index.evaluate_ivf(index, embeddings_f32, [1, 4, 8, 16, 32])
+    elif (output_dir / ann_index.IVF_FILE).exists():
+        # Des listes construites sur les vecteurs précédents ne correspondraient plus
+        print(f"[INFO] Suppression de {ann_index.IVF_FILE} (non reconstruit sans --ivf)")
+        (output_dir / ann_index.IVF_FILE).unlink()
+
+    # 4e. Postings des facettes (pré-filtrage category/product/language/document_type/tags)
+    if not args.stream:  # facets.npz déjà écrit par le flux
+        print("[INFO] Sauvegarde facets.npz...")
+        FacetIndex.build(all_chunks, alias_facets).save(output_dir)
+
+    # 4e bis. Alias des doublons retirés
+    if args.dedup:
+        print(f"[INFO] Sauvegarde {dedup.ALIASES_FILE}...")
+        dedup.write_aliases(output_dir, aliases, {'threshold': args.dedup_threshold})
+    elif (output_dir / dedup.ALIASES_FILE).exists():
+        (output_dir / dedup.ALIASES_FILE).unlink()
+
+    # 4e ter. Index lexical BM25 (identifiants, codes d'erreur, noms de blocs fonctionnels)
+    if args.stream:  # bm25.npz déjà écrit par le flux
+        bm25_terms, bm25_postings = len(stream.lexical.terms), stream.num_postings
+    else:
+        print(f"[INFO] Sauvegarde {BM25_FILE}...")
+        bm25 = BM25Index.build(chunk['text'] for chunk in all_chunks)
+        bm25.save(output_dir)
+        bm25_terms, bm25_postings = len(bm25.terms), len(bm25.rows)
+
+    # 4f. Métadonnées
     metadata = {
         'model': model_name,
-        'dimensions': embeddings.shape[1],
-        'num_chunks': len(all_chunks),
-        'chunk_size': 512,
-        'overlap': 50,
-        'generated_at': datetime.now().isoformat()
+        'dimensions': int(dimensions),
+        'num_chunks': num_chunks,
+        'chunk_size': CHUNK_SIZE,
+        'overlap': OVERLAP,
+        'chunker': chunker,
+        'encoder': backend,
+        'dedup': {'threshold': args.dedup_threshold, 'aliases': len(aliases)} if args.dedup else None,
+        'generated_at': generated_at
     }
     with open(output_dir / 'metadata.json', 'w') as f:
         json.dump(metadata, f, indent=2)
-    
+
+    # 4g. Manifest des hashes (documents et chunks) pour --incremental
+    manifest = {
+        'model': model_name,
+        'chunk_size': CHUNK_SIZE,
+        'overlap': OVERLAP,
+        'chunker': chunker,
+        'encoder': backend,
+        'normalize_embeddings': True,
+        'generated_at': generated_at,
+        'documents': documents
+    }
+    with open(output_dir / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
     # 5. Statistiques
     print("\n[STATS] Statistiques:")
-    print(f"  Chunks: {len(all_chunks)}")
-    print(f"  Dimensions: {embeddings.shape[1]}")
-    print(f"  Taille chunks.json: {(output_dir / 'chunks.json').stat().st_size / 1024 / 1024:.1f} MB")
+    print(f"  Chunks: {num_chunks}")
+    print(f"  Dimensions: {dimensions}")
+    if previous:
+        print(f"  Vecteurs réutilisés: {reused}")
+        print(f"  Vecteurs encodés: {len(to_encode)}")
+    for chunks_file in ('chunks.json', COMPACT_FILE, TEXTS_FILE):
+        if (output_dir / chunks_file).exists():
+            print(f"  Taille {chunks_file}: {(output_dir / chunks_file).stat().st_size / 1024 / 1024:.1f} MB")
     print(f"  Taille embeddings.npy.gz: {(output_dir / 'embeddings.npy.gz').stat().st_size / 1024 / 1024:.1f} MB")
-    
+    for dtype in args.vector_dtypes:
+        data_path = vector_paths(output_dir, dtype)[0]
+        print(f"  Taille {data_path.name}: {data_path.stat().st_size / 1024 / 1024:.1f} MB")
+    print(f"  Index BM25: {bm25_terms} termes, {bm25_postings} postings, "
+          f"{(output_dir / BM25_FILE).stat().st_size / 1024 / 1024:.1f} MB")
+    if dedup_stats:
+        dedup.print_report(dedup_stats)
+    if truncation:
+        print_truncation(truncation)
+    if encoder is not None and encoder.stats['chunks']:
+        print_throughput(encoder.stats, encoder.description)
+    if isinstance(encoder, CachedEncoder):
+        print_cache_report(encoder.cache)
+        encoder.cache.close()
+    if quantization_report:
+        print_report(quantization_report)
+    if ivf_report:
+        ann_index.print_report(ivf_report)
+
     print("\n[OK] Génération terminée!")
     print("[NEXT] Prochaine étape: git add embeddings/ && git commit && git push")
 
@@ -41,8 +41,14 @@ def main():
     # Define embedding files
     embedding_files = {
         'chunks': 'embeddings/chunks.json',
+        'chunks_compact': 'embeddings/chunks.compact.json',
+        'texts': 'embeddings/texts.bin',
+        'texts_index': 'embeddings/texts.idx',
+        'texts_header': 'embeddings/texts.json',
         'embeddings': 'embeddings/embeddings.npy.gz',
-        'metadata': 'embeddings/metadata.json'
+        'metadata': 'embeddings/metadata.json',
+        'vectors': 'embeddings/vectors.f32.bin',
+        'vectors_header': 'embeddings/vectors.f32.json'
     }
     
     urls = {}
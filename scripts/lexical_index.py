@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Index lexical BM25 sur les textes des chunks.
+
+La recherche sémantique retrouve mal les identifiants exacts: noms de blocs
+fonctionnels (FB_DBWrite), bibliothèques (Tc3_Database), codes d'erreur ADS
+(0x706, 1798), identifiants de paramètres (P-AXIS-00012). Le tokenizer garde
+ces identifiants entiers (minuscules), en ajoute les parties (fb, dbwrite) et
+la forme décimale des codes hexadécimaux; BM25 les pondère par rareté.
+
+Les postings sont stockés en CSR par terme: termes triés, offsets, lignes
+(int32) et fréquences (uint16), plus la longueur de chaque chunk (fichier
+compressé, lignes en écarts). Les poids BM25 de chaque posting sont calculés
+au chargement: une requête ne fait qu'un bincount sur les postings de ses
+termes.
+
+`reciprocal_rank_fusion` combine ce classement avec celui des vecteurs
+(search_engine.py --retrieval hybrid).
+
+Fichier produit: `embeddings/bm25.npz`.
+"""
+import re
+import sys
+import bisect
+import time
+import argparse
+import numpy as np
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+BM25_FILE = 'bm25.npz'
+
+# Identifiant: mots alphanumériques reliés par '_' ou '-' (FB_DBWrite, P-AXIS-00012)
+TOKEN_PATTERN = re.compile(r"[0-9A-Za-zÀ-ÖØ-öø-ÿ]+(?:[_-]+[0-9A-Za-zÀ-ÖØ-öø-ÿ]+)*")
+HEX_PATTERN = re.compile(r"0x([0-9a-f]+)")
+PART_SEPARATORS = re.compile(r"[_-]+")
+# Au-delà, une fréquence n'ajoute presque rien au score BM25 (saturation par k1)
+MAX_TF = np.iinfo(np.uint16).max
+# Posting avant tri par terme (PostingCounter, fichiers de la génération en flux)
+POSTING_DTYPE = np.dtype([('term', '<i4'), ('row', '<i4'), ('tf', '<u2')])
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokens d'un texte: identifiants entiers en minuscules, puis leurs parties
+    (`fb_dbwrite` -> fb_dbwrite, fb, dbwrite) et, pour un code hexadécimal,
+    sa forme réduite et décimale (`0x00000706` -> 0x706, 1798).
+    Les tokens d'un seul caractère non numériques sont ignorés.
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if len(token) > 1 or token.isdigit():
+            tokens.append(token)
+        if '_' in token or '-' in token:
+            tokens.extend(part for part in PART_SEPARATORS.split(token) if len(part) > 1 or part.isdigit())
+        elif token.startswith('0x'):
+            hexa = HEX_PATTERN.fullmatch(token)
+            if hexa:
+                value = int(hexa.group(1), 16)
+                if f"0x{value:x}" != token:
+                    tokens.append(f"0x{value:x}")
+                tokens.append(str(value))
+    return tokens
+
+
+class PostingCounter:
+    """
+    Vocabulaire et postings (terme, ligne, tf) ajoutés lot par lot; les termes
+    sont numérotés dans leur ordre d'apparition (BM25Index.from_postings les trie).
+    """
+
+    def __init__(self, terms: Iterable[str] = ()):
+        self.terms: List[str] = list(terms)
+        self.vocabulary: Dict[str, int] = {term: i for i, term in enumerate(self.terms)}
+
+    def count(self, texts: Iterable[str], first_row: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """Postings (POSTING_DTYPE) et longueurs en tokens des textes, numérotés à partir de first_row"""
+        term_ids, rows, tfs, lengths = array('i'), array('i'), array('H'), array('i')
+        for row, text in enumerate(texts, first_row):
+            tokens = tokenize(text)
+            counts = Counter(tokens)
+            lengths.append(len(tokens))
+            for term in counts:
+                term_id = self.vocabulary.get(term)
+                if term_id is None:
+                    term_id = self.vocabulary[term] = len(self.terms)
+                    self.terms.append(term)
+                term_ids.append(term_id)
+            rows.extend([row] * len(counts))
+            tfs.extend(min(count, MAX_TF) for count in counts.values())
+
+        postings = np.empty(len(term_ids), dtype=POSTING_DTYPE)
+        if term_ids:
+            postings['term'] = np.frombuffer(term_ids, dtype=np.int32)
+            postings['row'] = np.frombuffer(rows, dtype=np.int32)
+            postings['tf'] = np.frombuffer(tfs, dtype=np.uint16)
+        return postings, np.frombuffer(lengths, dtype=np.int32).copy() if lengths else np.empty(0, np.int32)
+
+
+class BM25Index:
+    """Postings BM25 en CSR: le terme t couvre rows/tfs[offsets[t]:offsets[t + 1]]"""
+
+    def __init__(self, terms: List[str], offsets: np.ndarray, rows: np.ndarray, tfs: np.ndarray,
+                 lengths: np.ndarray, k1: float = 1.2, b: float = 0.75):
+        self.terms = terms
+        self.offsets = offsets
+        self.rows = rows
+        self.tfs = tfs
+        self.lengths = lengths
+        self.k1 = k1
+        self.b = b
+        self.weights = self._weights()
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.lengths)
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.2, b: float = 0.75) -> 'BM25Index':
+        """Construit les postings; les lignes sont les positions des textes"""
+        counter = PostingCounter()
+        postings, lengths = counter.count(texts)
+        return cls.from_postings(counter.terms, postings, lengths, k1=k1, b=b)
+
+    @classmethod
+    def from_postings(cls, terms: Sequence[str], postings: np.ndarray, lengths: np.ndarray,
+                      k1: float = 1.2, b: float = 0.75) -> 'BM25Index':
+        """
+        Index CSR à partir des postings (POSTING_DTYPE, lignes croissantes) de
+        PostingCounter; `terms` donne le terme de chaque identifiant.
+        """
+        order_ids = sorted(range(len(terms)), key=terms.__getitem__)
+        # Identifiant provisoire -> rang du terme dans l'ordre trié
+        rank = np.empty(len(terms), dtype=np.int32)
+        rank[order_ids] = np.arange(len(terms), dtype=np.int32)
+        term_ranks = rank[postings['term']]
+        # Tri stable: les lignes restent croissantes dans chaque posting
+        order = np.argsort(term_ranks, kind='stable')
+        counts = np.bincount(term_ranks, minlength=len(terms))
+        return cls(
+            [terms[i] for i in order_ids],
+            np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            np.ascontiguousarray(postings['row'][order], dtype=np.int32),
+            np.ascontiguousarray(postings['tf'][order], dtype=np.uint16),
+            np.array(lengths, dtype=np.int32),
+            k1=k1, b=b,
+        )
+
+    def _weights(self) -> np.ndarray:
+        """Poids BM25 de chaque posting: idf(t) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))"""
+        if len(self.rows) == 0:
+            return np.empty(0, dtype=np.float32)
+        document_frequency = np.diff(self.offsets)
+        idf = np.log1p((self.num_rows - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        average_length = max(float(self.lengths.mean()), 1.0)
+        norms = (self.k1 * (1 - self.b + self.b * self.lengths / average_length)).astype(np.float32)
+        # En float32 et en place: un tableau temporaire de la taille des postings au plus
+        tfs = self.tfs.astype(np.float32)
+        weights = tfs * np.float32(self.k1 + 1)
+        tfs += norms[self.rows]
+        weights /= tfs
+        weights *= np.repeat(idf, document_frequency)
+        return weights
+
+    def save(self, output_dir: Path) -> Path:
+        """
+        Sauvegarde compressée: termes en un seul bloc UTF-8 (séparés par '\n',
+        absent des tokens) et lignes en écarts au posting précédent du terme,
+        petits et très compressibles.
+        """
+        gaps = np.diff(self.rows, prepend=0).astype(np.uint32)
+        starts = self.offsets[:-1][np.diff(self.offsets) > 0]
+        gaps[starts] = self.rows[starts]
+        path = Path(output_dir) / BM25_FILE
+        np.savez_compressed(
+            path,
+            terms=np.frombuffer('\n'.join(self.terms).encode('utf-8'), dtype=np.uint8),
+            offsets=self.offsets,
+            gaps=gaps,
+            tfs=self.tfs,
+            lengths=self.lengths,
+            params=np.asarray([self.k1, self.b]),
+        )
+        return path
+
+    @classmethod
+    def load(cls, output_dir: Path) -> 'BM25Index':
+        with np.load(Path(output_dir) / BM25_FILE) as data:
+            terms = data['terms'].tobytes().decode('utf-8')
+            offsets, gaps = data['offsets'], data['gaps']
+            tfs, lengths, (k1, b) = data['tfs'], data['lengths'], data['params']
+        # Lignes: somme cumulée des écarts, remise à zéro au début de chaque terme
+        totals = np.cumsum(gaps, dtype=np.int64)
+        counts = np.diff(offsets)
+        starts = offsets[:-1][counts > 0]
+        totals -= np.repeat(totals[starts] - gaps[starts], counts[counts > 0])
+        rows = totals.astype(np.int32)
+        del totals
+        return cls(terms.split('\n') if terms else [], offsets, rows, tfs, lengths, k1=float(k1), b=float(b))
+
+    def term_slice(self, term: str) -> slice:
+        """Postings d'un terme (tranche vide si le terme est inconnu)"""
+        position = bisect.bisect_left(self.terms, term)
+        if position < len(self.terms) and self.terms[position] == term:
+            return slice(int(self.offsets[position]), int(self.offsets[position + 1]))
+        return slice(0, 0)
+
+    def scores(self, query: str) -> np.ndarray:
+        """Score BM25 de chaque ligne pour la requête (0 si aucun terme commun)"""
+        slices = [self.term_slice(term) for term in set(tokenize(query))]
+        if not slices:
+            return np.zeros(self.num_rows, dtype=np.float32)
+        rows = np.concatenate([self.rows[s] for s in slices])
+        weights = np.concatenate([self.weights[s] for s in slices])
+        return np.bincount(rows, weights=weights, minlength=self.num_rows).astype(np.float32)
+
+    def search(self, query: str, k: int = 10,
+               rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k BM25 d'une requête, limité aux lignes `rows` si fourni (filtres).
+        Retourne (indices, scores) des seules lignes ayant un terme commun
+        avec la requête, au plus k, par score décroissant.
+        """
+        scores = self.scores(query)
+        if rows is not None:
+            allowed = np.zeros(self.num_rows, dtype=bool)
+            allowed[rows] = True
+            scores[~allowed] = 0
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > k > 0:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        order = np.argsort(-scores[matched], kind='stable')
+        return matched[order], scores[matched[order]]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[np.ndarray], k: int = 10,
+                           constant: int = 60) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fusion RRF: score(ligne) = somme sur les classements de 1 / (constant + rang).
+    Insensible à l'échelle des scores (cosinus et BM25 ne sont pas comparables).
+    Les -1 (résultats manquants) sont ignorés. Retourne (indices, scores fusionnés).
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(int(row) for row in ranking if row >= 0):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (constant + rank + 1)
+    best = sorted(fused.items(), key=lambda item: -item[1])[:k]
+    return (np.asarray([row for row, _ in best], dtype=np.int64),
+            np.asarray([score for _, score in best], dtype=np.float32))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recherche BM25 dans les chunks (bm25.npz)')
+    parser.add_argument('query', nargs='+', help='Requête(s)')
+    parser.add_argument('--embeddings', type=str, default='embeddings',
+                        help='Répertoire des embeddings (défaut: embeddings)')
+    parser.add_argument('--top-k', type=int, default=5, help='Nombre de résultats (défaut: 5)')
+    args = parser.parse_args()
+
+    from chunk_store import load_chunks
+    embeddings_dir = Path(args.embeddings)
+    start = time.perf_counter()
+    try:
+        index = BM25Index.load(embeddings_dir)
+    except FileNotFoundError:
+        print(f"[ERROR] {embeddings_dir / BM25_FILE} introuvable (relancer generate_embeddings.py)")
+        sys.exit(1)
+    print(f"[INFO] Index chargé: {len(index.terms)} termes, {len(index.rows)} postings, "
+          f"{index.num_rows} chunks ({(time.perf_counter() - start) * 1000:.0f} ms)")
+    chunks = load_chunks(embeddings_dir)
+
+    for query in args.query:
+        start = time.perf_counter()
+        indices, scores = index.search(query, args.top_k)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"\n[QUERY] {query} ({' '.join(tokenize(query))}; {elapsed:.2f} ms)")
+        for rank, (row, score) in enumerate(zip(indices, scores), 1):
+            chunk = chunks[int(row)]
+            print(f"  {rank}. [{score:.2f}] {chunk['id']}: {chunk['text'][:140].replace(chr(10), ' ')}...")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Encodage avec ONNX Runtime, sur le graphe ONNX utilisé par les clients.
+
+Le site (gh-pages/search.js) et le serveur MCP encodent les requêtes avec
+`Xenova/all-MiniLM-L6-v2` quantifié (Transformers.js), alors que
+generate_embeddings.py utilise par défaut le modèle PyTorch: les vecteurs de
+l'index peuvent légèrement différer de ceux des requêtes. OnnxModel exécute
+le même graphe (fp32 `onnx/model.onnx` ou int8 `onnx/model_quantized.onnx`)
+depuis un répertoire local, avec la même pooling (moyenne masquée puis
+normalisation L2). Il expose l'interface de SentenceTransformer utilisée par
+le pipeline (encode, tokenizer, max_seq_length), les encodeurs de
+encoders.py fonctionnent donc sans changement.
+
+Répertoire attendu (celui du cache Transformers.js convient):
+    <dir>/tokenizer.json, tokenizer_config.json, config.json
+    <dir>/onnx/model.onnx, <dir>/onnx/model_quantized.onnx
+
+Dépendance optionnelle: `pip install onnxruntime`.
+
+`python onnx_backend.py --model-dir ...` compare les vecteurs ONNX aux
+vecteurs PyTorch sur un échantillon de chunks (accord cosinus, débit).
+"""
+import sys
+import json
+import argparse
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+VARIANTS = {
+    'fp32': 'model.onnx',
+    'int8': 'model_quantized.onnx',
+}
+# Fenêtre de sentence-transformers pour MiniLM (sentence_bert_config.json)
+DEFAULT_MAX_SEQ_LENGTH = 256
+
+
+class OnnxModel:
+    """Modèle ONNX avec l'interface de SentenceTransformer utilisée par le pipeline"""
+
+    def __init__(self, model_dir: str, variant: str = 'int8', threads: int = 0):
+        if variant not in VARIANTS:
+            raise ValueError(f"variante ONNX inconnue: {variant} (attendu: {', '.join(VARIANTS)})")
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("onnxruntime n'est pas installé (pip install onnxruntime)") from None
+        from transformers import AutoTokenizer
+
+        self.model_dir = Path(model_dir)
+        self.variant = variant
+        model_path = self.model_dir / 'onnx' / VARIANTS[variant]
+        if not model_path.exists():
+            raise FileNotFoundError(f"{model_path} introuvable")
+
+        self.tokenizer = AutoTokenizer.from_pretrained(str(self.model_dir))
+        self.max_seq_length = DEFAULT_MAX_SEQ_LENGTH
+        config_path = self.model_dir / 'sentence_bert_config.json'
+        if config_path.exists():
+            with open(config_path, 'r', encoding='utf-8') as f:
+                self.max_seq_length = json.load(f).get('max_seq_length', DEFAULT_MAX_SEQ_LENGTH)
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(str(model_path), options, providers=['CPUExecutionProvider'])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self._dimensions = None
+
+    def get_sentence_embedding_dimension(self) -> int:
+        if self._dimensions is None:
+            self._dimensions = self.encode(['dimension'], batch_size=1).shape[1]
+        return self._dimensions
+
+    def _encode_batch(self, texts: List[str], normalize: bool) -> np.ndarray:
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_seq_length,
+                                 return_tensors='np')
+        input_ids = np.asarray(encoded['input_ids'], dtype=np.int64)
+        inputs = {}
+        for name in self.input_names:
+            if name in encoded:
+                inputs[name] = np.asarray(encoded[name], dtype=np.int64)
+            elif name == 'token_type_ids':  # phrase unique: segment 0
+                inputs[name] = np.zeros_like(input_ids)
+            else:
+                raise ValueError(f"entrée ONNX non fournie par le tokenizer: {name}")
+        hidden = self.session.run(None, inputs)[0]  # last_hidden_state (lot, tokens, dims)
+        mask = np.asarray(encoded['attention_mask'], dtype=np.float32)[:, :, None]
+        vectors = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if normalize:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors.astype(np.float32)
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32, show_progress_bar: bool = False,
+               normalize_embeddings: bool = False, convert_to_numpy: bool = True) -> np.ndarray:
+        """Comme SentenceTransformer.encode: lots triés par longueur, vecteurs dans l'ordre d'entrée"""
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        starts = range(0, len(texts), batch_size)
+        if show_progress_bar:
+            from tqdm import tqdm
+            starts = tqdm(starts)
+
+        vectors = None
+        for start in starts:
+            rows = order[start:start + batch_size]
+            batch = self._encode_batch([texts[i] for i in rows], normalize_embeddings)
+            if vectors is None:
+                vectors = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+            vectors[rows] = batch
+        if vectors is None:
+            vectors = np.empty((0, 0), dtype=np.float32)
+        return vectors[0] if single else vectors
+
+
+def parity_report(reference: np.ndarray, candidate: np.ndarray) -> Dict:
+    """Accord cosinus ligne à ligne entre deux encodages normalisés du même texte"""
+    cosine = np.sum(reference * candidate, axis=1)
+    return {
+        'chunks': len(cosine),
+        'min': float(cosine.min()),
+        'mean': float(cosine.mean()),
+        'p01': float(np.percentile(cosine, 1)),
+        'below_0999': int((cosine < 0.999).sum()),
+    }
+
+
+def print_parity(report: Dict, variant: str):
+    print(f"[STATS] Accord cosinus ONNX {variant} / PyTorch ({report['chunks']} chunks):")
+    print(f"  Moyen: {report['mean']:.6f}, min: {report['min']:.6f}, 1er centile: {report['p01']:.6f}")
+    print(f"  Chunks sous 0.999: {report['below_0999']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare l'encodage ONNX Runtime au modèle PyTorch")
+    parser.add_argument('--model-dir', type=str, required=True,
+                        help='Répertoire du modèle ONNX (ex: .cache/model/Xenova/all-MiniLM-L6-v2)')
+    parser.add_argument('--variant', choices=sorted(VARIANTS), default='int8',
+                        help='Graphe ONNX: fp32 ou int8 (quantifié, celui des clients; défaut: int8)')
+    parser.add_argument('--embeddings', type=str, default='embeddings',
+                        help='Répertoire contenant les chunks (défaut: embeddings)')
+    parser.add_argument('--sample', type=int, default=1000,
+                        help='Nombre de chunks encodés, tirés au hasard (défaut: 1000)')
+    args = parser.parse_args()
+
+    from chunk_store import load_chunks
+    from encoders import FixedBatchEncoder, print_throughput
+    from sentence_transformers import SentenceTransformer
+    try:
+        store = load_chunks(Path(args.embeddings))
+        with open(Path(args.embeddings) / 'metadata.json', 'r', encoding='utf-8') as f:
+            model_name = json.load(f)['model']
+        onnx_model = OnnxModel(args.model_dir, args.variant)
+    except (FileNotFoundError, ImportError) as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+    rows = np.random.default_rng(0).permutation(len(store))[:args.sample]
+    texts = [store.text(int(row)) for row in rows]
+
+    results = []
+    for label, model in (('PyTorch', SentenceTransformer(model_name, device='cpu')),
+                         (f'ONNX {args.variant}', onnx_model)):
+        encoder = FixedBatchEncoder(model)
+        results.append(encoder.encode(texts))
+        print_throughput(encoder.stats, f"{label}, {encoder.description}")
+    print_parity(parity_report(*results), args.variant)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Recherche sur les embeddings quantifiés int8, avec re-scoring float32.
+
+Les codes int8 (vectors.i8.bin) sont 4x plus petits que la matrice float32:
+le balayage complet se fait sur les codes, puis les meilleurs candidats sont
+re-scorés avec les vecteurs float32 (vectors.f32.bin, mappé: seules les lignes
+candidates sont lues).
+"""
+import sys
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from vector_store import int8_params, open_vectors, top_k
+
+
+def search_int8(queries: np.ndarray, codes: np.ndarray, scale: np.ndarray, offset: np.ndarray,
+                float_vectors: Optional[np.ndarray] = None, k: int = 10, rescore: int = 100,
+                block_rows: int = 16384) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k par produit scalaire sur les codes int8.
+
+    score(x) = q . (offset + (code + 128) * scale) = (q * scale) . code + constante
+    Pour une ou deux requêtes, einsum lit les codes int8 directement (sans copie
+    float32 de la matrice). Au-delà, numpy n'ayant pas de GEMM int8, les codes
+    sont convertis en float32 par blocs de lignes puis multipliés via BLAS.
+    Si float_vectors est fourni, les `rescore` meilleurs candidats sont re-scorés
+    en float32 avant de garder les k premiers.
+    Retourne (indices, scores) de forme (n_requêtes, k).
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    weights = queries * scale
+    constant = queries @ (offset + 128.0 * scale)
+
+    num_rows = codes.shape[0]
+    if len(queries) <= 2:
+        scores = np.einsum('qj,ij->qi', weights, codes)
+    else:
+        scores = np.empty((len(queries), num_rows), dtype=np.float32)
+        for start in range(0, num_rows, block_rows):
+            block = np.asarray(codes[start:start + block_rows], dtype=np.float32)
+            scores[:, start:start + len(block)] = weights @ block.T
+    scores += constant[:, None]
+
+    if float_vectors is None:
+        return top_k(scores, k)
+
+    candidates, _ = top_k(scores, max(k, rescore))
+    indices = np.empty((len(queries), min(k, candidates.shape[1])), dtype=np.int64)
+    exact_scores = np.empty(indices.shape, dtype=np.float32)
+    for i, query in enumerate(queries):
+        rows = np.sort(candidates[i])  # lecture séquentielle du memmap
+        rescored = np.asarray(float_vectors[rows], dtype=np.float32) @ query
+        best, best_scores = top_k(rescored, k)
+        indices[i] = rows[best[0]]
+        exact_scores[i] = best_scores[0]
+    return indices, exact_scores
+
+
+def exact_search(queries: np.ndarray, vectors: np.ndarray, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+    """Référence: top-k exact par force brute sur les vecteurs float32"""
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    return top_k(queries @ np.asarray(vectors, dtype=np.float32).T, k)
+
+
+def sample_queries(vectors: np.ndarray, num_queries: int, seed: int = 0) -> np.ndarray:
+    """
+    Requêtes d'évaluation tirées du corpus: moyenne normalisée de deux chunks
+    aléatoires, pour ne pas retomber exactement sur un vecteur indexé.
+    """
+    rng = np.random.default_rng(seed)
+    first = rng.integers(0, len(vectors), num_queries)
+    second = rng.integers(0, len(vectors), num_queries)
+    queries = np.asarray(vectors[np.sort(first)], dtype=np.float32) + np.asarray(vectors[np.sort(second)], dtype=np.float32)
+    norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return queries / norms
+
+
+def recall_at_k(found: np.ndarray, expected: np.ndarray) -> float:
+    """Recall@k moyen: part des k voisins exacts retrouvés"""
+    hits = sum(len(set(f.tolist()) & set(e.tolist())) for f, e in zip(found, expected))
+    return hits / expected.size if expected.size else 1.0
+
+
+def evaluate_quantization(vectors: np.ndarray, codes: np.ndarray, scale: np.ndarray, offset: np.ndarray,
+                          num_queries: int = 200, k: int = 10, rescore: int = 100, seed: int = 0) -> Dict:
+    """
+    Compare la recherche int8 (avec et sans re-scoring) à la force brute float32.
+    Les latences sont mesurées requête par requête.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    queries = sample_queries(vectors, num_queries, seed)
+
+    def timed(search):
+        results = []
+        start = time.perf_counter()
+        for query in queries:
+            results.append(search(query)[0][0])
+        elapsed = time.perf_counter() - start
+        return np.array(results), elapsed * 1000 / len(queries)
+
+    expected, float_ms = timed(lambda q: exact_search(q, vectors, k))
+    int8_found, int8_ms = timed(lambda q: search_int8(q, codes, scale, offset, k=k))
+    rescored_found, rescored_ms = timed(
+        lambda q: search_int8(q, codes, scale, offset, float_vectors=vectors, k=k, rescore=rescore))
+
+    return {
+        'queries': len(queries),
+        'k': k,
+        'rescore': rescore,
+        'recall_int8': recall_at_k(int8_found, expected),
+        'recall_int8_rescored': recall_at_k(rescored_found, expected),
+        'latency_ms_float32': float_ms,
+        'latency_ms_int8': int8_ms,
+        'latency_ms_int8_rescored': rescored_ms,
+        'bytes_float32': int(vectors.nbytes),
+        'bytes_int8': int(codes.nbytes),
+    }
+
+
+def print_report(report: Dict):
+    """Affiche le rapport recall/latence"""
+    k = report['k']
+    print(f"[STATS] Quantification int8 ({report['queries']} requêtes, k={k}, rescore={report['rescore']}):")
+    print(f"  Taille: {report['bytes_float32'] / 1024 / 1024:.1f} MB float32 -> "
+          f"{report['bytes_int8'] / 1024 / 1024:.1f} MB int8")
+    print(f"  Recall@{k} int8: {report['recall_int8']:.4f}")
+    print(f"  Recall@{k} int8 + rescore: {report['recall_int8_rescored']:.4f}")
+    print(f"  Latence float32: {report['latency_ms_float32']:.2f} ms/requête")
+    print(f"  Latence int8: {report['latency_ms_int8']:.2f} ms/requête")
+    print(f"  Latence int8 + rescore: {report['latency_ms_int8_rescored']:.2f} ms/requête")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Évalue la recherche int8 contre la force brute float32')
+    parser.add_argument('--embeddings', type=str, default='embeddings',
+                        help='Répertoire contenant vectors.f32.* et vectors.i8.* (défaut: embeddings)')
+    parser.add_argument('--queries', type=int, default=200, help='Nombre de requêtes (défaut: 200)')
+    parser.add_argument('--top-k', type=int, default=10, help='k du recall@k (défaut: 10)')
+    parser.add_argument('--rescore', type=int, default=100,
+                        help='Candidats int8 re-scorés en float32 (défaut: 100)')
+    args = parser.parse_args()
+
+    embeddings_dir = Path(args.embeddings)
+    try:
+        vectors, _ = open_vectors(embeddings_dir, 'float32')
+        codes, header = open_vectors(embeddings_dir, 'int8')
+    except FileNotFoundError as e:
+        print(f"[ERROR] {e}")
+        print("[INFO] Générer d'abord: python generate_embeddings.py --vector-dtypes float32 int8")
+        sys.exit(1)
+
+    scale, offset = int8_params(header)
+    report = evaluate_quantization(vectors, codes, scale, offset, num_queries=args.queries,
+                                   k=args.top_k, rescore=args.rescore)
+    print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Cache des résultats de recherche pour SearchEngine (et search_server.py).
+
+Deux niveaux, sur les mêmes entrées:
+- exact: clé = requête normalisée (minuscules, espaces réduits) + filtres;
+  aucune requête répétée n'est ré-encodée ni re-scorée;
+- sémantique: une requête encodée dont le vecteur a une similarité cosinus
+  d'au moins `threshold` avec celui d'une requête en cache (mêmes filtres)
+  reprend ses résultats ("configure OPC UA server" / "OPC UA server
+  configuration"). Seulement en recherche dense: en hybride ou BM25, deux
+  requêtes proches peuvent différer par un identifiant (FB_DBWrite/FB_DBRead).
+
+Éviction LRU au-delà de `max_entries`, expiration après `ttl` secondes.
+Un cache appartient à un seul SearchEngine: celui-ci le vide quand il recharge
+un index régénéré (`generated_at` de metadata.json). search_server.py crée un
+nouveau cache avec chaque index rechargé.
+"""
+import json
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+def normalize_query(query: str) -> str:
+    return ' '.join(query.lower().split())
+
+
+def filters_key(filters: Optional[Dict]) -> str:
+    """Filtres actifs sous une forme canonique (tags triés)"""
+    active = {}
+    for field, value in (filters or {}).items():
+        if value:
+            active[field] = sorted(value) if isinstance(value, list) else value
+    return json.dumps(active, sort_keys=True)
+
+
+class ResultCache:
+    """Résultats par requête: niveau exact (dict LRU) et niveau sémantique (matrice des vecteurs requêtes)"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.stats = {'exact_hits': 0, 'semantic_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+        # clé -> {'results', 'k', 'filters', 'expires', 'slot'}
+        self.entries: OrderedDict = OrderedDict()
+        self.vectors: Optional[np.ndarray] = None  # (max_entries, dims), une ligne par slot
+        self.slot_keys: List[Optional[str]] = [None] * max_entries
+        self.free_slots = list(range(max_entries - 1, -1, -1))
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.slot_keys = [None] * self.max_entries
+        self.free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    @staticmethod
+    def key(query: str, filters: Optional[Dict]) -> str:
+        return f"{filters_key(filters)}\n{normalize_query(query)}"
+
+    def _remove(self, key: str) -> None:
+        entry = self.entries.pop(key)
+        if entry['slot'] is not None:
+            self.slot_keys[entry['slot']] = None
+            self.free_slots.append(entry['slot'])
+
+    def _usable(self, key: str, k: int) -> Optional[Dict]:
+        """Entrée non expirée avec au moins k résultats calculés"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry['expires'] < time.monotonic():
+            self._remove(key)
+            self.stats['expirations'] += 1
+            return None
+        if entry['k'] < k:
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def get(self, query: str, k: int, filters: Optional[Dict] = None) -> Optional[List[Dict]]:
+        """Niveau exact. Ne compte pas les misses: la requête peut encore toucher le niveau sémantique."""
+        entry = self._usable(self.key(query, filters), k)
+        if entry is None:
+            return None
+        self.stats['exact_hits'] += 1
+        return entry['results'][:k]
+
+    def get_similar(self, vector: np.ndarray, k: int, filters: Optional[Dict] = None) -> Optional[List[Dict]]:
+        """Niveau sémantique: résultats de la requête en cache la plus proche au-dessus du seuil"""
+        if self.vectors is not None and self.threshold <= 1.0:
+            similarities = self.vectors @ np.asarray(vector, dtype=np.float32)
+            wanted = filters_key(filters)
+            for slot in np.argsort(-similarities):
+                if similarities[slot] < self.threshold:
+                    break
+                key = self.slot_keys[slot]
+                if key is None or self.entries[key]['filters'] != wanted:
+                    continue
+                entry = self._usable(key, k)
+                if entry is not None:
+                    self.stats['semantic_hits'] += 1
+                    return entry['results'][:k]
+        return None
+
+    def miss(self, count: int = 1) -> None:
+        self.stats['misses'] += count
+
+    def put(self, query: str, k: int, filters: Optional[Dict], results: List[Dict],
+            vector: Optional[np.ndarray] = None) -> None:
+        """Enregistre les résultats (et le vecteur requête pour le niveau sémantique)"""
+        if self.max_entries <= 0:
+            return
+        key = self.key(query, filters)
+        if key in self.entries:
+            self._remove(key)
+        while len(self.entries) >= self.max_entries:
+            self._remove(next(iter(self.entries)))
+            self.stats['evictions'] += 1
+
+        slot = None
+        if vector is not None:
+            vector = np.asarray(vector, dtype=np.float32)
+            if self.vectors is None:
+                self.vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            slot = self.free_slots.pop()
+            self.vectors[slot] = vector
+            self.slot_keys[slot] = key
+        self.entries[key] = {
+            'results': list(results),
+            'k': k,
+            'filters': filters_key(filters),
+            'expires': time.monotonic() + self.ttl,
+            'slot': slot,
+        }
+
+    def metrics(self) -> Dict:
+        lookups = self.stats['exact_hits'] + self.stats['semantic_hits'] + self.stats['misses']
+        hits = self.stats['exact_hits'] + self.stats['semantic_hits']
+        return {**self.stats, 'entries': len(self.entries), 'hit_rate': hits / lookups if lookups else 0.0}
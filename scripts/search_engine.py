@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Moteur de recherche Python sur les artefacts de `embeddings/`.
+
+L'index (chunks + vecteurs) est chargé une seule fois. Les requêtes sont
+encodées par lot avec le modèle de metadata.json, puis scorées par un seul
+produit matrice-matrice et un top-k par argpartition (pas de tri complet).
+
+Modes: `exact` (force brute float32), `int8` (codes quantifiés + re-scoring)
+et `ivf` (index approximatif, nprobe réglable).
+
+Les filtres (category, product, language, document_type, tags) sont résolus
+avant le scoring via facets.npz: seules les lignes correspondantes sont
+scorées, en force brute sur ce sous-ensemble, quel que soit le mode.
+
+Recherche (`retrieval`): `dense` (vecteurs seuls), `bm25` (index lexical
+bm25.npz seul, sans encodage) ou `hybrid`: les `candidates` meilleurs
+résultats des vecteurs et de BM25 sont fusionnés par rang (RRF), ce qui
+remonte les chunks contenant exactement un identifiant de la requête.
+
+Avec `cache` (result_cache.ResultCache), les requêtes répétées ou proches
+reprennent les résultats déjà calculés.
+
+L'index est rechargé (et le cache vidé) quand `generated_at` de metadata.json
+change: la date du fichier est vérifiée au plus une fois par `reload_interval`
+secondes, au début de search_batch.
+"""
+import json
+import gzip
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from ann_index import IVFIndex
+from chunk_store import load_chunks
+from facets import FACETS_FILE, FacetIndex
+from lexical_index import BM25_FILE, BM25Index, reciprocal_rank_fusion
+from quantization import search_int8
+from result_cache import ResultCache
+from vector_store import int8_params, open_vectors, top_k, vector_paths
+
+MODES = ('exact', 'int8', 'ivf')
+RETRIEVALS = ('dense', 'hybrid', 'bm25')
+
+
+def check_vectors(header: Dict, metadata: Dict, num_chunks: int) -> None:
+    """Refuse un fichier de vecteurs d'une autre génération que les chunks"""
+    generated_at = header.get('generated_at')
+    if header['shape'][0] != num_chunks or (generated_at and generated_at != metadata.get('generated_at')):
+        raise ValueError(f"{header['file']} ({header['shape'][0]} lignes, généré le {generated_at}) "
+                         f"ne correspond pas aux chunks ({num_chunks}, générés le "
+                         f"{metadata.get('generated_at')}): relancer generate_embeddings.py "
+                         f"avec --vector-dtypes {header['dtype']}")
+
+
+class SearchEngine:
+    """Index chargé une fois, requêtes encodées et scorées par lots"""
+
+    def __init__(self, embeddings_dir: str = 'embeddings', mode: str = 'exact',
+                 encoder: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 nprobe: int = 8, rescore: int = 100, query_block: int = 256,
+                 retrieval: str = 'dense', candidates: int = 100, rrf_constant: int = 60,
+                 cache: Optional[ResultCache] = None, reload_interval: float = 1.0):
+        if mode not in MODES:
+            raise ValueError(f"mode inconnu: {mode} (attendu: {', '.join(MODES)})")
+        if retrieval not in RETRIEVALS:
+            raise ValueError(f"recherche inconnue: {retrieval} (attendu: {', '.join(RETRIEVALS)})")
+        self.embeddings_dir = Path(embeddings_dir)
+        self.mode = mode
+        self.nprobe = nprobe
+        self.rescore = rescore
+        self.query_block = query_block
+        self.retrieval = retrieval
+        self.candidates = candidates
+        self.rrf_constant = rrf_constant
+        self.cache = cache
+        self.reload_interval = reload_interval  # 0: pas de rechargement
+        self.reloads = 0
+        self._encoder = encoder
+        self._model = None
+        self._load()
+
+    def _load(self) -> None:
+        """
+        Charge metadata.json, les chunks et les vecteurs (codes int8 ou listes IVF
+        selon le mode); facettes et BM25 sont rechargés à la demande. Tout est
+        vérifié avant d'être affecté: en cas d'erreur, l'index courant reste intact.
+        """
+        metadata_path = self.embeddings_dir / 'metadata.json'
+        mtime = metadata_path.stat().st_mtime_ns
+        with open(metadata_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        chunks = load_chunks(self.embeddings_dir)
+        vectors = self._load_vectors(metadata, len(chunks))
+        if len(vectors) != len(chunks):
+            raise ValueError(f"{len(vectors)} vecteurs pour {len(chunks)} chunks")
+
+        codes = scale = offset = ivf = None
+        if self.mode == 'int8':
+            codes, header = open_vectors(self.embeddings_dir, 'int8')
+            check_vectors(header, metadata, len(chunks))
+            scale, offset = int8_params(header)
+        elif self.mode == 'ivf':
+            ivf = IVFIndex.load(self.embeddings_dir)
+            if len(ivf.ids) != len(vectors) or \
+                    (ivf.generated_at and ivf.generated_at != metadata.get('generated_at')):
+                raise ValueError("ivf.npz ne correspond pas aux vecteurs (reconstruire avec --ivf)")
+
+        if self._model is not None and metadata.get('model') != self.metadata.get('model'):
+            self._model = None
+        self.metadata, self.chunks, self.vectors = metadata, chunks, vectors
+        self.codes, self.scale, self.offset, self.ivf = codes, scale, offset, ivf
+        self._facets = None
+        self._lexical = None
+        self._mtime = mtime
+        self._checked = time.monotonic()
+
+    def check_version(self) -> bool:
+        """
+        Recharge l'index si generated_at de metadata.json a changé et vide le
+        cache. Retourne True si l'index a été rechargé.
+        """
+        now = time.monotonic()
+        if self.reload_interval <= 0 or now - self._checked < self.reload_interval:
+            return False
+        self._checked = now
+        metadata_path = self.embeddings_dir / 'metadata.json'
+        try:
+            mtime = metadata_path.stat().st_mtime_ns
+            if mtime == self._mtime:
+                return False
+            with open(metadata_path, 'r', encoding='utf-8') as f:
+                generated_at = json.load(f).get('generated_at')
+        except (OSError, ValueError):
+            return False  # absent ou en cours d'écriture: nouvel essai au prochain intervalle
+        if generated_at == self.metadata.get('generated_at'):
+            self._mtime = mtime
+            return False
+        try:
+            self._load()
+        except (OSError, ValueError) as e:
+            # generate_embeddings.py écrit metadata.json en dernier: un index incohérent le restera
+            print(f"[WARNING] Index régénéré inutilisable, index précédent conservé: {e}")
+            self._mtime = mtime
+            return False
+        if self.cache is not None:
+            self.cache.clear()
+        self.reloads += 1
+        return True
+
+    def _load_vectors(self, metadata: Dict, num_chunks: int) -> np.ndarray:
+        """Vecteurs float32: fichier binaire mappé si présent, sinon embeddings.npy.gz"""
+        if vector_paths(self.embeddings_dir)[1].exists():
+            vectors, header = open_vectors(self.embeddings_dir)
+            check_vectors(header, metadata, num_chunks)
+            return vectors
+        with gzip.open(self.embeddings_dir / 'embeddings.npy.gz', 'rb') as f:
+            return np.load(f).astype(np.float32, copy=False)
+
+    def encode(self, queries: Sequence[str]) -> np.ndarray:
+        """Encode un lot de requêtes en vecteurs normalisés (n_requêtes, dims)"""
+        if self._encoder is not None:
+            return np.atleast_2d(np.asarray(self._encoder(list(queries)), dtype=np.float32))
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.metadata['model'])
+        return self._model.encode(list(queries), batch_size=64, show_progress_bar=False,
+                                  normalize_embeddings=True).astype(np.float32)
+
+    @property
+    def facets(self) -> FacetIndex:
+        """Postings des facettes: facets.npz, ou construits depuis les chunks"""
+        if self._facets is None:
+            if (self.embeddings_dir / FACETS_FILE).exists():
+                self._facets = FacetIndex.load(self.embeddings_dir)
+            else:
+                self._facets = FacetIndex.build(self.chunks)
+        return self._facets
+
+    @property
+    def lexical(self) -> BM25Index:
+        """Index BM25: bm25.npz, ou construit depuis les textes des chunks"""
+        if self._lexical is None:
+            if (self.embeddings_dir / BM25_FILE).exists():
+                self._lexical = BM25Index.load(self.embeddings_dir)
+            else:
+                self._lexical = BM25Index.build(self.chunks.text(i) for i in range(len(self.chunks)))
+            if self._lexical.num_rows != len(self.chunks):
+                raise ValueError(f"{BM25_FILE} ne correspond pas aux chunks (relancer generate_embeddings.py)")
+        return self._lexical
+
+    def search_vectors(self, query_vectors: np.ndarray, k: int = 10,
+                       filters: Optional[Dict] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k pour un lot de vecteurs requêtes. Retourne (indices, scores) de
+        forme (n_requêtes, k); les requêtes sont traitées par blocs de query_block
+        pour borner la matrice de scores.
+        """
+        query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        rows = self.facets.rows(filters) if filters else None
+        if rows is not None:
+            # Pré-filtrage: seules les lignes retenues sont lues et scorées
+            subset = np.asarray(self.vectors[rows], dtype=np.float32)
+            indices, scores = self._by_block(query_vectors, lambda q: top_k(q @ subset.T, k))
+            return rows[indices], scores
+        if self.mode == 'int8':
+            return self._by_block(query_vectors, lambda q: search_int8(
+                q, self.codes, self.scale, self.offset, float_vectors=self.vectors, k=k, rescore=self.rescore))
+        if self.mode == 'ivf':
+            return self._by_block(query_vectors, lambda q: self.ivf.search(q, self.vectors, k=k, nprobe=self.nprobe))
+        return self._by_block(query_vectors, lambda q: top_k(q @ self.vectors.T, k))
+
+    def _by_block(self, query_vectors: np.ndarray, search) -> Tuple[np.ndarray, np.ndarray]:
+        results = [search(query_vectors[start:start + self.query_block])
+                   for start in range(0, len(query_vectors), self.query_block)]
+        return np.vstack([r[0] for r in results]), np.vstack([r[1] for r in results])
+
+    def search_lexical(self, query: str, k: int = 10,
+                       filters: Optional[Dict] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k BM25 d'une requête, limité aux lignes des filtres"""
+        rows = self.facets.rows(filters) if filters else None
+        return self.lexical.search(query, k, rows)
+
+    def results_for(self, indices: np.ndarray, scores: np.ndarray) -> List[Dict]:
+        """Chunks correspondant à une ligne de résultats, avec leur score"""
+        return [dict(self.chunks[i], score=float(s)) for i, s in zip(indices, scores) if i >= 0]
+
+    def search_batch(self, queries: Sequence[str], k: int = 10,
+                     filters: Optional[Dict] = None) -> List[List[Dict]]:
+        """Recherche plusieurs requêtes en un seul encodage et un seul produit matriciel"""
+        if not queries:
+            return []
+        self.check_version()
+        cache = self.cache
+        results: List[Optional[List[Dict]]] = [None] * len(queries)
+        if cache is not None:
+            results = [cache.get(query, k, filters) for query in queries]
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+
+        vectors = None
+        if self.retrieval != 'bm25':
+            vectors = self.encode([queries[i] for i in pending])
+            if cache is not None and self.retrieval == 'dense':
+                # Niveau sémantique: requête proche d'une requête déjà calculée
+                for row, i in enumerate(pending):
+                    results[i] = cache.get_similar(vectors[row], k, filters)
+                rows = [row for row, i in enumerate(pending) if results[i] is None]
+                pending, vectors = [pending[row] for row in rows], vectors[rows]
+        if not pending:
+            return results
+
+        computed = self._search([queries[i] for i in pending], vectors, k, filters)
+        for row, i in enumerate(pending):
+            results[i] = computed[row]
+            if cache is not None:
+                cache.put(queries[i], k, filters, computed[row], vectors[row] if vectors is not None else None)
+        if cache is not None:
+            cache.miss(len(pending))
+        return results
+
+    def _search(self, queries: List[str], query_vectors: Optional[np.ndarray], k: int,
+                filters: Optional[Dict]) -> List[List[Dict]]:
+        """Résultats calculés (sans cache); query_vectors: requêtes encodées, None en mode bm25"""
+        if self.retrieval == 'bm25':
+            return [self.results_for(*self.search_lexical(query, k, filters)) for query in queries]
+        if self.retrieval == 'dense':
+            indices, scores = self.search_vectors(query_vectors, k, filters)
+            return [self.results_for(i, s) for i, s in zip(indices, scores)]
+
+        # Hybride: fusion par rang des candidats vecteurs et BM25
+        depth = max(k, self.candidates)
+        dense_indices, _ = self.search_vectors(query_vectors, depth, filters)
+        results = []
+        for query, dense in zip(queries, dense_indices):
+            lexical, _ = self.search_lexical(query, depth, filters)
+            results.append(self.results_for(*reciprocal_rank_fusion([dense, lexical], k, self.rrf_constant)))
+        return results
+
+    def search(self, query: str, k: int = 10, filters: Optional[Dict] = None) -> List[Dict]:
+        return self.search_batch([query], k, filters)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recherche sémantique dans la documentation TwinCAT')
+    parser.add_argument('query', nargs='*', help='Requête(s) à rechercher')
+    parser.add_argument('--queries-file', type=str, default=None,
+                        help='Fichier texte, une requête par ligne (sortie JSON Lines)')
+    parser.add_argument('--embeddings', type=str, default='embeddings',
+                        help='Répertoire des embeddings (défaut: embeddings)')
+    parser.add_argument('--mode', choices=MODES, default='exact', help='Mode de recherche (défaut: exact)')
+    parser.add_argument('--top-k', type=int, default=5, help='Nombre de résultats (défaut: 5)')
+    parser.add_argument('--nprobe', type=int, default=8, help='Listes sondées en mode ivf (défaut: 8)')
+    parser.add_argument('--retrieval', choices=RETRIEVALS, default='dense',
+                        help='dense (vecteurs), bm25 (lexical) ou hybrid (fusion RRF des deux; défaut: dense)')
+    parser.add_argument('--candidates', type=int, default=100,
+                        help='Candidats de chaque classement fusionnés en mode hybrid (défaut: 100)')
+    parser.add_argument('--category', type=str, default=None, help='Filtre catégorie (ex: Communication)')
+    parser.add_argument('--product', type=str, default=None, help='Filtre produit (ex: TF6420)')
+    parser.add_argument('--language', type=str, default=None, help='Filtre langue (ex: EN)')
+    parser.add_argument('--document-type', type=str, default=None, help='Filtre type de document')
+    parser.add_argument('--tag', dest='tags', action='append', default=None,
+                        help='Filtre tag (répétable, au moins un tag doit correspondre)')
+    args = parser.parse_args()
+
+    queries = list(args.query)
+    if args.queries_file:
+        with open(args.queries_file, 'r', encoding='utf-8') as f:
+            queries.extend(line.strip() for line in f if line.strip())
+    if not queries:
+        parser.error('aucune requête')
+
+    engine = SearchEngine(args.embeddings, mode=args.mode, nprobe=args.nprobe,
+                          retrieval=args.retrieval, candidates=args.candidates)
+    filters = {
+        'category': args.category,
+        'product': args.product,
+        'language': args.language,
+        'document_type': args.document_type,
+        'tags': args.tags,
+    }
+    all_results = engine.search_batch(queries, args.top_k, filters)
+
+    if args.queries_file:
+        for query, results in zip(queries, all_results):
+            print(json.dumps({'query': query, 'results': [
+                {'id': r['id'], 'score': r['score']} for r in results]}, ensure_ascii=False))
+        return
+
+    for query, results in zip(queries, all_results):
+        print(f"\n[QUERY] {query}")
+        for rank, r in enumerate(results, 1):
+            meta = r.get('metadata') or {}
+            source = f", p. {r['page']}" if r.get('page') is not None else ''
+            source += f", {r['section']}" if r.get('section') else ''
+            print(f"  {rank}. [{r['score']:.3f}] {meta.get('title', r['doc_id'])} ({r['id']}{source})")
+            print(f"     {r['text'][:160].replace(chr(10), ' ')}...")
+
+
+if __name__ == '__main__':
+    main()
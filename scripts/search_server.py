@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Serveur de recherche asyncio: l'index reste chargé entre les requêtes.
+
+Le serveur MCP rechargeait chunks.json et les vecteurs à chaque appel d'outil.
+Ici SearchEngine est chargé une seule fois (modèle compris) et les requêtes
+concurrentes sont regroupées en micro-lots: un seul encodage et un seul
+produit matriciel par lot. Un lot part dès que `max_batch` requêtes sont en
+attente ou `max_wait_ms` après la première; pendant qu'un lot est calculé,
+les suivantes s'accumulent dans la file.
+
+HTTP/1.1 minimal (bibliothèque standard seulement), en TCP ou socket Unix:
+    POST /search   {"query": "...", "top_k": 5, "category": ..., "product": ...,
+                    "language": ..., "document_type": ..., "tags": [...]}
+    GET  /search?q=...&top_k=5&product=TF6420&tag=...
+    GET  /health   état de l'index chargé
+    GET  /metrics  requêtes, taille des lots, latences p50/p95/p99, CPU par requête,
+                   hits du cache de résultats (result_cache.py), rechargements
+
+Quand `generated_at` de metadata.json change, un nouveau SearchEngine (et un
+cache vide) est chargé dans un thread puis remplace l'ancien entre deux lots.
+
+    python search_server.py --embeddings ../embeddings --port 8765
+    python search_server.py --embeddings ../embeddings --unix /tmp/twincat-search.sock
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+from collections import deque
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from result_cache import ResultCache
+from search_engine import MODES, RETRIEVALS, SearchEngine
+
+FILTER_FIELDS = ('category', 'product', 'language', 'document_type', 'tags')
+MAX_TOP_K = 100
+MAX_BODY_BYTES = 1 << 20
+# Latences conservées pour les centiles de /metrics
+LATENCY_WINDOW = 10000
+
+
+class Pending(NamedTuple):
+    query: str
+    k: int
+    filters: Dict
+    future: asyncio.Future
+
+
+class MicroBatcher:
+    """
+    File des requêtes en attente, vidée par lots. Les requêtes d'un lot sont
+    groupées par filtres (search_batch applique les mêmes filtres à tout le lot)
+    et calculées avec le plus grand top_k du groupe.
+    """
+
+    def __init__(self, engine: SearchEngine, max_batch: int = 64, max_wait_ms: float = 2.0):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        # Un seul lot à la fois: le produit matriciel utilise déjà tous les coeurs
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='search')
+        self.queue: Optional[asyncio.Queue] = None
+        self.stats = {'queries': 0, 'batches': 0, 'max_batch': 0, 'errors': 0}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self._task = None
+
+    def start(self) -> None:
+        self.queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def search(self, query: str, k: int, filters: Dict) -> List[Dict]:
+        """Met la requête en file et attend ses résultats"""
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(Pending(query, k, filters, future))
+        try:
+            return await future
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+    async def _collect(self) -> List[Pending]:
+        """Attend une requête, puis les suivantes jusqu'à max_batch ou max_wait"""
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            self.stats['batches'] += 1
+            self.stats['queries'] += len(batch)
+            self.stats['max_batch'] = max(self.stats['max_batch'], len(batch))
+
+            groups: Dict[str, List[Pending]] = {}
+            for pending in batch:
+                groups.setdefault(json.dumps(pending.filters, sort_keys=True), []).append(pending)
+            for group in groups.values():
+                k = max(pending.k for pending in group)
+                try:
+                    results = await loop.run_in_executor(
+                        self.executor, self.engine.search_batch, [pending.query for pending in group], k,
+                        group[0].filters)
+                except Exception as e:
+                    self.stats['errors'] += len(group)
+                    for pending in group:
+                        if not pending.future.done():
+                            pending.future.set_exception(e)
+                    continue
+                for pending, result in zip(group, results):
+                    if not pending.future.done():  # client parti entre-temps
+                        pending.future.set_result(result[:pending.k])
+
+    def metrics(self) -> Dict:
+        latencies = np.asarray(self.latencies, dtype=np.float64) * 1000
+        percentiles = np.percentile(latencies, [50, 95, 99]) if len(latencies) else [0.0, 0.0, 0.0]
+        return {
+            **self.stats,
+            'mean_batch': self.stats['queries'] / self.stats['batches'] if self.stats['batches'] else 0.0,
+            'queue': self.queue.qsize() if self.queue is not None else 0,
+            'latency_ms': {
+                'p50': float(percentiles[0]),
+                'p95': float(percentiles[1]),
+                'p99': float(percentiles[2]),
+                'mean': float(latencies.mean()) if len(latencies) else 0.0,
+                'window': len(latencies),
+            },
+        }
+
+
+class RequestError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_search(params: Dict) -> Tuple[str, int, Dict]:
+    """Requête, top_k et filtres d'un corps JSON (ou des paramètres d'URL)"""
+    query = params.get('query')
+    if not isinstance(query, str) or not query.strip():
+        raise RequestError(HTTPStatus.BAD_REQUEST, "'query' doit être une chaîne non vide")
+    try:
+        k = int(params.get('top_k', 5))
+    except (TypeError, ValueError):
+        raise RequestError(HTTPStatus.BAD_REQUEST, "'top_k' doit être un entier") from None
+    if not 1 <= k <= MAX_TOP_K:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"'top_k' doit être entre 1 et {MAX_TOP_K}")
+
+    filters = {field: params.get(field) for field in FILTER_FIELDS if params.get(field)}
+    tags = filters.get('tags')
+    if tags is not None and (not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags)):
+        raise RequestError(HTTPStatus.BAD_REQUEST, "'tags' doit être une liste de chaînes")
+    return query.strip(), k, filters
+
+
+class SearchServer:
+    """Routes HTTP autour d'un MicroBatcher"""
+
+    def __init__(self, engine: SearchEngine, batcher: MicroBatcher):
+        self.engine = engine
+        self.batcher = batcher
+        self.started = time.time()
+        self.cpu_start = time.process_time()
+        self.requests = 0
+        self.reloads = 0
+
+    def swap(self, engine: SearchEngine) -> None:
+        """Sert un index rechargé. Appelé dans la boucle asyncio: le lot en cours finit sur l'ancien."""
+        self.engine = engine
+        self.batcher.engine = engine
+        self.reloads += 1
+
+    def health(self) -> Dict:
+        return {
+            'status': 'ok',
+            'chunks': len(self.engine.chunks),
+            'model': self.engine.metadata.get('model'),
+            'generated_at': self.engine.metadata.get('generated_at'),
+            'mode': self.engine.mode,
+            'retrieval': self.engine.retrieval,
+            'uptime_s': time.time() - self.started,
+        }
+
+    def metrics(self) -> Dict:
+        metrics = self.batcher.metrics()
+        cpu = time.process_time() - self.cpu_start
+        metrics.update(
+            requests=self.requests,
+            reloads=self.reloads,
+            uptime_s=time.time() - self.started,
+            cpu_s=cpu,
+            cpu_ms_per_query=cpu * 1000 / metrics['queries'] if metrics['queries'] else 0.0,
+        )
+        if self.engine.cache is not None:
+            metrics['cache'] = self.engine.cache.metrics()
+        return metrics
+
+    async def route(self, method: str, target: str, body: bytes) -> Tuple[HTTPStatus, Dict]:
+        url = urlsplit(target)
+        if url.path == '/health':
+            return HTTPStatus.OK, self.health()
+        if url.path == '/metrics':
+            return HTTPStatus.OK, self.metrics()
+        if url.path != '/search':
+            raise RequestError(HTTPStatus.NOT_FOUND, f"route inconnue: {url.path}")
+
+        if method == 'POST':
+            try:
+                params = json.loads(body or b'{}')
+            except ValueError as e:
+                raise RequestError(HTTPStatus.BAD_REQUEST, f"JSON invalide: {e}") from None
+            if not isinstance(params, dict):
+                raise RequestError(HTTPStatus.BAD_REQUEST, "le corps doit être un objet JSON")
+        elif method == 'GET':
+            values = parse_qs(url.query)
+            params = {key: value[-1] for key, value in values.items()}
+            params['query'] = params.pop('q', params.get('query'))
+            params['tags'] = values.get('tag')
+        else:
+            raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, f"méthode non supportée: {method}")
+
+        query, k, filters = parse_search(params)
+        start = time.perf_counter()
+        results = await self.batcher.search(query, k, filters)
+        return HTTPStatus.OK, {'query': query, 'results': results,
+                               'took_ms': (time.perf_counter() - start) * 1000}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Connexion HTTP/1.1, maintenue ouverte entre les requêtes (keep-alive)"""
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                self.requests += 1
+                try:
+                    status, payload = await self.route(method, target, body)
+                except RequestError as e:
+                    status, payload = e.status, {'error': str(e)}
+                except Exception as e:
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"{type(e).__name__}: {e}"}
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except RequestError as e:
+            write_response(writer, e.status, {'error': str(e)}, keep_alive=False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """Ligne de requête, en-têtes et corps (Content-Length); None si la connexion est fermée"""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, _ = line.decode('latin-1').split()
+    except ValueError:
+        raise RequestError(HTTPStatus.BAD_REQUEST, "ligne de requête invalide") from None
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length', 0) or 0)
+    if length > MAX_BODY_BYTES:
+        raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"corps limité à {MAX_BODY_BYTES} octets")
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), target, headers, body
+
+
+def write_response(writer: asyncio.StreamWriter, status: HTTPStatus, payload: Dict, keep_alive: bool) -> None:
+    # default=str: dates YAML du frontmatter (release_date)
+    body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+    head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode('latin-1') + body)
+
+
+def index_version(embeddings_dir: str) -> Tuple[Optional[int], Optional[str]]:
+    """(date de modification, generated_at) de metadata.json"""
+    path = Path(embeddings_dir) / 'metadata.json'
+    try:
+        mtime = path.stat().st_mtime_ns
+        with open(path, 'r', encoding='utf-8') as f:
+            return mtime, json.load(f).get('generated_at')
+    except (OSError, ValueError):  # absent ou en cours d'écriture
+        return None, None
+
+
+def load_engine(args, previous: Optional[SearchEngine] = None) -> SearchEngine:
+    """SearchEngine avec un cache vide; modèle, facettes et index lexical chargés avant la première requête"""
+    start = time.perf_counter()
+    cache = None
+    if args.cache_size > 0:
+        cache = ResultCache(max_entries=args.cache_size, ttl=args.cache_ttl, threshold=args.cache_threshold)
+    # Rechargement par watch_index, dans un thread à part: pas de rechargement dans le lot en cours
+    engine = SearchEngine(args.embeddings, mode=args.mode, nprobe=args.nprobe, retrieval=args.retrieval,
+                          candidates=args.candidates, cache=cache, reload_interval=0)
+    engine.facets
+    if engine.retrieval != 'bm25':
+        if previous is not None and previous._model is not None and \
+                previous.metadata.get('model') == engine.metadata.get('model'):
+            engine._model = previous._model  # même modèle: pas de second chargement
+        else:
+            engine.encode(['warm-up'])
+    if engine.retrieval != 'dense':
+        engine.lexical
+    print(f"[OK] {len(engine.chunks)} chunks chargés en {time.perf_counter() - start:.1f} s "
+          f"(mode {engine.mode}, recherche {engine.retrieval}, index du "
+          f"{engine.metadata.get('generated_at')})")
+    return engine
+
+
+async def watch_index(args, server: SearchServer) -> None:
+    """Recharge l'index quand generated_at de metadata.json change"""
+    loop = asyncio.get_running_loop()
+    mtime = None
+    while True:
+        await asyncio.sleep(args.reload_interval)
+        current, generated_at = index_version(args.embeddings)
+        if current is None or current == mtime:
+            continue
+        if generated_at == server.engine.metadata.get('generated_at'):
+            mtime = current
+            continue
+        # generate_embeddings.py écrit metadata.json après les autres fichiers de l'index
+        mtime = current
+        print(f"[INFO] Nouvel index ({generated_at}), rechargement...")
+        try:
+            engine = await loop.run_in_executor(None, load_engine, args, server.engine)
+        except Exception as e:
+            print(f"[WARNING] Rechargement impossible, index précédent conservé "
+                  f"(nouvel essai à la prochaine génération): {e}")
+            continue
+        server.swap(engine)
+
+
+async def serve(args) -> None:
+    print(f"[INFO] Chargement de l'index {args.embeddings}...")
+    engine = load_engine(args)
+
+    batcher = MicroBatcher(engine, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    batcher.start()
+    server = SearchServer(engine, batcher)
+    if args.reload_interval > 0:
+        asyncio.get_running_loop().create_task(watch_index(args, server))
+
+    if args.unix:
+        if os.path.exists(args.unix):
+            os.unlink(args.unix)  # socket d'une exécution précédente
+        listener = await asyncio.start_unix_server(server.handle, path=args.unix)
+        print(f"[OK] Serveur à l'écoute sur {args.unix}")
+    else:
+        listener = await asyncio.start_server(server.handle, args.host, args.port)
+        print(f"[OK] Serveur à l'écoute sur http://{args.host}:{args.port}")
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serveur de recherche avec index chargé et micro-lots')
+    parser.add_argument('--embeddings', type=str, default='embeddings',
+                        help='Répertoire des embeddings (défaut: embeddings)')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Adresse TCP (défaut: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='Port TCP (défaut: 8765)')
+    parser.add_argument('--unix', type=str, default=None,
+                        help='Écoute sur ce socket Unix au lieu du TCP')
+    parser.add_argument('--mode', choices=MODES, default='exact', help='Mode de recherche (défaut: exact)')
+    parser.add_argument('--nprobe', type=int, default=8, help='Listes sondées en mode ivf (défaut: 8)')
+    parser.add_argument('--retrieval', choices=RETRIEVALS, default='dense',
+                        help='dense, bm25 ou hybrid (défaut: dense)')
+    parser.add_argument('--candidates', type=int, default=100,
+                        help='Candidats fusionnés en mode hybrid (défaut: 100)')
+    parser.add_argument('--max-batch', type=int, default=64,
+                        help='Requêtes au plus par micro-lot (défaut: 64)')
+    parser.add_argument('--max-wait-ms', type=float, default=2.0,
+                        help='Attente maximale des requêtes suivantes avant un lot (défaut: 2 ms)')
+    parser.add_argument('--cache-size', type=int, default=1024,
+                        help='Requêtes gardées dans le cache de résultats (0: désactivé; défaut: 1024)')
+    parser.add_argument('--cache-ttl', type=float, default=3600.0,
+                        help='Durée de vie d\'un résultat en cache, en secondes (défaut: 3600)')
+    parser.add_argument('--cache-threshold', type=float, default=0.95,
+                        help='Similarité cosinus minimale pour reprendre les résultats d\'une requête proche '
+                             '(recherche dense; >1 désactive le niveau sémantique; défaut: 0.95)')
+    parser.add_argument('--reload-interval', type=float, default=2.0,
+                        help='Intervalle de vérification de metadata.json pour recharger un index régénéré, '
+                             'en secondes (0: désactivé; défaut: 2)')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        print("\n[INFO] Serveur arrêté")
+
+
+if __name__ == '__main__':
+    main()
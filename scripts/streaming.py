@@ -0,0 +1,280 @@
+"""
+Génération en flux (`generate_embeddings.py --stream`).
+
+Les documents passent par lots du chunking à l'encodage, puis à des fichiers
+en ajout seul dans `embeddings/.stream/`: vecteurs float32 (vectors.f32.bin),
+textes et table d'offsets (texts.bin, texts.idx), lignes compactes des
+chunks (records.jsonl, une ligne JSON par chunk) et postings BM25 non triés
+(bm25.postings, bm25.lengths, vocabulaire dans bm25.terms). Seul le lot
+courant est en mémoire, avec le vocabulaire BM25 et la table des documents.
+
+Après chaque lot, `checkpoint.json` enregistre les documents terminés et la
+taille de chaque fichier. Une génération interrompue reprend après le dernier
+lot enregistré: les fichiers sont tronqués à ces tailles (lot partiellement
+écrit) et seuls les documents restants sont traités. Le point de reprise est
+ignoré si les paramètres ou un document terminé ont changé.
+
+En fin de génération, les fichiers rejoignent `embeddings/` au format habituel
+(vectors.f32.bin + en-tête, texts.bin/idx/json, chunks.compact.json et, sur
+demande, chunks.json écrit chunk par chunk). bm25.npz est trié depuis les
+postings mappés et facets.npz construit depuis les plages de lignes des
+documents: aucun dict de chunk n'est rechargé.
+"""
+import os
+import json
+import shutil
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from chunk_store import compact_record, dump_record, record_chunk, write_compact_records, write_legacy
+from facets import FacetIndex
+from lexical_index import POSTING_DTYPE, BM25Index, PostingCounter
+from text_store import INDEX_FILE, TEXTS_FILE, TextStore
+from text_store import write_header as write_texts_header
+from vector_store import vector_paths
+from vector_store import write_header as write_vectors_header
+
+STREAM_DIR = '.stream'
+CHECKPOINT_FILE = 'checkpoint.json'
+RECORDS_FILE = 'records.jsonl'
+VECTORS_FILE = vector_paths(Path(), 'float32')[0].name
+POSTINGS_FILE = 'bm25.postings'
+LENGTHS_FILE = 'bm25.lengths'
+TERMS_FILE = 'bm25.terms'
+STREAM_FILES = (VECTORS_FILE, TEXTS_FILE, INDEX_FILE, RECORDS_FILE, POSTINGS_FILE, LENGTHS_FILE, TERMS_FILE)
+
+
+class AppendWriter:
+    """Fichier binaire en ajout seul, tronqué à `size` octets à l'ouverture"""
+
+    def __init__(self, path: Path, size: int = 0):
+        self.path = Path(path)
+        self._file = open(self.path, 'ab')
+        self._file.truncate(size)
+
+    def write(self, data) -> None:
+        self._file.write(data)
+
+    def sync(self) -> int:
+        """Écrit les tampons sur disque et retourne la taille du fichier"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return os.fstat(self._file.fileno()).st_size
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def map_array(path: Path, dtype) -> np.ndarray:
+    """Fichier binaire mappé en lecture (tableau vide si le fichier l'est)"""
+    if Path(path).stat().st_size == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+
+def merge_truncation(total: Optional[Dict], stats: Optional[Dict]) -> Optional[Dict]:
+    """Cumule les statistiques de troncature (chunking.truncation_stats) de deux lots"""
+    if not total or not stats:
+        return total or stats
+    merged = {key: total[key] + stats[key] for key in ('chunks', 'truncated', 'tokens', 'tokens_dropped')}
+    merged.update(max_length=stats['max_length'], max_tokens=max(total['max_tokens'], stats['max_tokens']))
+    return merged
+
+
+class StreamWriter:
+    """
+    Fichiers en ajout seul d'une génération en flux et leur point de reprise.
+    `settings` (modèle, découpage...) doit être identique pour reprendre.
+    """
+
+    def __init__(self, output_dir: Path, settings: Dict):
+        self.output_dir = Path(output_dir)
+        self.work_dir = self.output_dir / STREAM_DIR
+        self.settings = settings
+        # Documents terminés, dans l'ordre: doc_id, stem, metadata, sha256, hashes des chunks
+        self.documents: List[Dict] = []
+        self.rows = 0
+        self.dimensions = 0
+        self.truncation: Optional[Dict] = None
+        # Vocabulaire BM25 (identifiants des termes de bm25.postings)
+        self.lexical = PostingCounter()
+        self.num_postings = 0
+        self._table_size = 0  # documents ayant au moins un chunk (table de chunks.compact.json)
+        self._text_end = 0
+        self._writers: Dict[str, AppendWriter] = {}
+
+    def done(self) -> Dict[str, str]:
+        """Documents déjà écrits: {doc_id: sha256}"""
+        return {document['doc_id']: document['sha256'] for document in self.documents}
+
+    def open(self, hashes: Dict[str, str]) -> bool:
+        """
+        Ouvre les fichiers du flux. hashes: {doc_id: sha256} des documents à
+        indexer. Retourne True si un point de reprise valide a été repris,
+        False si la génération repart de zéro.
+        """
+        checkpoint = self._load_checkpoint()
+        resumed = checkpoint is not None and self._resumable(checkpoint, hashes)
+        if not resumed and self.work_dir.exists():
+            shutil.rmtree(self.work_dir)
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+
+        sizes = checkpoint['sizes'] if resumed else {}
+        if resumed:
+            self.documents = checkpoint['documents']
+            self.rows = checkpoint['rows']
+            self.dimensions = checkpoint['dimensions']
+            self.truncation = checkpoint['truncation']
+            self._table_size = sum(1 for document in self.documents if document['chunks'])
+            self._text_end = sizes[TEXTS_FILE]
+            with open(self.work_dir / TERMS_FILE, 'rb') as f:
+                terms = f.read(sizes[TERMS_FILE]).decode('utf-8')
+            self.lexical = PostingCounter(terms.split('\n')[:-1])
+            self.num_postings = sizes[POSTINGS_FILE] // POSTING_DTYPE.itemsize
+        for name in STREAM_FILES:
+            self._writers[name] = AppendWriter(self.work_dir / name, sizes.get(name, 0))
+        if not resumed:
+            # texts.idx commence par l'offset du premier texte
+            self._writers[INDEX_FILE].write(np.zeros(1, dtype='<u8').tobytes())
+        return resumed
+
+    def _load_checkpoint(self) -> Optional[Dict]:
+        path = self.work_dir / CHECKPOINT_FILE
+        if not path.exists():
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] Point de reprise illisible: {e}")
+            return None
+
+    def _resumable(self, checkpoint: Dict, hashes: Dict[str, str]) -> bool:
+        if checkpoint.get('settings') != self.settings:
+            print("[INFO] Paramètres modifiés depuis l'interruption - génération reprise de zéro")
+            return False
+        if any(hashes.get(document['doc_id']) != document['sha256'] for document in checkpoint['documents']):
+            print("[INFO] Documents modifiés depuis l'interruption - génération reprise de zéro")
+            return False
+        for name in STREAM_FILES:
+            path = self.work_dir / name
+            size = checkpoint['sizes'].get(name)
+            if size is None or not path.exists() or path.stat().st_size < size:
+                print(f"[WARNING] {path} incomplet - génération reprise de zéro")
+                return False
+        return True
+
+    def append(self, batch: List[Tuple[Path, Dict, List[Dict]]], vectors: np.ndarray,
+               truncation: Optional[Dict] = None) -> None:
+        """
+        Ajoute un lot de documents complets et leurs vecteurs, puis enregistre
+        le point de reprise. batch: (chemin, entrée du manifest, chunks);
+        vectors: une ligne par chunk, dans l'ordre du lot.
+        """
+        records, texts = [], []
+        first_term = len(self.lexical.terms)
+        postings, lengths = self.lexical.count((chunk['text'] for _, _, chunks in batch for chunk in chunks),
+                                               first_row=self.rows)
+        for filepath, entry, chunks in batch:
+            if chunks:
+                for chunk in chunks:
+                    records.append(dump_record(compact_record(chunk, self._table_size, external_texts=True)))
+                    texts.append(chunk['text'].encode('utf-8'))
+                self._table_size += 1
+            self.documents.append({
+                'doc_id': str(filepath),
+                'stem': filepath.stem,
+                'metadata': chunks[0]['metadata'] if chunks else None,
+                'sha256': entry['sha256'],
+                'chunks': entry['chunks'],
+            })
+        if len(vectors) != len(records):
+            raise ValueError(f"{len(vectors)} vecteurs pour {len(records)} chunks")
+
+        offsets = self._text_end + np.cumsum([len(data) for data in texts], dtype=np.uint64)
+        for data in texts:
+            self._writers[TEXTS_FILE].write(data)
+        self._writers[INDEX_FILE].write(offsets.astype('<u8').tobytes())
+        self._writers[RECORDS_FILE].write(''.join(record + '\n' for record in records).encode('utf-8'))
+        self._writers[POSTINGS_FILE].write(postings.tobytes())
+        self._writers[LENGTHS_FILE].write(lengths.astype('<i4').tobytes())
+        # Termes apparus dans ce lot, un par ligne ('\n' n'apparaît dans aucun token)
+        self._writers[TERMS_FILE].write(''.join(term + '\n' for term in self.lexical.terms[first_term:])
+                                        .encode('utf-8'))
+        self.num_postings += len(postings)
+        if len(vectors):
+            vectors = np.ascontiguousarray(vectors, dtype='<f4')
+            self._writers[VECTORS_FILE].write(memoryview(vectors).cast('B'))
+            self.dimensions = int(vectors.shape[1])
+
+        self._text_end = int(offsets[-1]) if len(offsets) else self._text_end
+        self.rows += len(records)
+        self.truncation = merge_truncation(self.truncation, truncation)
+        self._checkpoint()
+
+    def _checkpoint(self) -> None:
+        """Point de reprise écrit après les données (fichier temporaire puis renommage)"""
+        checkpoint = {
+            'settings': self.settings,
+            'rows': self.rows,
+            'dimensions': self.dimensions,
+            'truncation': self.truncation,
+            'sizes': {name: writer.sync() for name, writer in self._writers.items()},
+            'documents': self.documents,
+        }
+        path = self.work_dir / CHECKPOINT_FILE
+        temp_path = path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def finish(self, model: str, extra: Optional[Dict] = None, legacy: bool = False) -> Dict[str, Dict]:
+        """
+        Place les fichiers dans output_dir au format habituel (chunks.json en
+        plus si `legacy`), écrit facets.npz et bm25.npz et supprime le
+        répertoire de travail. Retourne les documents du manifest
+        ({doc_id: {'sha256', 'chunks'}}).
+        """
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+        for name in (VECTORS_FILE, TEXTS_FILE, INDEX_FILE):
+            os.replace(self.work_dir / name, self.output_dir / name)
+        write_vectors_header(self.output_dir, (self.rows, self.dimensions), model, extra=extra)
+        write_texts_header(self.output_dir, self.rows)
+
+        table = [{'doc_id': document['doc_id'], 'stem': document['stem'], 'metadata': document['metadata']}
+                 for document in self.documents if document['chunks']]
+        with open(self.work_dir / RECORDS_FILE, 'r', encoding='utf-8') as f:
+            write_compact_records(self.output_dir, table, (line.rstrip('\n') for line in f),
+                                  external_texts=True)
+        if legacy:
+            self._write_legacy(table)
+
+        # Les chunks d'un document occupent des lignes consécutives
+        ranges, start = [], 0
+        for document in self.documents:
+            ranges.append((start, len(document['chunks']), document['metadata']))
+            start += len(document['chunks'])
+        FacetIndex.build_ranges(ranges, self.rows).save(self.output_dir)
+
+        postings = map_array(self.work_dir / POSTINGS_FILE, POSTING_DTYPE)
+        lengths = map_array(self.work_dir / LENGTHS_FILE, '<i4')
+        BM25Index.from_postings(self.lexical.terms, postings, lengths).save(self.output_dir)
+        del postings, lengths
+
+        shutil.rmtree(self.work_dir)
+        return {document['doc_id']: {'sha256': document['sha256'], 'chunks': document['chunks']}
+                for document in self.documents}
+
+    def _write_legacy(self, table: List[Dict]) -> None:
+        """chunks.json chunk par chunk, depuis records.jsonl et les textes déjà en place"""
+        texts = TextStore(self.output_dir)
+        try:
+            with open(self.work_dir / RECORDS_FILE, 'r', encoding='utf-8') as f:
+                write_legacy(self.output_dir, (record_chunk(table[record[0]], record, texts[row])
+                                               for row, record in enumerate(map(json.loads, f))))
+        finally:
+            texts.close()
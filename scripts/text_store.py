@@ -0,0 +1,178 @@
+"""
+Stockage des textes de chunks avec accès direct par ligne.
+
+Les textes sont concaténés en UTF-8 dans `texts.bin`, accompagnés d'une table
+d'offsets à largeur fixe (`texts.idx`, uint64 little-endian) et d'un petit
+en-tête JSON (`texts.json`). Le lecteur mappe les deux fichiers: l'ouverture
+ne lit aucun texte, seuls les textes demandés (les top_k) sont décodés.
+
+texts.idx contient `count + 1` offsets dans le flux non compressé (le texte i
+occupe [offsets[i], offsets[i + 1])). En compression gzip, les textes sont
+regroupés par blocs de `block_texts` compressés séparément; la table est alors
+suivie des `n_blocs + 1` offsets des blocs dans texts.bin.
+
+Les trois fichiers sont écrits à côté puis substitués par os.replace, l'en-tête
+en dernier: un TextStore ouvert garde ses mappings sur les anciens inodes.
+"""
+import os
+import gzip
+import json
+import mmap
+import hashlib
+import numpy as np
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+FORMAT_NAME = 'twincat-texts'
+FORMAT_VERSION = 1
+TEXTS_FILE = 'texts.bin'
+INDEX_FILE = 'texts.idx'
+HEADER_FILE = 'texts.json'
+COMPRESSIONS = ('none', 'gzip')
+
+
+def text_store_paths(output_dir: Path) -> List[Path]:
+    output_dir = Path(output_dir)
+    return [output_dir / TEXTS_FILE, output_dir / INDEX_FILE, output_dir / HEADER_FILE]
+
+
+def temp_path(path: Path) -> Path:
+    """Fichier d'écriture à côté de `path`, substitué ensuite par os.replace"""
+    return path.with_name(path.name + '.tmp')
+
+
+def write_texts(output_dir: Path, texts: Sequence[str], compression: str = 'none',
+                block_texts: int = 64) -> Dict:
+    """
+    Écrit les textes (blob + table d'offsets + en-tête).
+    Retourne l'en-tête écrit.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"compression non supportée: {compression} (attendu: {', '.join(COMPRESSIONS)})")
+    texts_path, index_path, header_path = text_store_paths(output_dir)
+
+    encoded = [text.encode('utf-8') for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u8')
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+
+    digest = hashlib.sha256()
+    block_offsets = [0]
+    texts_temp, index_temp = temp_path(texts_path), temp_path(index_path)
+    with open(texts_temp, 'wb') as f:
+        if compression == 'none':
+            for data in encoded:
+                f.write(data)
+                digest.update(data)
+        else:
+            for start in range(0, len(encoded), block_texts):
+                block = gzip.compress(b''.join(encoded[start:start + block_texts]), mtime=0)
+                f.write(block)
+                digest.update(block)
+                block_offsets.append(block_offsets[-1] + len(block))
+
+    table = offsets if compression == 'none' else np.concatenate([offsets, np.asarray(block_offsets, dtype='<u8')])
+    table.tofile(index_temp)
+
+    os.replace(texts_temp, texts_path)
+    os.replace(index_temp, index_path)
+    return write_header(output_dir, len(encoded), compression, block_texts, digest.hexdigest())
+
+
+def write_header(output_dir: Path, count: int, compression: str = 'none', block_texts: int = 64,
+                 sha256: Optional[str] = None) -> Dict:
+    """
+    Écrit l'en-tête de textes déjà écrits (par write_texts, ou au fil de l'eau
+    par la génération en flux). Sans sha256, texts.bin est relu.
+    """
+    texts_path, index_path, header_path = text_store_paths(output_dir)
+    if sha256 is None:
+        digest = hashlib.sha256()
+        with open(texts_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        sha256 = digest.hexdigest()
+    header = {
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'file': texts_path.name,
+        'index': index_path.name,
+        'count': count,
+        'encoding': 'utf-8',
+        'compression': compression,
+        'block_texts': block_texts if compression != 'none' else None,
+        'sha256': sha256,
+    }
+    header_temp = temp_path(header_path)
+    with open(header_temp, 'w', encoding='utf-8') as f:
+        json.dump(header, f, indent=2)
+    os.replace(header_temp, header_path)
+    return header
+
+
+class TextStore(Sequence):
+    """Textes mappés en lecture seule, décodés à la demande"""
+
+    def __init__(self, output_dir: Path, cache_blocks: int = 16):
+        output_dir = Path(output_dir)
+        with open(output_dir / HEADER_FILE, 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        if header.get('format') != FORMAT_NAME or header.get('version') != FORMAT_VERSION:
+            raise ValueError(f"{output_dir / HEADER_FILE}: format de textes inconnu")
+        self.header = header
+        self.count = header['count']
+        self.compression = header['compression']
+        self.block_texts = header['block_texts']
+
+        table = np.memmap(output_dir / header['index'], dtype='<u8', mode='r')
+        self.offsets = table[:self.count + 1]
+        self.block_offsets = table[self.count + 1:]
+        if self.compression != 'none' and len(self.block_offsets) != -(-self.count // self.block_texts) + 1:
+            raise ValueError(f"{output_dir / header['index']}: table d'offsets incohérente")
+
+        data_path = output_dir / header['file']
+        expected_size = int(self.block_offsets[-1] if self.compression != 'none' else self.offsets[-1])
+        if data_path.stat().st_size != expected_size:
+            raise ValueError(f"{data_path}: {data_path.stat().st_size} octets au lieu de {expected_size}")
+        with open(data_path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if expected_size else b''
+        self._blocks = OrderedDict()
+        self._cache_blocks = cache_blocks
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _block(self, number: int) -> bytes:
+        """Bloc décompressé, avec un petit cache LRU"""
+        block = self._blocks.get(number)
+        if block is None:
+            start, end = int(self.block_offsets[number]), int(self.block_offsets[number + 1])
+            block = gzip.decompress(self._data[start:end])
+            self._blocks[number] = block
+            if len(self._blocks) > self._cache_blocks:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(number)
+        return block
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        if self.compression == 'none':
+            return self._data[start:end].decode('utf-8')
+        number = index // self.block_texts
+        base = int(self.offsets[number * self.block_texts])
+        return self._block(number)[start - base:end - base].decode('utf-8')
+
+    def close(self):
+        """Libère les mappages (avant de réécrire les fichiers, notamment)"""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self.offsets = self.block_offsets = None
+        self._blocks.clear()
@@ -0,0 +1,197 @@
+"""
+Stockage binaire des vecteurs pour l'index d'exécution.
+
+Chaque variante est un fichier brut little-endian (`vectors.<suffixe>.bin`),
+lignes contiguës à partir de l'octet 0, accompagné d'un petit en-tête JSON
+(`vectors.<suffixe>.json`) décrivant forme, dtype, modèle et checksum.
+Le fichier peut être mappé avec numpy.memmap ou enveloppé sans copie dans un
+seul tableau typé (Float32Array côté JS), contrairement à embeddings.npy.gz.
+Les fichiers sont écrits à côté puis substitués par os.replace: un lecteur qui
+les mappe (search_server.py) garde l'ancien inode au lieu d'un SIGBUS.
+
+La variante int8 est quantifiée par dimension: code = round((x - offset) / scale) - 128,
+les tableaux `scale` et `offset` sont stockés dans l'en-tête.
+"""
+import os
+import json
+import hashlib
+import numpy as np
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+FORMAT_NAME = 'twincat-vectors'
+FORMAT_VERSION = 1
+
+# dtype -> (suffixe de fichier, dtype numpy little-endian)
+DTYPES = {
+    'float32': ('f32', '<f4'),
+    'float16': ('f16', '<f2'),
+    'int8': ('i8', '|i1'),
+}
+
+
+def vector_paths(output_dir: Path, dtype: str = 'float32') -> Tuple[Path, Path]:
+    """Retourne (fichier de données, en-tête JSON) pour un dtype"""
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype non supporté: {dtype} (attendu: {', '.join(DTYPES)})")
+    suffix = DTYPES[dtype][0]
+    return output_dir / f'vectors.{suffix}.bin', output_dir / f'vectors.{suffix}.json'
+
+
+def file_sha256(path: Path, block_size: int = 1024 * 1024) -> str:
+    """Hash sha256 d'un fichier, lu par blocs"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def quantize_int8(embeddings: np.ndarray, block_rows: int = 16384) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Quantification scalaire affine par dimension vers int8.
+    Retourne (codes int8, scale float32, offset float32).
+    """
+    low = embeddings.min(axis=0).astype(np.float32)
+    high = embeddings.max(axis=0).astype(np.float32)
+    scale = (high - low) / 255.0
+    scale[scale == 0] = 1.0  # dimension constante
+    offset = low
+
+    codes = np.empty(embeddings.shape, dtype=np.int8)
+    for start in range(0, len(embeddings), block_rows):
+        block = np.asarray(embeddings[start:start + block_rows], dtype=np.float32)
+        codes[start:start + len(block)] = np.clip(np.rint((block - offset) / scale) - 128, -128, 127)
+    return codes, scale.astype(np.float32), offset
+
+
+def dequantize_int8(codes: np.ndarray, scale: np.ndarray, offset: np.ndarray) -> np.ndarray:
+    """Reconstruit des vecteurs float32 approchés à partir des codes int8"""
+    return (codes.astype(np.float32) + 128.0) * scale + offset
+
+
+def int8_params(header: Dict) -> Tuple[np.ndarray, np.ndarray]:
+    """Paramètres (scale, offset) d'une variante int8 depuis son en-tête"""
+    quantization = header['quantization']
+    return (np.asarray(quantization['scale'], dtype=np.float32),
+            np.asarray(quantization['offset'], dtype=np.float32))
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Les k meilleurs scores de chaque ligne, par ordre décroissant.
+    argpartition puis tri des seuls k candidats: O(n + k log k) au lieu d'un tri complet.
+    Retourne (indices, scores) de forme (n_lignes, k).
+    """
+    scores = np.atleast_2d(scores)
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(scores.dtype)
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(k), scores.shape).copy()
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    return (np.take_along_axis(candidates, order, axis=1),
+            np.take_along_axis(candidate_scores, order, axis=1))
+
+
+def write_vectors(output_dir: Path, embeddings: np.ndarray, model: str,
+                  dtype: str = 'float32', normalized: bool = True,
+                  extra: Optional[Dict] = None, block_rows: int = 16384) -> Dict:
+    """
+    Écrit la matrice d'embeddings au format binaire et son en-tête, par blocs
+    de lignes (la matrice peut être un memmap).
+    Retourne l'en-tête écrit.
+    """
+    data_path, _ = vector_paths(output_dir, dtype)
+    quantization = None
+    if dtype == 'int8':
+        data, scale, offset = quantize_int8(embeddings)
+        quantization = {
+            'scheme': 'affine-per-dimension',
+            'scale': scale.tolist(),
+            'offset': offset.tolist(),
+        }
+    else:
+        data = embeddings
+
+    digest = hashlib.sha256()
+    temp_path = data_path.with_name(data_path.name + '.tmp')
+    with open(temp_path, 'wb') as f:
+        for start in range(0, len(data), block_rows):
+            block = np.ascontiguousarray(data[start:start + block_rows], dtype=DTYPES[dtype][1])
+            f.write(memoryview(block).cast('B'))
+            digest.update(memoryview(block).cast('B'))
+    os.replace(temp_path, data_path)
+    return write_header(output_dir, data.shape, model, dtype, normalized, digest.hexdigest(),
+                        quantization=quantization, extra=extra)
+
+
+def write_header(output_dir: Path, shape: Tuple[int, int], model: str, dtype: str = 'float32',
+                 normalized: bool = True, sha256: Optional[str] = None,
+                 quantization: Optional[Dict] = None, extra: Optional[Dict] = None) -> Dict:
+    """
+    Écrit l'en-tête d'un fichier de vecteurs déjà écrit (par write_vectors, ou
+    ligne à ligne par la génération en flux). Sans sha256, le fichier est relu.
+    """
+    data_path, header_path = vector_paths(output_dir, dtype)
+    itemsize = np.dtype(DTYPES[dtype][1]).itemsize
+    header = {
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'file': data_path.name,
+        'dtype': dtype,
+        'byte_order': 'little',
+        'shape': [int(shape[0]), int(shape[1])],
+        'row_bytes': int(shape[1] * itemsize),
+        'model': model,
+        'normalized': normalized,
+        'sha256': sha256 or file_sha256(data_path),
+    }
+    if quantization:
+        header['quantization'] = quantization
+    if extra:
+        header.update(extra)
+
+    temp_path = header_path.with_name(header_path.name + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(header, f, indent=2)
+    os.replace(temp_path, header_path)
+    return header
+
+
+def read_header(output_dir: Path, dtype: str = 'float32') -> Dict:
+    """Lit et valide l'en-tête d'une variante de vecteurs"""
+    _, header_path = vector_paths(output_dir, dtype)
+    with open(header_path, 'r', encoding='utf-8') as f:
+        header = json.load(f)
+    if header.get('format') != FORMAT_NAME or header.get('version') != FORMAT_VERSION:
+        raise ValueError(f"{header_path}: format de vecteurs inconnu")
+    if header.get('dtype') != dtype:
+        raise ValueError(f"{header_path}: dtype {header.get('dtype')} au lieu de {dtype}")
+    return header
+
+
+def open_vectors(output_dir: Path, dtype: str = 'float32',
+                 verify: bool = False) -> Tuple[np.memmap, Dict]:
+    """
+    Ouvre les vecteurs en lecture seule via numpy.memmap (aucune copie).
+    Avec verify=True, le checksum sha256 du fichier est contrôlé.
+    """
+    output_dir = Path(output_dir)
+    header = read_header(output_dir, dtype)
+    data_path = output_dir / header['file']
+    rows, dims = header['shape']
+
+    expected_size = rows * header['row_bytes']
+    actual_size = data_path.stat().st_size
+    if actual_size != expected_size:
+        raise ValueError(f"{data_path}: {actual_size} octets au lieu de {expected_size}")
+    if verify and file_sha256(data_path) != header['sha256']:
+        raise ValueError(f"{data_path}: checksum sha256 invalide")
+
+    vectors = np.memmap(data_path, dtype=DTYPES[dtype][1], mode='r', shape=(rows, dims))
+    return vectors, header
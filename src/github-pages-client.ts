@@ -12,10 +12,13 @@ export class GitHubPagesClient {
   private baseUrl: string;
   private embedder: any = null;
   private cacheManager: CacheManager;
+  private searchServerUrl?: string;
   
-  constructor(githubUser: string, repo: string, cacheDir: string = '.cache') {
+  constructor(githubUser: string, repo: string, cacheDir: string = '.cache', searchServerUrl?: string) {
     this.baseUrl = `https://${githubUser}.github.io/${repo}`;
     this.cacheManager = new CacheManager(cacheDir, this.baseUrl);
+    // Serveur de recherche Python (scripts/search_server.py): index déjà chargé
+    this.searchServerUrl = searchServerUrl?.replace(/\/+$/, '');
   }
   
   private async initializeEmbedder() {
@@ -38,6 +41,15 @@ export class GitHubPagesClient {
   }
   
   async search(query: string, filters: SearchFilters = {}): Promise<SearchResult[]> {
+    if (this.searchServerUrl) {
+      try {
+        return await this.searchViaServer(query, filters);
+      } catch (error) {
+        // Serveur arrêté, page d'erreur d'un proxy...: recherche statique
+        console.error('[MCP] Search server failed, falling back to static search:', error);
+      }
+    }
+    
     try {
       // Ensure cache directory exists
       await this.cacheManager.ensureCacheDirectory();
@@ -101,6 +113,9 @@ export class GitHubPagesClient {
       if (filters.language) {
         filteredResults = filteredResults.filter(r => r.metadata.language === filters.language);
       }
+      if (filters.document_type) {
+        filteredResults = filteredResults.filter(r => r.metadata.document_type === filters.document_type);
+      }
       
       // Retourner les top_k résultats
       return filteredResults.slice(0, filters.top_k || 10);
@@ -111,6 +126,24 @@ export class GitHubPagesClient {
     }
   }
   
+  private async searchViaServer(query: string, filters: SearchFilters): Promise<SearchResult[]> {
+    const response = await fetch(`${this.searchServerUrl}/search`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ query, ...filters, top_k: filters.top_k || 10 })
+    });
+    const contentType = response.headers.get('content-type') ?? '';
+    if (!response.ok || !contentType.includes('application/json')) {
+      const body = await response.text();
+      throw new Error(`Search server error (${response.status}, ${contentType || 'no content type'}): ${body.slice(0, 200)}`);
+    }
+    const payload = await response.json() as { results?: SearchResult[]; error?: string };
+    if (!payload.results) {
+      throw new Error(`Search server error: ${payload.error ?? 'no results'}`);
+    }
+    return payload.results;
+  }
+  
   private async getQueryEmbedding(query: string): Promise<number[]> {
     // Initialize the embedder if not already done
     const embedder = await this.initializeEmbedder();
@@ -30,7 +30,10 @@ async function ensureCacheDirectory() {
   }
 }
 
-const searchClient = new GitHubPagesClient(GITHUB_USER, REPO_NAME, CACHE_DIR);
+// Optional: delegate searches to a running scripts/search_server.py (e.g. http://127.0.0.1:8765)
+const SEARCH_SERVER_URL = process.env.TWINCAT_SEARCH_SERVER || undefined;
+
+const searchClient = new GitHubPagesClient(GITHUB_USER, REPO_NAME, CACHE_DIR, SEARCH_SERVER_URL);
 
 const server = new Server(
   {
@@ -25,5 +25,6 @@ export interface SearchFilters {
   product?: string;
   tags?: string[];
   language?: string;
+  document_type?: string;
   top_k?: number;
 }